@@ -2,20 +2,25 @@
 TMDB API로 수집된 데이터 분석
 """
 
-import sqlite3
+import os
+import sys
 import pandas as pd
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from data_processing.query_cache import QueryCache
+
 def analyze_collected_data():
     """수집된 데이터 분석"""
-    conn = sqlite3.connect('database/netflix_analysis.db')
+    # DB가 바뀌지 않았으면 SQLite를 열지 않고 캐시된 조회 결과 사용
+    cache = QueryCache('database/netflix_analysis.db')
     
     print("=" * 60)
     print("TMDB API를 활용한 넷플릭스 데이터 수집 결과 분석")
     print("=" * 60)
     
     # 1. 기본 정보
-    df = pd.read_sql_query("SELECT * FROM netflix_content", conn)
+    df = cache.read_sql("SELECT * FROM netflix_content")
     
     print(f"\n📊 데이터 수집 결과:")
     print(f"• 총 콘텐츠 수: {len(df):,}개")
@@ -125,8 +130,6 @@ def analyze_collected_data():
     if missing_data.sum() == 0:
         print("  - 결측값 없음 ✅")
     
-    conn.close()
-    
     print(f"\n✅ 데이터 수집 및 분석 완료!")
     print(f"총 {len(df)}개의 실제 넷플릭스 콘텐츠 데이터가 성공적으로 수집되었습니다.")
 
@@ -1,75 +1,160 @@
 """
 넷플릭스 콘텐츠 선호도 분석 프로젝트 메인 실행 파일
-- 데이터 수집 → 전처리 → 분석 → 시각화 → 파워BI 연동
+- 데이터 수집 → 전처리 → 분석 → ETL/내보내기 → 리포트
+- 선택한 단계의 모듈만 import (pandas/plotly 등 무거운 의존성은 필요한 단계에서만 로드)
+- --benchmark-imports: 단계별 모듈 import 시간 측정 및 reports/import_times.csv에 누적 기록
+
+사용 예:
+    python main.py                          # 기본 단계 전체
+    python main.py --stages process,analyze
+    python main.py --benchmark-imports
 """
 
-import sys
+import argparse
+import csv
+import importlib
 import os
-sys.path.append('src')
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(ROOT, 'src')
+sys.path.append(SRC)
+
+DB_PATH = os.path.join(ROOT, 'database', 'netflix_analysis.db')
+IMPORT_TIMES_CSV = os.path.join(ROOT, 'reports', 'import_times.csv')
+
+# 단계 → (모듈, 클래스(없으면 함수), 메서드/함수, 설명)
+# 모든 단계는 --db 경로를 받음 (클래스는 db_path 생성자 인자, 함수는 첫 번째 인자)
+STAGES = {
+    'collect': ('data_collection.api_data_collector', 'APIDataCollector', 'collect_all_data', '데이터 수집'),
+    'process': ('data_processing.data_processor', 'NetflixDataProcessor', 'process_data', '데이터 전처리'),
+    'analyze': ('analysis.preference_analyzer', 'NetflixPreferenceAnalyzer', 'run_analysis', '선호도 분석'),
+    'segment': ('analysis.user_segmentation', 'UserSegmenter', 'run', '사용자 세그먼트 분석'),
+    'neighbors': ('analysis.item_similarity', 'ContentSimilarityIndex', 'run', '콘텐츠 이웃 인덱스'),
+    'overview': ('analysis.text_similarity', 'OverviewSimilarityIndex', 'run', '줄거리 유사도 인덱스'),
+    'etl': ('pipelines.etl', 'ETLPipeline', 'run', 'ETL 및 파워BI용 내보내기'),
+    'report': ('analysis.generate_detailed_report', None, 'main', '상세 리포트 생성'),
+}
+DEFAULT_STAGES = ['collect', 'process', 'analyze', 'etl']
+
+
+def parse_stages(value: str):
+    stages = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"알 수 없는 단계: {', '.join(unknown)} (가능: {', '.join(STAGES)})")
+    return stages
+
+
+def run_stage(name: str, db_path: str):
+    """단계 모듈을 이때 처음 import해서 실행"""
+    module_name, class_name, method, _ = STAGES[name]
+    module = importlib.import_module(module_name)
+    if class_name is None:
+        return getattr(module, method)(db_path)
+    return getattr(getattr(module, class_name)(db_path=db_path), method)()
+
+
+def measure_import(module_name: str) -> float:
+    """새 인터프리터에서 -X importtime으로 모듈의 누적 import 시간(ms) 측정"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            capture_output=True, text=True, env=env, cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    pattern = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| ' + re.escape(module_name) + r'$')
+    for line in result.stderr.splitlines():
+        match = pattern.match(line)
+        if match:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"{module_name}의 import 시간을 찾지 못했습니다")
+
+
+def benchmark_imports(stages, repeat: int = 3, output: str = IMPORT_TIMES_CSV):
+    """단계별 import 시간(반복 중 최솟값)을 측정해 CSV에 누적 기록"""
+    measured_at = datetime.now().isoformat(timespec='seconds')
+    modules = ['main'] + [STAGES[s][0] for s in stages]
+    rows = []
+    for module_name in modules:
+        try:
+            ms = min(measure_import(module_name) for _ in range(repeat))
+        except RuntimeError as e:
+            print(f"  {module_name:<40} 실패: {e}")
+            continue
+        rows.append({'measured_at': measured_at, 'module': module_name,
+                     'cumulative_ms': round(ms, 1), 'python': sys.version.split()[0]})
+        print(f"  {module_name:<40} {ms:8.1f} ms")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    new_file = not os.path.exists(output)
+    with open(output, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['measured_at', 'module', 'cumulative_ms', 'python'])
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+    print(f"\n기록: {output}")
+    return rows
 
-from data_collection.netflix_data_collector import NetflixDataCollector
-from data_processing.data_processor import NetflixDataProcessor
-from analysis.preference_analyzer import NetflixPreferenceAnalyzer
-from visualization.powerbi_connector import PowerBIConnector
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='넷플릭스 콘텐츠 선호도 분석 파이프라인')
+    parser.add_argument('--stages', type=parse_stages, default=None,
+                        help=f"쉼표로 구분한 실행 단계 (가능: {', '.join(STAGES)}; 기본: {','.join(DEFAULT_STAGES)})")
+    parser.add_argument('--db', default=DB_PATH, help='SQLite 데이터베이스 경로')
+    parser.add_argument('--benchmark-imports', action='store_true',
+                        help='단계별 모듈 import 시간을 측정해 reports/import_times.csv에 기록')
+    parser.add_argument('--repeat', type=int, default=3, help='import 시간 측정 반복 횟수')
+    args = parser.parse_args(argv)
+
+    if args.benchmark_imports:
+        print("단계별 import 시간 (누적, 최솟값)")
+        benchmark_imports(args.stages or list(STAGES), repeat=args.repeat)
+        return
+    stages = args.stages or DEFAULT_STAGES
+
     print("=" * 60)
     print("넷플릭스 콘텐츠 선호도 분석 프로젝트")
     print("지역/인종/나이대별 선호도 분석")
     print("=" * 60)
-    
+
+    results = {}
     try:
-        # 1. 데이터 수집
-        print("\n1단계: 데이터 수집")
-        print("-" * 30)
-        collector = NetflixDataCollector()
-        collector.collect_data()
-        
-        # 2. 데이터 전처리
-        print("\n2단계: 데이터 전처리")
-        print("-" * 30)
-        processor = NetflixDataProcessor()
-        processor.process_data()
-        
-        # 3. 선호도 분석
-        print("\n3단계: 선호도 분석")
-        print("-" * 30)
-        analyzer = NetflixPreferenceAnalyzer()
-        analysis_results = analyzer.run_analysis()
-        
-        # 4. 파워BI 연동
-        print("\n4단계: 파워BI 대시보드 연동")
-        print("-" * 30)
-        connector = PowerBIConnector()
-        connector.export_all()
-        
-        # 5. 결과 요약
+        for i, name in enumerate(stages, 1):
+            print(f"\n{i}단계: {STAGES[name][3]}")
+            print("-" * 30)
+            start = time.perf_counter()
+            results[name] = run_stage(name, args.db)
+            print(f"({name} 단계 {time.perf_counter() - start:.1f}초)")
+
+        # 결과 요약
         print("\n" + "=" * 60)
         print("프로젝트 완료!")
         print("=" * 60)
         print("\n📊 생성된 파일들:")
-        print("• database/netflix_analysis.db - SQLite 데이터베이스")
-        print("• reports/*.html - 시각화 차트들")
-        print("• reports/powerbi/ - 파워BI용 데이터 및 설정")
-        print("\n📈 주요 인사이트:")
-        for insight in analysis_results['insights']:
-            print(f"• {insight}")
-        
-        print("\n🚀 다음 단계:")
-        print("1. reports/powerbi/ 폴더의 파일들을 파워BI Desktop에서 열기")
-        print("2. powerbi_instructions.md 파일을 참고하여 대시보드 구축")
-        print("3. HTML 차트들을 웹브라우저에서 확인")
-        
+        print(f"• {os.path.relpath(args.db, ROOT)} - SQLite 데이터베이스")
+        if 'analyze' in results:
+            print("• reports/*.html - 시각화 차트들")
+        if 'etl' in results:
+            print("• reports/powerbi/ - 파워BI용 데이터")
+        if 'analyze' in results:
+            print("\n📈 주요 인사이트:")
+            for insight in results['analyze']['insights']:
+                print(f"• {insight}")
+
+        if 'etl' in results:
+            print("\n🚀 다음 단계:")
+            print("1. reports/powerbi/ 폴더의 파일들을 파워BI Desktop에서 열기")
+            print("2. reports/powerbi_dashboard_implementation_guide.md를 참고하여 대시보드 구축")
+            print("3. HTML 차트들을 웹브라우저에서 확인")
+
     except Exception as e:
         print(f"\n❌ 오류 발생: {str(e)}")
         print("프로젝트 실행 중 문제가 발생했습니다.")
 
+
 if __name__ == "__main__":
     main()
-
-
-
-
-
-
-
@@ -0,0 +1,95 @@
+"""
+그룹 평균의 부트스트랩 신뢰구간
+- 그룹 안에서 복원 추출한 표본의 평균 = 그룹의 고유값 분포에서 뽑은 다항분포 횟수의 가중 평균
+  → 행을 직접 다시 뽑지 않고 (그룹 × 고유값) 횟수표(bincount)에서 multinomial로 리샘플
+  → 리샘플 한 번의 비용이 행 수가 아니라 고유값 수에 비례 (평점처럼 값 종류가 적으면 수백만 행도 수 초)
+- 리샘플은 배치 단위로 (배치 × 그룹 × 고유값) 배열을 한 번에 생성
+- 최소 표본 수를 넘는 그룹 중 1위와 2위의 평균 차이 신뢰구간이 0을 포함하지 않으면 유의한 차이로 판단
+  (최소 표본 수를 넘는 그룹이 없으면 평균 1위를 신뢰구간과 함께 보고하고 표본 부족/유의하지 않음으로 표시)
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 한 배치에서 만드는 (리샘플 × 그룹 × 고유값) 원소 수 상한
+BATCH_CELLS = 4_000_000
+
+
+def bootstrap_means(values, groups, n_resamples: int = 2000, alpha: float = 0.05,
+                    seed: int = 0) -> Tuple[pd.DataFrame, np.ndarray]:
+    """그룹별 (n, mean, ci_low, ci_high) 프레임과 리샘플 평균 배열 (리샘플 × 그룹) 반환
+
+    결측 값/그룹은 제외한다. 그룹 순서는 프레임 인덱스와 배열의 열 순서가 같다.
+    리샘플할 값이 없으면 빈 프레임(또는 NaN 신뢰구간)을 반환한다.
+    """
+    values = pd.Series(values).to_numpy(dtype=np.float64)
+    groups = pd.Series(groups)
+    if isinstance(groups.dtype, pd.CategoricalDtype):
+        group_codes, labels = groups.cat.codes.to_numpy(), groups.cat.categories
+    else:
+        group_codes, labels = pd.factorize(groups.to_numpy())
+    valid = (group_codes >= 0) & ~np.isnan(values)
+    value_codes, uniques = pd.factorize(values[valid])
+    n_groups, n_values = len(labels), len(uniques)
+
+    # (그룹 × 고유값) 횟수표
+    counts = np.bincount(group_codes[valid].astype(np.int64) * n_values + value_codes,
+                         minlength=n_groups * n_values).reshape(n_groups, n_values)
+    n = counts.sum(axis=1)
+    present = n > 0
+    counts, n, labels = counts[present], n[present], labels[present]
+    uniques = np.asarray(uniques, dtype=np.float64)
+
+    samples = np.empty((max(n_resamples, 0), len(n)))
+    if len(n) and n_resamples > 0:
+        rng = np.random.default_rng(seed)
+        probs = counts / n[:, None]
+        batch = max(1, BATCH_CELLS // max(counts.size, 1))
+        for start in range(0, n_resamples, batch):
+            size = min(batch, n_resamples - start)
+            draws = rng.multinomial(n, probs, size=(size, len(n)))
+            samples[start:start + size] = draws @ uniques / n
+        low, high = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+    else:
+        low = high = np.full(len(n), np.nan)
+    stats = pd.DataFrame({'n': n, 'mean': counts @ uniques / n, 'ci_low': low, 'ci_high': high},
+                         index=pd.Index(labels, name=groups.name))
+    return stats, samples
+
+
+def compare_top(stats: pd.DataFrame, samples: np.ndarray, alpha: float = 0.05, min_count: int = 1) -> Dict:
+    """평균 1위 그룹을 2위와 비교 (차이의 부트스트랩 신뢰구간, 1위 확률)
+
+    n < min_count인 그룹은 순위 후보에서 제외한다 (표본 몇 개짜리 부트스트랩은 구간이 과하게 좁음).
+    모든 그룹이 n < min_count이면 전체 그룹 중 1위를 보고하고 insufficient=True, significant=False로 표시한다.
+    그룹이 하나도 없으면 top=None인 결과를 반환한다 (예외를 던지지 않음).
+    """
+    no_comparison = {'runner_up': None, 'diff': np.nan, 'diff_low': np.nan, 'diff_high': np.nan,
+                     'significant': False}
+    if stats.empty:
+        return {'top': None, 'mean': np.nan, 'ci_low': np.nan, 'ci_high': np.nan, 'n': 0, 'excluded': 0,
+                'p_top': np.nan, 'insufficient': True, **no_comparison}
+    eligible = np.flatnonzero(stats['n'].to_numpy() >= min_count)
+    insufficient = len(eligible) == 0
+    if insufficient:
+        eligible = np.arange(len(stats))
+    means = stats['mean'].to_numpy()[eligible]
+    order = eligible[np.argsort(-means, kind='stable')]
+    top = int(order[0])
+    result = {'top': stats.index[top], 'mean': stats['mean'].iat[top],
+              'ci_low': stats['ci_low'].iat[top], 'ci_high': stats['ci_high'].iat[top],
+              'n': int(stats['n'].iat[top]), 'excluded': len(stats) - len(eligible),
+              # 리샘플 중 1위 그룹이 후보 중 실제로 가장 높았던 비율
+              'p_top': (float((eligible[samples[:, eligible].argmax(axis=1)] == top).mean())
+                        if len(samples) else np.nan),
+              'insufficient': insufficient}
+    if insufficient or len(order) < 2 or not len(samples):
+        return {**result, **no_comparison}
+    second = int(order[1])
+    diff = samples[:, top] - samples[:, second]
+    diff_low, diff_high = np.quantile(diff, [alpha / 2, 1 - alpha / 2])
+    return {**result, 'runner_up': stats.index[second],
+            'diff': stats['mean'].iat[top] - stats['mean'].iat[second],
+            'diff_low': diff_low, 'diff_high': diff_high, 'significant': bool(diff_low > 0)}
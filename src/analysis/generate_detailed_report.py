@@ -1,16 +1,69 @@
 """
 Generate a detailed analysis report with both code and computed results.
 Inputs: Gold views created by src/pipelines/etl.py
-Output: reports/detailed_analysis_report.md
+Output: reports/detailed_analysis_report.md (+ .html and .json with the same sections)
+Query results are served from the on-disk query cache while the database is unchanged.
+
+- Each section is fingerprinted from its inputs before any query runs: the SQL, the schema of
+  the tables/views it reads and a (row count, max rowid) token per source table
+  (source tables are found by compiling the SQL with EXPLAIN under an authorizer)
+- Sections whose fingerprint matches the previous run reuse their rendered markdown/HTML from
+  the section state file without querying; the rest run concurrently, each on its own
+  read-only connection
+- Outputs are written atomically (temp file + rename) and only when their content changed
 """
 
+import hashlib
+import html
+import json
 import os
 import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
 import pandas as pd
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_processing.query_cache import QueryCache, normalize_sql
+
 ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DB_PATH = os.path.join(ROOT, 'database', 'netflix_analysis.db')
 REPORT_PATH = os.path.join(ROOT, 'reports', 'detailed_analysis_report.md')
+HTML_PATH = os.path.join(ROOT, 'reports', 'detailed_analysis_report.html')
+JSON_PATH = os.path.join(ROOT, 'reports', 'detailed_analysis_report.json')
+# Rendered sections of the previous run, keyed by section id
+STATE_PATH = os.path.join(ROOT, 'reports', '.detailed_analysis_report.sections.json')
+
+# (section id, title, SQL, rows shown)
+SECTIONS = [
+    ('kpi_overview', 'KPI 개요', "SELECT * FROM vw_kpi_overview", 20),
+    ('yearly_stats', '연도별 통계', "SELECT * FROM vw_yearly_stats ORDER BY release_year", 30),
+    ('genre_stats', '장르 통계', "SELECT * FROM vw_genre_stats ORDER BY n DESC", 30),
+    ('language_stats', '언어 통계', "SELECT * FROM vw_language_stats ORDER BY n DESC", 20),
+    ('top_titles', '상위 타이틀',
+     "SELECT title, type, tmdb_score, popularity, vote_count, release_year FROM vw_top_titles LIMIT 30", 30),
+    ('movie_finance', '영화 재무 요약(ROI)', "SELECT title, budget, revenue, roi FROM vw_movie_finance LIMIT 30", 30),
+]
+
+HEADER = "### 상세 분석 리포트 (SQL 코드와 결과 포함)\n\n"
+INTRO = (
+    "본 리포트는 Gold 뷰를 기반으로 주요 지표, 연도/장르/언어 통계, 상위 타이틀, 영화 재무 요약을 제공합니다.\n"
+    "각 섹션에는 실행된 SQL과 결과 테이블이 포함됩니다.\n\n"
+)
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="ko">
+<head>
+<meta charset="utf-8">
+<title>상세 분석 리포트</title>
+</head>
+<body>
+<h2>상세 분석 리포트 (SQL 코드와 결과 포함)</h2>
+<p>{intro}</p>
+{sections}
+</body>
+</html>
+"""
 
 
 def to_table(df: pd.DataFrame, max_rows: int = 20) -> str:
@@ -19,64 +72,156 @@ def to_table(df: pd.DataFrame, max_rows: int = 20) -> str:
     return df.head(max_rows).to_markdown(index=False)
 
 
-def main():
-    conn = sqlite3.connect(DB_PATH)
-
-    sections = []
-
-    # 1) KPI overview
-    q1 = "SELECT * FROM vw_kpi_overview"
-    df1 = pd.read_sql_query(q1, conn)
-    sections.append("### KPI 개요\n\n" + "```sql\n" + q1 + "\n```\n\n" + to_table(df1))
-
-    # 2) Yearly stats
-    q2 = "SELECT * FROM vw_yearly_stats ORDER BY release_year"
-    df2 = pd.read_sql_query(q2, conn)
-    sections.append("### 연도별 통계\n\n" + "```sql\n" + q2 + "\n```\n\n" + to_table(df2, 30))
-
-    # 3) Genre stats
-    q3 = "SELECT * FROM vw_genre_stats ORDER BY n DESC"
-    df3 = pd.read_sql_query(q3, conn)
-    sections.append("### 장르 통계\n\n" + "```sql\n" + q3 + "\n```\n\n" + to_table(df3, 30))
-
-    # 4) Language stats
-    q4 = "SELECT * FROM vw_language_stats ORDER BY n DESC"
-    df4 = pd.read_sql_query(q4, conn)
-    sections.append("### 언어 통계\n\n" + "```sql\n" + q4 + "\n```\n\n" + to_table(df4, 20))
-
-    # 5) Top titles
-    q5 = "SELECT title, type, tmdb_score, popularity, vote_count, release_year FROM vw_top_titles LIMIT 30"
-    df5 = pd.read_sql_query(q5, conn)
-    sections.append("### 상위 타이틀\n\n" + "```sql\n" + q5 + "\n```\n\n" + to_table(df5, 30))
-
-    # 6) Movie finance
-    q6 = "SELECT title, budget, revenue, roi FROM vw_movie_finance LIMIT 30"
-    df6 = pd.read_sql_query(q6, conn)
-    sections.append("### 영화 재무 요약(ROI)\n\n" + "```sql\n" + q6 + "\n```\n\n" + to_table(df6, 30))
-
-    conn.close()
-
-    header = "### 상세 분석 리포트 (SQL 코드와 결과 포함)\n\n"
-    intro = (
-        "본 리포트는 Gold 뷰를 기반으로 주요 지표, 연도/장르/언어 통계, 상위 타이틀, 영화 재무 요약을 제공합니다.\n"
-        "각 섹션에는 실행된 SQL과 결과 테이블이 포함됩니다.\n\n"
-    )
-
-    with open(REPORT_PATH, 'w', encoding='utf-8') as f:
-        f.write(header)
-        f.write(intro)
-        f.write("\n\n".join(sections))
-
-    print(f"Report written to {REPORT_PATH}")
+def to_html_table(df: pd.DataFrame, max_rows: int = 20) -> str:
+    if df is None or df.empty:
+        return "<p>(no rows)</p>"
+    return df.head(max_rows).to_html(index=False, border=0)
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+
+
+def run_query(sql: str, db_path: str, cache: QueryCache = None) -> pd.DataFrame:
+    """Run one section query on a fresh read-only connection (or return the cached result)"""
+    def compute():
+        conn = connect_read_only(db_path)
+        try:
+            return pd.read_sql_query(sql, conn)
+        finally:
+            conn.close()
+    return cache.cached(sql, compute) if cache is not None else compute()
+
+
+def source_objects(conn: sqlite3.Connection, sql: str) -> set:
+    """Names of the tables and views the statement reads (compiled with EXPLAIN, not run)"""
+    names = set()
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        if action == sqlite3.SQLITE_READ:
+            names.update(n for n in (arg1, source) if n)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return names
+
+
+def table_token(conn: sqlite3.Connection, table: str) -> list:
+    """(row count, max rowid) — changes whenever rows are added, removed or reloaded.
+
+    The ETL rebuilds the report tables with DELETE + INSERT under new AUTOINCREMENT title ids,
+    so every rebuild moves max rowid; an in-place UPDATE that keeps both values is not detected.
+    """
+    try:
+        return list(conn.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{table}"').fetchone())
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID table
+        return [conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0], None]
+
+
+def fingerprint(conn: sqlite3.Connection, sql: str) -> str:
+    """Hash of the section inputs: SQL, schema of the objects it reads and their table tokens"""
+    try:
+        names = source_objects(conn, sql)
+    except sqlite3.Error:
+        # e.g. a missing view: fingerprint the SQL alone, the query reports the error
+        names = set()
+    schema = {name: (kind, ddl) for name, kind, ddl in conn.execute(
+        "SELECT name, type, sql FROM sqlite_master WHERE type IN ('table', 'view')") if name in names}
+    tokens = {name: table_token(conn, name) for name, (kind, _) in sorted(schema.items()) if kind == 'table'}
+    payload = json.dumps([normalize_sql(sql), sorted(schema.items()), tokens], default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_section(title: str, sql: str, df: pd.DataFrame, max_rows: int) -> dict:
+    return {
+        'markdown': f"### {title}\n\n```sql\n{sql}\n```\n\n{to_table(df, max_rows)}",
+        'html': (f"<h3>{html.escape(title)}</h3>\n<pre><code>{html.escape(sql)}</code></pre>\n"
+                 f"{to_html_table(df, max_rows)}"),
+        'rows': json.loads(df.head(max_rows).to_json(orient='records', force_ascii=False)),
+        'columns': list(map(str, df.columns)),
+    }
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_atomic(path: str, text: str) -> bool:
+    """Replace path with text via a temp file; skip the write when nothing changed"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+
+def build_sections(db_path: str = DB_PATH, state: dict = None, cache: QueryCache = None):
+    """Fingerprint every section's inputs, then query and render only the ones that changed.
+
+    Returns (sections in SECTIONS order, number of sections reused from state).
+    """
+    state = state or {}
+    conn = connect_read_only(db_path)
+    try:
+        fingerprints = [fingerprint(conn, sql) for _, _, sql, _ in SECTIONS]
+    finally:
+        conn.close()
+    stale = [(section, fp) for section, fp in zip(SECTIONS, fingerprints)
+             if (state.get(section[0]) or {}).get('fingerprint') != fp]
+
+    rendered = {}
+    if stale:
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            frames = list(pool.map(lambda item: run_query(item[0][2], db_path, cache), stale))
+        for ((key, title, sql, max_rows), fp), df in zip(stale, frames):
+            rendered[key] = {'fingerprint': fp, **render_section(title, sql, df, max_rows)}
+
+    sections = [{'id': key, 'title': title, 'sql': sql, **rendered.get(key, state.get(key, {}))}
+                for key, title, sql, _ in SECTIONS]
+    return sections, len(SECTIONS) - len(stale)
+
+
+def main(db_path: str = DB_PATH, use_cache: bool = True):
+    cache = QueryCache(db_path) if use_cache else None
+    sections, reused = build_sections(db_path, load_state(STATE_PATH), cache)
+
+    markdown = HEADER + INTRO + "\n\n".join(s['markdown'] for s in sections)
+    html_doc = HTML_TEMPLATE.format(intro=html.escape(INTRO.strip()).replace('\n', '<br>\n'),
+                                    sections='\n'.join(s['html'] for s in sections))
+    data = {'sections': [{k: s[k] for k in ('id', 'title', 'sql', 'fingerprint', 'columns', 'rows')}
+                         for s in sections]}
+
+    written = [path for path, text in (
+        (REPORT_PATH, markdown),
+        (HTML_PATH, html_doc),
+        (JSON_PATH, json.dumps(data, ensure_ascii=False, indent=2)),
+    ) if write_atomic(path, text)]
+    write_atomic(STATE_PATH, json.dumps({s['id']: s for s in sections}, ensure_ascii=False))
+
+    if cache is not None:
+        print(cache.report())
+    print(f"Sections re-rendered: {len(sections) - reused}/{len(sections)}")
+    if written:
+        print("Report written to " + ", ".join(written))
+    else:
+        print(f"Report unchanged: {REPORT_PATH}")
 
 
 if __name__ == '__main__':
     main()
-
-
-
-
-
-
-
-
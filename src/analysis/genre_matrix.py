@@ -0,0 +1,159 @@
+"""
+장르 희소 행렬 유틸리티
+- 콘텐츠 × 장르 행렬 (genre 문자열 'A, B, C'를 분해, 행 합이 1이 되도록 가중치 분배)
+- 사용자 × 장르 선호 행렬 (processed_preferences를 청크로 읽어 희소 누적, 원본 행 전체를 메모리에 올리지 않음)
+  가중치 = rating / 5 × completion_rate
+- 세그먼트 × 개별 장르 평균 (원-핫 행렬 곱으로 모든 세그먼트 컬럼을 한 번에)
+"""
+
+import sqlite3
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+GENRE_SEPARATOR = ', '
+
+# 청크 조각(COO)을 이만큼 모으면 CSR로 합쳐 중복 (사용자, 장르)를 정리
+COMPACT_ENTRIES = 5_000_000
+
+
+def split_genres(genre: pd.Series) -> pd.Series:
+    """'Romance, Comedy' → ['Romance', 'Comedy'] (결측은 'Unknown')"""
+    return genre.fillna('Unknown').astype(str).str.split(GENRE_SEPARATOR)
+
+
+def genre_one_hot(content: pd.DataFrame) -> Tuple[pd.Index, List[str], sparse.csr_matrix]:
+    """content_id/genre 프레임 → (content_id 인덱스, 장르 목록, 콘텐츠 × 개별 장르 원-핫 CSR)"""
+    content = content[['content_id', 'genre']].dropna(subset=['content_id']).drop_duplicates('content_id')
+    exploded = content.assign(genre=split_genres(content['genre'])).explode('genre')
+    exploded['genre'] = exploded['genre'].str.strip()
+    exploded = exploded[exploded['genre'] != ''].drop_duplicates()
+
+    content_index = pd.Index(content['content_id'].to_numpy())
+    genre_codes, genres = pd.factorize(exploded['genre'], sort=True)
+    rows = content_index.get_indexer(exploded['content_id'])
+    matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, genre_codes)), shape=(len(content_index), len(genres)))
+    return content_index, list(genres), matrix
+
+
+def content_genre_matrix(conn: sqlite3.Connection, table: str = 'processed_content'
+                         ) -> Tuple[pd.Index, List[str], sparse.csr_matrix]:
+    """(content_id 인덱스, 장르 목록, 콘텐츠 × 장르 CSR) 반환 (각 행의 합은 1)"""
+    content = pd.read_sql_query(f"SELECT DISTINCT content_id, genre FROM {table} WHERE content_id IS NOT NULL", conn)
+    content_index, genres, one_hot = genre_one_hot(content)
+    per_content = np.asarray(one_hot.sum(axis=1)).ravel()
+    per_content[per_content == 0] = 1.0
+    return content_index, genres, (sparse.diags(1.0 / per_content) @ one_hot).tocsr()
+
+
+def user_genre_matrix(conn: sqlite3.Connection, content_index: pd.Index, content_genres: sparse.csr_matrix,
+                      table: str = 'processed_preferences', chunksize: int = 200_000,
+                      n_users: Optional[int] = None) -> sparse.csr_matrix:
+    """사용자 × 장르 선호 CSR (행 = 정수 user_id, 청크 단위 누적)
+
+    user_id는 dim_user 정수 키라고 가정한다 (processed_preferences 형식).
+    """
+    if n_users is None:
+        n_users = (conn.execute(f"SELECT MAX(user_id) FROM {table}").fetchone()[0] or 0) + 1
+    n_genres = content_genres.shape[1]
+    matrix = sparse.csr_matrix((n_users, n_genres), dtype=np.float64)
+    pieces, pending = [], 0
+
+    def compact(matrix, pieces):
+        rows, cols, data = (np.concatenate(p) for p in zip(*pieces))
+        return matrix + sparse.csr_matrix((data, (rows, cols)), shape=matrix.shape)
+
+    query = f"SELECT user_id, content_id, rating, completion_rate FROM {table}"
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        content_rows = content_index.get_indexer(chunk['content_id'])
+        known = content_rows >= 0
+        users = chunk['user_id'].to_numpy(dtype=np.int64)[known]
+        weights = (chunk['rating'].to_numpy(dtype=np.float64) / 5.0
+                   * chunk['completion_rate'].to_numpy(dtype=np.float64))[known]
+        # 청크 안의 사용자만 지역 인덱스로 (사용자 × 콘텐츠) → × (콘텐츠 × 장르)
+        local, chunk_users = pd.factorize(users)
+        views = sparse.csr_matrix((weights, (local, content_rows[known])),
+                                  shape=(len(chunk_users), content_genres.shape[0]))
+        affinity = (views @ content_genres).tocoo()
+        pieces.append((chunk_users[affinity.row], affinity.col, affinity.data))
+        pending += affinity.nnz
+        if pending >= COMPACT_ENTRIES:
+            matrix, pieces, pending = compact(matrix, pieces), [], 0
+    if pieces:
+        matrix = compact(matrix, pieces)
+    return matrix
+
+
+def segment_genre_affinity(preferences: pd.DataFrame, content_index: pd.Index, genres: List[str],
+                           one_hot: sparse.csr_matrix, segment_columns: Sequence[str],
+                           metrics: Sequence[str] = ('rating', 'completion_rate')) -> pd.DataFrame:
+    """모든 (세그먼트 컬럼 값 × 개별 장르)의 행 수와 지표 평균을 희소 행렬 곱 몇 번으로 계산
+
+    S: (모든 컬럼의 세그먼트 값) × 선호도 행 지시 행렬, PG: 선호도 행 × 장르 (= 행 → 콘텐츠 × 원-핫)
+    n = S @ PG, 합 = S @ diag(x) @ PG. 여러 장르를 가진 콘텐츠의 행은 각 장르에 모두 포함된다.
+    반환 컬럼: dimension, segment, genre, n, {m}_mean
+    """
+    content_rows = content_index.get_indexer(preferences['content_id'])
+    known = content_rows >= 0
+    n_rows = int(known.sum())
+    pg = sparse.csr_matrix((np.ones(n_rows), (np.arange(n_rows), content_rows[known])),
+                           shape=(n_rows, len(content_index))) @ one_hot
+
+    # 세그먼트 컬럼들을 하나의 지시 행렬로 (컬럼마다 코드를 이어 붙임)
+    seg_rows, seg_cols, labels, offset = [], [], [], 0
+    for column in segment_columns:
+        values = preferences[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # category 컬럼은 코드를 그대로 사용 (객체 배열 변환 없이)
+            codes, uniques = values.cat.codes.to_numpy()[known], values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values.to_numpy()[known])
+        present = codes >= 0
+        seg_rows.append(codes[present] + offset)
+        seg_cols.append(np.flatnonzero(present))
+        labels.extend((column, u) for u in uniques)
+        offset += len(uniques)
+    segments = sparse.csr_matrix((np.ones(sum(len(r) for r in seg_rows)),
+                                  (np.concatenate(seg_rows), np.concatenate(seg_cols))),
+                                 shape=(offset, n_rows))
+
+    counts = (segments @ pg).toarray()
+    out = {'n': counts}
+    for m in metrics:
+        x = preferences[m].to_numpy(dtype=np.float64)[known]
+        valid = ~np.isnan(x)
+        sums = (segments @ pg.multiply(np.where(valid, x, 0.0)[:, None]).tocsr()).toarray()
+        denom = counts if valid.all() else (segments @ pg.multiply(valid[:, None]).tocsr()).toarray()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[f'{m}_mean'] = sums / denom
+
+    seg_idx, genre_idx = np.nonzero(counts)
+    result = pd.DataFrame({
+        'dimension': [labels[i][0] for i in seg_idx],
+        'segment': [labels[i][1] for i in seg_idx],
+        'genre': np.asarray(genres, dtype=object)[genre_idx],
+        'n': counts[seg_idx, genre_idx].astype(np.int64),
+    })
+    for m in metrics:
+        result[f'{m}_mean'] = out[f'{m}_mean'][seg_idx, genre_idx]
+    return result
+
+
+def genre_content_stats(content: pd.DataFrame, columns: Sequence[str], sum_columns: Sequence[str] = ()) -> pd.DataFrame:
+    """콘텐츠 지표를 개별 장르별로 집계 (평균은 결측 제외, sum_columns는 합계), 인덱스 = genre"""
+    content_index, genres, one_hot = genre_one_hot(content)
+    frame = content.drop_duplicates('content_id').set_index('content_id').reindex(content_index)
+    by_genre = one_hot.T.tocsr()
+    stats = {}
+    for column in list(columns) + list(sum_columns):
+        x = frame[column].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(x)
+        total = by_genre @ np.where(valid, x, 0.0)
+        if column in sum_columns:
+            stats[column] = total
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats[column] = total / (by_genre @ valid.astype(np.float64))
+    return pd.DataFrame(stats, index=pd.Index(genres, name='genre'))
@@ -0,0 +1,285 @@
+"""
+콘텐츠 간 유사도 인덱스 ("이 콘텐츠를 좋아한 시청자가 좋아한 콘텐츠")
+- processed_preferences 평점으로 사용자 × 콘텐츠 희소 행렬 (같은 사용자/콘텐츠 중복 평점은 평균)
+- 콘텐츠 열을 L2 정규화한 뒤 희소 곱으로 코사인 유사도, 공동 평가자 수(co_count)도 함께 계산
+- 콘텐츠별 상위 k개 이웃은 전체 정렬 대신 argpartition으로 선택해 content_neighbors에 저장
+  (content_id, rank, ...) 커버링 인덱스로 조회
+- 증분 갱신: 워터마크(id) 이후 새 평점이 있는 콘텐츠의 행만 다시 계산하고,
+  그 콘텐츠와 공동 평가된 콘텐츠는 기존 목록과 병합 (병합만으로 정확하지 않으면 해당 행도 재계산)
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_processing.bulk_writer import bulk_write_tables, ensure_indexes
+from data_processing.incremental import get_watermark, records, set_watermark
+
+NEIGHBORS_TABLE = 'content_neighbors'
+NEIGHBOR_COLUMNS = ['content_id', 'rank', 'neighbor_id', 'similarity', 'co_count']
+# 조회가 인덱스만 읽도록 (content_id, rank) 뒤에 나머지 컬럼을 붙인 커버링 인덱스
+NEIGHBOR_INDEXES = {NEIGHBORS_TABLE: [NEIGHBOR_COLUMNS]}
+WATERMARK_SOURCE = NEIGHBORS_TABLE
+
+
+def rating_matrix(conn: sqlite3.Connection, table: str = 'processed_preferences',
+                  chunksize: int = 200_000) -> Tuple[pd.Index, sparse.csr_matrix]:
+    """(content_id 인덱스, 콘텐츠 × 사용자 평점 CSR), 청크로 읽어 COO 조각을 한 번에 합침"""
+    content_index = pd.Index(sorted(r[0] for r in conn.execute(
+        f"SELECT DISTINCT content_id FROM {table} WHERE content_id IS NOT NULL")))
+    n_users = (conn.execute(f"SELECT MAX(user_id) FROM {table}").fetchone()[0] or 0) + 1
+    rows, cols, ratings = [], [], []
+    query = f"SELECT user_id, content_id, rating FROM {table} WHERE content_id IS NOT NULL"
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        rows.append(content_index.get_indexer(chunk['content_id']))
+        cols.append(chunk['user_id'].to_numpy(dtype=np.int64))
+        ratings.append(chunk['rating'].to_numpy(dtype=np.float64))
+    if not rows:
+        return content_index, sparse.csr_matrix((0, n_users))
+    rows, cols, ratings = np.concatenate(rows), np.concatenate(cols), np.concatenate(ratings)
+    shape = (len(content_index), n_users)
+    sums = sparse.csr_matrix((ratings, (rows, cols)), shape=shape)
+    counts = sparse.csr_matrix((np.ones_like(ratings), (rows, cols)), shape=shape)
+    sums.sum_duplicates()
+    counts.sum_duplicates()
+    sums.data /= counts.data
+    return content_index, sums
+
+
+def top_k(cols: np.ndarray, sims: np.ndarray, k: int) -> np.ndarray:
+    """유사도 내림차순(동률은 id 오름차순) 상위 k개 위치, 전체 정렬 없이 argpartition 사용"""
+    if len(sims) > k:
+        pick = np.argpartition(-sims, k - 1)[:k]
+    else:
+        pick = np.arange(len(sims))
+    return pick[np.lexsort((cols[pick], -sims[pick]))]
+
+
+def neighbor_frame(parts: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]) -> pd.DataFrame:
+    """(content_id, 이웃 id, 유사도, 공동 평가자 수) 조각들 → content_neighbors 행 (순서대로 rank 부여)"""
+    if not parts:
+        return pd.DataFrame({c: pd.Series(dtype='float64' if c == 'similarity' else 'int64') for c in NEIGHBOR_COLUMNS})
+    sizes = np.array([len(p[1]) for p in parts])
+    return pd.DataFrame({
+        'content_id': np.repeat([p[0] for p in parts], sizes).astype(np.int64),
+        'rank': np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes) + 1,
+        'neighbor_id': np.concatenate([p[1] for p in parts]).astype(np.int64),
+        'similarity': np.concatenate([p[2] for p in parts]).astype(np.float64),
+        'co_count': np.concatenate([p[3] for p in parts]).astype(np.int64),
+    })
+
+
+class ContentSimilarityIndex:
+    def __init__(self, db_path="../../database/netflix_analysis.db", k: int = 20, min_support: int = 2,
+                 block_size: int = 1_000, verbose: bool = True):
+        self.db_path = db_path
+        self.k = k
+        self.min_support = min_support
+        self.block_size = block_size
+        self.verbose = verbose
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _prepare(self, conn: sqlite3.Connection):
+        """콘텐츠 인덱스, L2 정규화 행렬, 이진(공동 평가자 수용) 행렬"""
+        content_index, ratings = rating_matrix(conn)
+        norms = np.sqrt(ratings.multiply(ratings).sum(axis=1)).A1
+        norms[norms == 0] = 1.0
+        normalized = sparse.diags(1.0 / norms) @ ratings
+        binary = ratings.copy()
+        binary.data[:] = 1.0
+        return content_index, normalized.tocsr(), binary.tocsr()
+
+    def _similarity_rows(self, rows: np.ndarray, normalized, binary):
+        """rows 콘텐츠와 모든 콘텐츠의 (코사인, 공동 평가자 수), 두 행렬의 희소 구조는 같음"""
+        sims = (normalized[rows] @ normalized.T).tocsr()
+        counts = (binary[rows] @ binary.T).tocsr()
+        sims.sort_indices()
+        counts.sort_indices()
+        return sims, counts
+
+    def _neighbor_rows(self, rows: Iterable[int], content_index: pd.Index, normalized, binary) -> pd.DataFrame:
+        """콘텐츠 행 번호들의 상위 k 이웃 (block_size 단위로 계산해 유사도 행렬 크기를 제한)"""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        ids = content_index.to_numpy()
+        parts = []
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            sims, counts = self._similarity_rows(block, normalized, binary)
+            for i, row in enumerate(block):
+                lo, hi = sims.indptr[i], sims.indptr[i + 1]
+                cols, values, co = sims.indices[lo:hi], sims.data[lo:hi], counts.data[lo:hi]
+                keep = (cols != row) & (co >= self.min_support)
+                cols, values, co = cols[keep], values[keep], co[keep]
+                pick = top_k(cols, values, self.k)
+                parts.append((ids[row], ids[cols[pick]], values[pick], co[pick]))
+        return neighbor_frame(parts)
+
+    def build(self) -> int:
+        """전체 재구성 (shadow 테이블 적재 후 교체), 콘텐츠 수 반환"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            content_index, normalized, binary = self._prepare(conn)
+            watermark = conn.execute("SELECT MAX(id) FROM processed_preferences").fetchone()[0]
+        finally:
+            conn.close()
+        neighbors = self._neighbor_rows(range(len(content_index)), content_index, normalized, binary)
+        bulk_write_tables(self.db_path, {NEIGHBORS_TABLE: neighbors}, NEIGHBOR_INDEXES, verbose=self.verbose)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            set_watermark(conn, WATERMARK_SOURCE, 'id', watermark)
+            conn.commit()
+        finally:
+            conn.close()
+        if self.verbose:
+            print(f"콘텐츠 {len(content_index):,}개 이웃 인덱스 구성: {len(neighbors):,}행 "
+                  f"({time.perf_counter() - start:.2f}s)")
+        return len(content_index)
+
+    def _merge_rows(self, affected: np.ndarray, content_index: pd.Index, normalized, binary,
+                    old: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[pd.DataFrame, List[int], List[int]]:
+        """영향받은 콘텐츠와 공동 평가된 콘텐츠의 목록을 병합, (병합된 이웃 행, 병합한 content_id, 재계산이 필요한 행) 반환
+
+        영향받지 않은 콘텐츠끼리의 유사도는 변하지 않으므로 기존 목록에서 영향받은 이웃만 빼고
+        새 유사도를 합친다. 기존 목록이 k개로 잘려 있었다면 저장되지 않은 이웃은 기존 k번째 값 이하이므로,
+        병합 결과의 k번째가 그 값 이상일 때만 정확하다. 아니면 행 전체를 다시 계산한다.
+        """
+        ids = content_index.to_numpy()
+        affected_ids = ids[affected]
+        sims, counts = self._similarity_rows(affected, normalized, binary)
+        # 전치: 행 = 다른 콘텐츠 B, 열 = 영향받은 콘텐츠 A
+        sims_t, counts_t = sims.T.tocsr(), counts.T.tocsr()
+        sims_t.sort_indices()
+        counts_t.sort_indices()
+        affected_set = set(affected.tolist())
+        empty = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64))
+
+        parts, merged_ids, recompute = [], [], []
+        for row in np.flatnonzero(np.diff(sims_t.indptr)):
+            if row in affected_set:
+                continue
+            lo, hi = sims_t.indptr[row], sims_t.indptr[row + 1]
+            co = counts_t.data[lo:hi]
+            keep = co >= self.min_support
+            prev_ids, prev_sims, prev_co = old.get(ids[row], empty)
+            stale = np.isin(prev_ids, affected_ids)
+            cand_ids = np.concatenate([prev_ids[~stale], affected_ids[sims_t.indices[lo:hi][keep]]])
+            cand_sims = np.concatenate([prev_sims[~stale], sims_t.data[lo:hi][keep]])
+            cand_co = np.concatenate([prev_co[~stale], co[keep].astype(np.int64)])
+            if len(cand_ids) == 0 and len(prev_ids) == 0:
+                continue
+            pick = top_k(cand_ids, cand_sims, self.k)
+            if len(prev_ids) >= self.k and (len(pick) < self.k or cand_sims[pick[-1]] < prev_sims.min()):
+                recompute.append(row)
+                continue
+            merged_ids.append(int(ids[row]))
+            parts.append((ids[row], cand_ids[pick], cand_sims[pick], cand_co[pick]))
+        return neighbor_frame(parts), merged_ids, recompute
+
+    def update(self) -> int:
+        """워터마크 이후 새 평점이 있는 콘텐츠만 갱신, 다시 쓴 콘텐츠 수 반환 (인덱스가 없으면 전체 구성)"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            watermark = get_watermark(conn, WATERMARK_SOURCE, 'id')
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (NEIGHBORS_TABLE,)).fetchone()
+            if watermark is None or not exists:
+                conn.close()
+                return self.build()
+            # 새 행 구간 조회용 (기존 DB에는 인덱스가 없을 수 있음)
+            ensure_indexes(conn, 'processed_preferences', [['id']])
+            conn.commit()
+            new_max, = conn.execute("SELECT MAX(id) FROM processed_preferences").fetchone()
+            # +content_id: content_id 인덱스 전체 스캔 대신 id 구간 검색을 쓰도록
+            changed = [r[0] for r in conn.execute(
+                "SELECT DISTINCT +content_id FROM processed_preferences WHERE id > ? AND +content_id IS NOT NULL",
+                (watermark,))]
+            if not changed:
+                if self.verbose:
+                    print("새 평점이 없어 이웃 인덱스를 갱신하지 않습니다.")
+                return 0
+
+            content_index, normalized, binary = self._prepare(conn)
+            affected = content_index.get_indexer(changed)
+            old_rows = pd.read_sql_query(
+                f"SELECT content_id, neighbor_id, similarity, co_count FROM {NEIGHBORS_TABLE} ORDER BY content_id, rank",
+                conn)
+            bounds = np.flatnonzero(np.diff(old_rows['content_id'].to_numpy())) + 1
+            old = dict(zip(old_rows['content_id'].to_numpy()[np.r_[0, bounds]] if len(old_rows) else [],
+                           zip(*(np.split(old_rows[c].to_numpy(), bounds)
+                                 for c in ['neighbor_id', 'similarity', 'co_count']))))
+
+            merged, merged_ids, recompute = self._merge_rows(affected, content_index, normalized, binary, old)
+            recomputed = self._neighbor_rows(np.concatenate([affected, recompute]).astype(np.int64),
+                                             content_index, normalized, binary)
+            rows = pd.concat([merged, recomputed], ignore_index=True)
+            # 병합 결과가 빈 콘텐츠도 기존 행은 지워야 하므로 대상은 목록 단위로 모음
+            targets = {int(c) for c in changed}
+            targets.update(int(content_index[r]) for r in recompute)
+            targets.update(merged_ids)
+
+            # 삭제/삽입/워터마크를 한 트랜잭션으로
+            conn.execute("DROP TABLE IF EXISTS temp._neighbor_targets")
+            conn.execute("CREATE TEMP TABLE _neighbor_targets (content_id INTEGER PRIMARY KEY)")
+            conn.executemany("INSERT INTO temp._neighbor_targets VALUES (?)",
+                             [(c,) for c in targets])
+            conn.execute(f"DELETE FROM {NEIGHBORS_TABLE} WHERE content_id IN (SELECT content_id FROM temp._neighbor_targets)")
+            conn.executemany(f"INSERT INTO {NEIGHBORS_TABLE} ({', '.join(NEIGHBOR_COLUMNS)}) "
+                             f"VALUES ({', '.join('?' for _ in NEIGHBOR_COLUMNS)})", records(rows))
+            set_watermark(conn, WATERMARK_SOURCE, 'id', new_max)
+            conn.commit()
+            conn.execute("DROP TABLE temp._neighbor_targets")
+        finally:
+            conn.close()
+        if self.verbose:
+            print(f"이웃 인덱스 증분 갱신: 새 평점 콘텐츠 {len(changed):,}개, 병합 {len(merged_ids):,}개, "
+                  f"재계산 {len(affected) + len(recompute):,}개 ({time.perf_counter() - start:.2f}s)")
+        return len(targets)
+
+    def neighbors(self, content_id: int, k: Optional[int] = None) -> List[Tuple[int, float, int]]:
+        """(neighbor_id, similarity, co_count) 목록, 연결을 유지해 커버링 인덱스만 읽음"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            ensure_indexes(self._conn, NEIGHBORS_TABLE, NEIGHBOR_INDEXES[NEIGHBORS_TABLE])
+        return self._conn.execute(
+            f"SELECT neighbor_id, similarity, co_count FROM {NEIGHBORS_TABLE} "
+            f"WHERE content_id = ? ORDER BY rank LIMIT ?", (int(content_id), k or self.k)).fetchall()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def run(self) -> Dict:
+        """인덱스 갱신(처음이면 전체 구성) 후 조회 지연 시간 측정"""
+        if self.verbose:
+            print("콘텐츠 이웃 인덱스를 갱신합니다...")
+        self.update()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            sample = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT content_id FROM {NEIGHBORS_TABLE} LIMIT 200")]
+        finally:
+            conn.close()
+        latency_us = 0.0
+        if sample:
+            self.neighbors(sample[0])
+            start = time.perf_counter()
+            for content_id in sample:
+                self.neighbors(content_id)
+            latency_us = (time.perf_counter() - start) / len(sample) * 1e6
+            if self.verbose:
+                print(f"이웃 조회 평균 {latency_us:.0f}µs ({len(sample)}회)")
+        self.close()
+        return {'query_us': latency_us}
+
+
+if __name__ == "__main__":
+    ContentSimilarityIndex().run()
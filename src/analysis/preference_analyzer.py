@@ -4,38 +4,132 @@
 - 나이대별 선호도 분석
 - 인종별 선호도 분석
 - 장르별 선호도 분석
+- 세그먼트 × 개별 장르 선호도 (원-핫 희소 행렬 곱으로 한 번에 계산)
+- 인사이트의 1위 항목에 부트스트랩 신뢰구간과 유의성 표시
+- 작은 전처리 프레임(콘텐츠, 세그먼트 집계)은 쿼리 캐시에 저장 (DB가 바뀌지 않았으면 다시 읽지 않음)
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import sqlite3
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis.bootstrap import bootstrap_means, compare_top
+from analysis.genre_matrix import genre_content_stats, genre_one_hot, segment_genre_affinity, split_genres
+from data_processing.query_cache import QueryCache
+from data_processing.segment_ranking import RANKING_TABLE, materialize_segment_rankings
+from data_processing.typed_loader import TypedPreferenceLoader
+
+REPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'reports')
+SEGMENT_COLUMNS = ['region', 'age_group', 'ethnicity', 'gender']
+# load_processed_data가 쿼리 캐시로 읽는 작은 프레임 (순서대로 content, region, age, ethnicity)
+# processed_preferences는 원본 행 수만큼 커서 캐시하지 않고 매번 읽음
+CACHED_QUERIES = [
+    "SELECT * FROM processed_content",
+    "SELECT * FROM region_preferences",
+    "SELECT * FROM age_preferences",
+    "SELECT * FROM ethnicity_preferences",
+]
+PREFERENCES_QUERY = "SELECT * FROM processed_preferences"
+PLOTLY_ASSET = 'plotly.min.js'
+DASHBOARD_FILE = 'dashboard.html'
+DASHBOARD_TEMPLATE = """<!DOCTYPE html>
+<html lang="ko">
+<head>
+<meta charset="utf-8">
+<title>넷플릭스 선호도 분석 대시보드</title>
+{plotly_script}
+</head>
+<body>
+<h1>넷플릭스 선호도 분석 대시보드</h1>
+{charts}
+</body>
+</html>
+"""
 
 class NetflixPreferenceAnalyzer:
-    def __init__(self, db_path="../../database/netflix_analysis.db"):
+    def __init__(self, db_path="../../database/netflix_analysis.db", reports_dir=REPORTS_DIR,
+                 output_mode='shared', dashboard=True, use_cache=True, verbose=False):
+        if output_mode not in ('shared', 'standalone'):
+            raise ValueError(f"output_mode must be 'shared' or 'standalone', got {output_mode!r}")
         self.db_path = db_path
+        self.reports_dir = reports_dir
+        self.output_mode = output_mode
+        self.dashboard = dashboard
+        self.cache = QueryCache(db_path) if use_cache else None
+        self.verbose = verbose
         
     def load_processed_data(self):
-        """전처리된 데이터 로드"""
+        """전처리된 데이터 로드 (작은 집계 프레임은 DB가 바뀌지 않았으면 쿼리 캐시에서)"""
         conn = sqlite3.connect(self.db_path)
-        
-        content_df = pd.read_sql_query("SELECT * FROM processed_content", conn)
-        preferences_df = pd.read_sql_query("SELECT * FROM processed_preferences", conn)
-        region_prefs = pd.read_sql_query("SELECT * FROM region_preferences", conn)
-        age_prefs = pd.read_sql_query("SELECT * FROM age_preferences", conn)
-        ethnicity_prefs = pd.read_sql_query("SELECT * FROM ethnicity_preferences", conn)
-        
-        conn.close()
-        
+        try:
+            # 선호도 데이터는 category/다운캐스트 dtype으로 로드
+            loader = TypedPreferenceLoader(self.db_path, verbose=False)
+            preferences_df = loader.read(PREFERENCES_QUERY, conn, table='processed_preferences')
+            if self.cache is None:
+                small = self._load_small_frames(loader, conn)
+            else:
+                small = self.cache.cached('; '.join(CACHED_QUERIES), lambda: self._load_small_frames(loader, conn))
+                if self.verbose:
+                    print(self.cache.report())
+        finally:
+            conn.close()
+        loader.verbose = True
+        loader.report()
+        content_df, region_prefs, age_prefs, ethnicity_prefs = small
         return content_df, preferences_df, region_prefs, age_prefs, ethnicity_prefs
+
+    def _load_small_frames(self, loader, conn):
+        content_query, region_query, age_query, ethnicity_query = CACHED_QUERIES
+        content_df = pd.read_sql_query(content_query, conn)
+        return (content_df, loader.read(region_query, conn), loader.read(age_query, conn),
+                loader.read(ethnicity_query, conn))
     
-    def analyze_region_preferences(self, content_df, region_prefs):
+    def load_segment_rankings(self):
+        """세그먼트별 상위 콘텐츠 (전처리 단계에서 저장한 segment_top_content, 없으면 지금 생성)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (RANKING_TABLE,)).fetchone()
+        finally:
+            conn.close()
+        if not exists:
+            materialize_segment_rankings(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return pd.read_sql_query(f"SELECT * FROM {RANKING_TABLE} ORDER BY dimension, segment, rank", conn)
+        finally:
+            conn.close()
+
+    def analyze_genre_affinity(self, content_df, preferences_df):
+        """세그먼트(지역/나이대/인종/성별) × 개별 장르 평균 평점·완료율
+
+        'Action, Adventure' 같은 장르 문자열을 개별 장르로 분해한 원-핫 행렬을 한 번 만들고
+        모든 세그먼트 컬럼을 희소 행렬 곱으로 한 번에 집계한다.
+        """
+        print("세그먼트 × 장르 선호도 계산 중...")
+        content_index, genres, one_hot = genre_one_hot(content_df)
+        columns = [c for c in SEGMENT_COLUMNS if c in preferences_df.columns]
+        return segment_genre_affinity(preferences_df, content_index, genres, one_hot, columns)
+
+    def _segment_genre_frame(self, affinity, dimension, prefix):
+        """affinity에서 한 세그먼트 컬럼만 (segment, genre) 인덱스 프레임으로"""
+        frame = affinity[affinity['dimension'] == dimension].rename(columns={
+            'segment': dimension,
+            'rating_mean': f'{prefix}_avg_rating',
+            'completion_rate_mean': f'{prefix}_completion_rate',
+        })
+        return frame.set_index([dimension, 'genre'])[[f'{prefix}_avg_rating', f'{prefix}_completion_rate', 'n']] \
+            .sort_index().round(2)
+
+    def _segment_top(self, rankings, dimension):
+        """segment_top_content에서 한 세그먼트 컬럼의 순위만 (segment 컬럼 이름은 원래 컬럼명으로)"""
+        top = rankings[rankings['dimension'] == dimension].drop(columns='dimension')
+        return top.rename(columns={'segment': dimension}).reset_index(drop=True)
+
+    def analyze_region_preferences(self, region_prefs, affinity, rankings):
         """지역별 선호도 분석"""
         print("지역별 선호도 분석 중...")
         
@@ -46,22 +140,15 @@ class NetflixPreferenceAnalyzer:
             'region_user_count': 'sum'
         }).round(2)
         
-        # 상위 콘텐츠 (지역별)
-        top_content_by_region = region_prefs.nlargest(10, 'region_avg_rating')
-        
-        # 지역별 장르 선호도
-        region_genre_prefs = region_prefs.merge(
-            content_df[['content_id', 'genre']], on='content_id'
-        )
+        # 지역별 상위 콘텐츠 (지역마다 상위 10개, 베이지안 가중 평점 순)
+        top_content_by_region = self._segment_top(rankings, 'region')
         
-        region_genre_analysis = region_genre_prefs.groupby(['region', 'genre']).agg({
-            'region_avg_rating': 'mean',
-            'region_completion_rate': 'mean'
-        }).round(2)
+        # 지역별 장르 선호도 (개별 장르 기준)
+        region_genre_analysis = self._segment_genre_frame(affinity, 'region', 'region')
         
         return region_analysis, top_content_by_region, region_genre_analysis
     
-    def analyze_age_preferences(self, content_df, age_prefs):
+    def analyze_age_preferences(self, age_prefs, affinity, rankings):
         """나이대별 선호도 분석"""
         print("나이대별 선호도 분석 중...")
         
@@ -72,22 +159,15 @@ class NetflixPreferenceAnalyzer:
             'age_user_count': 'sum'
         }).round(2)
         
-        # 상위 콘텐츠 (나이대별)
-        top_content_by_age = age_prefs.nlargest(10, 'age_avg_rating')
-        
-        # 나이대별 장르 선호도
-        age_genre_prefs = age_prefs.merge(
-            content_df[['content_id', 'genre']], on='content_id'
-        )
+        # 나이대별 상위 콘텐츠 (나이대마다 상위 10개)
+        top_content_by_age = self._segment_top(rankings, 'age_group')
         
-        age_genre_analysis = age_genre_prefs.groupby(['age_group', 'genre']).agg({
-            'age_avg_rating': 'mean',
-            'age_completion_rate': 'mean'
-        }).round(2)
+        # 나이대별 장르 선호도 (개별 장르 기준)
+        age_genre_analysis = self._segment_genre_frame(affinity, 'age_group', 'age')
         
         return age_analysis, top_content_by_age, age_genre_analysis
     
-    def analyze_ethnicity_preferences(self, content_df, ethnicity_prefs):
+    def analyze_ethnicity_preferences(self, ethnicity_prefs, affinity, rankings):
         """인종별 선호도 분석"""
         print("인종별 선호도 분석 중...")
         
@@ -98,123 +178,134 @@ class NetflixPreferenceAnalyzer:
             'ethnicity_user_count': 'sum'
         }).round(2)
         
-        # 상위 콘텐츠 (인종별)
-        top_content_by_ethnicity = ethnicity_prefs.nlargest(10, 'ethnicity_avg_rating')
-        
-        # 인종별 장르 선호도
-        ethnicity_genre_prefs = ethnicity_prefs.merge(
-            content_df[['content_id', 'genre']], on='content_id'
-        )
+        # 인종별 상위 콘텐츠 (인종마다 상위 10개)
+        top_content_by_ethnicity = self._segment_top(rankings, 'ethnicity')
         
-        ethnicity_genre_analysis = ethnicity_genre_prefs.groupby(['ethnicity', 'genre']).agg({
-            'ethnicity_avg_rating': 'mean',
-            'ethnicity_completion_rate': 'mean'
-        }).round(2)
+        # 인종별 장르 선호도 (개별 장르 기준)
+        ethnicity_genre_analysis = self._segment_genre_frame(affinity, 'ethnicity', 'ethnicity')
         
         return ethnicity_analysis, top_content_by_ethnicity, ethnicity_genre_analysis
     
-    def analyze_genre_preferences(self, content_df, preferences_df):
-        """장르별 선호도 분석"""
+    def analyze_genre_preferences(self, content_df, affinity):
+        """장르별 선호도 분석 (개별 장르 기준)"""
         print("장르별 선호도 분석 중...")
         
-        # 장르별 통계
-        genre_stats = content_df.groupby('genre').agg({
-            'avg_rating': 'mean',
-            'avg_completion_rate': 'mean',
-            'rating_count': 'sum',
-            'imdb_score': 'mean',
-            'netflix_score': 'mean'
-        }).round(2)
+        # 장르별 통계 (여러 장르를 가진 콘텐츠는 각 장르에 포함)
+        genre_stats = genre_content_stats(
+            content_df,
+            columns=['avg_rating', 'avg_completion_rate', 'imdb_score', 'netflix_score'],
+            sum_columns=['rating_count'],
+        )[['avg_rating', 'avg_completion_rate', 'rating_count', 'imdb_score', 'netflix_score']].round(2)
         
         # 장르별 지역 선호도
-        genre_region_prefs = preferences_df.merge(
-            content_df[['content_id', 'genre']], on='content_id'
-        )
-        
-        genre_region_analysis = genre_region_prefs.groupby(['genre', 'region']).agg({
-            'rating': 'mean',
-            'completion_rate': 'mean'
-        }).round(2)
+        genre_region_analysis = affinity[affinity['dimension'] == 'region'].rename(columns={
+            'segment': 'region', 'rating_mean': 'rating', 'completion_rate_mean': 'completion_rate',
+        }).set_index(['genre', 'region'])[['rating', 'completion_rate']].sort_index().round(2)
         
         return genre_stats, genre_region_analysis
     
+    def _chart_specs(self, region_analysis, age_analysis, ethnicity_analysis, genre_stats):
+        """(파일 이름, 데이터, x, y, 제목, 색상 스케일) 목록"""
+        return [
+            ('region_preferences', region_analysis.reset_index(), 'region', 'region_avg_rating',
+             '지역별 평균 평점', 'Viridis'),
+            ('age_preferences', age_analysis.reset_index(), 'age_group', 'age_avg_rating',
+             '나이대별 평균 평점', 'Plasma'),
+            ('ethnicity_preferences', ethnicity_analysis.reset_index(), 'ethnicity', 'ethnicity_avg_rating',
+             '인종별 평균 평점', 'Inferno'),
+            ('genre_preferences', genre_stats.reset_index(), 'genre', 'avg_rating',
+             '장르별 평균 평점', 'Cividis'),
+        ]
+
+    def _write_plotly_asset(self):
+        """공유 plotly.js를 reports 폴더에 한 번만 기록 (내용이 같으면 다시 쓰지 않음)"""
+        from plotly.offline import get_plotlyjs
+
+        path = os.path.join(self.reports_dir, PLOTLY_ASSET)
+        script = get_plotlyjs()
+        if not (os.path.exists(path) and os.path.getsize(path) == len(script.encode('utf-8'))):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(script)
+        return path
+
     def create_visualizations(self, region_analysis, age_analysis, ethnicity_analysis, genre_stats):
-        """시각화 생성"""
+        """시각화 생성
+
+        output_mode
+        - 'shared': 차트 파일은 작게, plotly.js는 reports/plotly.min.js 하나를 공유 (오프라인 동작)
+        - 'standalone': 차트 파일마다 plotly.js 전체를 포함 (기존 방식)
+        dashboard=True이면 모든 차트를 라이브러리를 한 번만 로드하는 dashboard.html로도 저장
+        """
+        # plotly는 import 비용이 커서 시각화 단계에서만 로드
+        import plotly.express as px
+
         print("시각화 생성 중...")
-        
-        # 1. 지역별 선호도 히트맵
-        fig1 = px.bar(
-            region_analysis.reset_index(), 
-            x='region', 
-            y='region_avg_rating',
-            title='지역별 평균 평점',
-            color='region_avg_rating',
-            color_continuous_scale='Viridis'
-        )
-        fig1.write_html("../../reports/region_preferences.html")
-        
-        # 2. 나이대별 선호도
-        fig2 = px.bar(
-            age_analysis.reset_index(),
-            x='age_group',
-            y='age_avg_rating',
-            title='나이대별 평균 평점',
-            color='age_avg_rating',
-            color_continuous_scale='Plasma'
-        )
-        fig2.write_html("../../reports/age_preferences.html")
-        
-        # 3. 인종별 선호도
-        fig3 = px.bar(
-            ethnicity_analysis.reset_index(),
-            x='ethnicity',
-            y='ethnicity_avg_rating',
-            title='인종별 평균 평점',
-            color='ethnicity_avg_rating',
-            color_continuous_scale='Inferno'
-        )
-        fig3.write_html("../../reports/ethnicity_preferences.html")
-        
-        # 4. 장르별 선호도
-        fig4 = px.bar(
-            genre_stats.reset_index(),
-            x='genre',
-            y='avg_rating',
-            title='장르별 평균 평점',
-            color='avg_rating',
-            color_continuous_scale='Cividis'
-        )
-        fig4.write_html("../../reports/genre_preferences.html")
-        
-        print("시각화가 reports 폴더에 저장되었습니다.")
-    
-    def generate_insights(self, region_analysis, age_analysis, ethnicity_analysis, genre_stats):
-        """인사이트 생성"""
+        os.makedirs(self.reports_dir, exist_ok=True)
+        shared = self.output_mode == 'shared'
+        if shared or self.dashboard:
+            self._write_plotly_asset()
+
+        def render(spec):
+            name, data, x, y, title, scale = spec
+            fig = px.bar(data, x=x, y=y, title=title, color=y, color_continuous_scale=scale)
+            # 'directory'는 같은 폴더의 plotly.min.js를 참조하는 script 태그만 넣음
+            fig.write_html(os.path.join(self.reports_dir, f"{name}.html"),
+                           include_plotlyjs='directory' if shared else True)
+            return fig.to_html(full_html=False, include_plotlyjs=False, div_id=name) if self.dashboard else None
+
+        specs = self._chart_specs(region_analysis, age_analysis, ethnicity_analysis, genre_stats)
+        with ThreadPoolExecutor(max_workers=len(specs)) as pool:
+            divs = list(pool.map(render, specs))
+
+        if self.dashboard:
+            with open(os.path.join(self.reports_dir, DASHBOARD_FILE), 'w', encoding='utf-8') as f:
+                f.write(DASHBOARD_TEMPLATE.format(plotly_script=f'<script src="{PLOTLY_ASSET}"></script>',
+                                                  charts='\n'.join(divs)))
+
+        print(f"시각화가 {self.reports_dir} 폴더에 저장되었습니다.")
+
+    def generate_insights(self, preferences_df, content_df, n_resamples=2000, alpha=0.05, min_count=30):
+        """인사이트 생성 (1위 세그먼트/장르의 부트스트랩 신뢰구간과 2위 대비 유의성 포함)
+
+        n < min_count인 그룹은 1위 후보에서 제외하고, 나머지도 표본이 작으면 신뢰구간이 넓어
+        2위와의 차이가 유의하지 않게 표시된다. 모든 그룹이 n < min_count이면 평균 1위를
+        표본 부족으로 표시하고, 데이터가 없으면 그렇게 표시한다.
+        반환: (인사이트 문장 목록, 항목별 비교 결과 프레임)
+        """
         print("인사이트 생성 중...")
         
-        insights = []
-        
-        # 지역별 인사이트
-        top_region = region_analysis['region_avg_rating'].idxmax()
-        top_region_score = region_analysis.loc[top_region, 'region_avg_rating']
-        insights.append(f"가장 높은 평점을 받는 지역: {top_region} ({top_region_score:.2f})")
-        
-        # 나이대별 인사이트
-        top_age = age_analysis['age_avg_rating'].idxmax()
-        top_age_score = age_analysis.loc[top_age, 'age_avg_rating']
-        insights.append(f"가장 높은 평점을 받는 나이대: {top_age} ({top_age_score:.2f})")
-        
-        # 인종별 인사이트
-        top_ethnicity = ethnicity_analysis['ethnicity_avg_rating'].idxmax()
-        top_ethnicity_score = ethnicity_analysis.loc[top_ethnicity, 'ethnicity_avg_rating']
-        insights.append(f"가장 높은 평점을 받는 인종: {top_ethnicity} ({top_ethnicity_score:.2f})")
-        
-        # 장르별 인사이트
-        top_genre = genre_stats['avg_rating'].idxmax()
-        top_genre_score = genre_stats.loc[top_genre, 'avg_rating']
-        insights.append(f"가장 높은 평점을 받는 장르: {top_genre} ({top_genre_score:.2f})")
-        
-        return insights
+        # 장르는 콘텐츠 평균 평점 기준 (여러 장르를 가진 콘텐츠는 각 장르에 포함)
+        content = content_df.drop_duplicates('content_id')
+        genres = content.assign(genre=split_genres(content['genre'])).explode('genre')
+        genres['genre'] = genres['genre'].str.strip()
+        
+        targets = [
+            ('지역', 'region', preferences_df['rating'], preferences_df['region']),
+            ('나이대', 'age_group', preferences_df['rating'], preferences_df['age_group']),
+            ('인종', 'ethnicity', preferences_df['rating'], preferences_df['ethnicity']),
+            ('장르', 'genre', genres['avg_rating'], genres['genre']),
+        ]
+        insights, rows = [], []
+        for label, dimension, values, groups in targets:
+            stats, samples = bootstrap_means(values, groups, n_resamples=n_resamples, alpha=alpha)
+            top = compare_top(stats, samples, alpha=alpha, min_count=min_count)
+            rows.append({'dimension': dimension, **top})
+            if top['top'] is None:
+                insights.append(f"가장 높은 평점을 받는 {label}: 데이터 없음")
+                continue
+            text = (f"가장 높은 평점을 받는 {label}: {top['top']} ({top['mean']:.2f}, "
+                    f"{1 - alpha:.0%} CI {top['ci_low']:.2f}~{top['ci_high']:.2f}, n={top['n']:,})")
+            if top['insufficient']:
+                text += f" — 표본 부족 (모든 그룹 n<{min_count}), 유의한 차이 판단 불가"
+            elif top['runner_up'] is not None:
+                verdict = "유의한 차이" if top['significant'] else "유의한 차이 없음"
+                text += (f" — 2위 {top['runner_up']} 대비 +{top['diff']:.3f} "
+                         f"[{top['diff_low']:.3f}, {top['diff_high']:.3f}], {verdict}")
+            if top['excluded']:
+                text += f" (n<{min_count}인 {top['excluded']}개 제외)"
+            insights.append(text)
+        
+        return insights, pd.DataFrame(rows).set_index('dimension')
     
     def run_analysis(self):
         """메인 분석 함수"""
@@ -223,17 +314,21 @@ class NetflixPreferenceAnalyzer:
         # 데이터 로드
         content_df, preferences_df, region_prefs, age_prefs, ethnicity_prefs = self.load_processed_data()
         
+        # 세그먼트 × 개별 장르 집계는 한 번만 계산해 각 분석이 공유
+        affinity = self.analyze_genre_affinity(content_df, preferences_df)
+        rankings = self.load_segment_rankings()
+
         # 각 분석 수행
-        region_analysis, top_content_by_region, region_genre_analysis = self.analyze_region_preferences(content_df, region_prefs)
-        age_analysis, top_content_by_age, age_genre_analysis = self.analyze_age_preferences(content_df, age_prefs)
-        ethnicity_analysis, top_content_by_ethnicity, ethnicity_genre_analysis = self.analyze_ethnicity_preferences(content_df, ethnicity_prefs)
-        genre_stats, genre_region_analysis = self.analyze_genre_preferences(content_df, preferences_df)
+        region_analysis, top_content_by_region, region_genre_analysis = self.analyze_region_preferences(region_prefs, affinity, rankings)
+        age_analysis, top_content_by_age, age_genre_analysis = self.analyze_age_preferences(age_prefs, affinity, rankings)
+        ethnicity_analysis, top_content_by_ethnicity, ethnicity_genre_analysis = self.analyze_ethnicity_preferences(ethnicity_prefs, affinity, rankings)
+        genre_stats, genre_region_analysis = self.analyze_genre_preferences(content_df, affinity)
         
         # 시각화 생성
         self.create_visualizations(region_analysis, age_analysis, ethnicity_analysis, genre_stats)
         
         # 인사이트 생성
-        insights = self.generate_insights(region_analysis, age_analysis, ethnicity_analysis, genre_stats)
+        insights, insight_stats = self.generate_insights(preferences_df, content_df)
         
         # 결과 출력
         print("\n=== 분석 결과 ===")
@@ -247,7 +342,12 @@ class NetflixPreferenceAnalyzer:
             'age_analysis': age_analysis,
             'ethnicity_analysis': ethnicity_analysis,
             'genre_stats': genre_stats,
-            'insights': insights
+            'genre_affinity': affinity,
+            'top_content_by_region': top_content_by_region,
+            'top_content_by_age': top_content_by_age,
+            'top_content_by_ethnicity': top_content_by_ethnicity,
+            'insights': insights,
+            'insight_stats': insight_stats
         }
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+줄거리(overview + tagline) 기반 유사 콘텐츠 검색
+- TF-IDF 희소 행렬 + 코사인 최근접 이웃 (NearestNeighbors, brute: 희소 행렬을 그대로 사용)
+- 벡터라이저와 행렬은 DB 파일 옆 overview_index 폴더에 저장해 다음 실행에서 다시 학습하지 않음
+  (메타에 DB 경로를 기록해 다른 DB의 인덱스는 쓰지 않음)
+- 새로 수집된 타이틀(색인에 없는 id)은 학습된 어휘/IDF로 transform만 해서 추가
+  추가된 문서가 학습 당시 코퍼스의 refit_ratio를 넘으면 전체를 다시 학습 (새 단어/IDF 반영)
+- 색인된 타이틀이 삭제되었거나 제목/줄거리가 바뀌었으면 (id별 해시 비교) 전체를 다시 학습
+  (수집기는 netflix_content를 지우고 다시 채우므로 id 범위만으로는 변경을 알 수 없음)
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import NearestNeighbors
+
+INDEX_DIR_NAME = 'overview_index'
+MODEL_FILE = 'vectorizer.pkl'
+MATRIX_FILE = 'tfidf_matrix.npz'
+META_FILE = 'meta.json'
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """(content_id, title, text) 행별 해시 — 제목이나 줄거리가 바뀌면 달라짐"""
+    return pd.util.hash_pandas_object(df[['content_id', 'title', 'text']], index=False).to_numpy(dtype=np.uint64)
+
+
+def _atomic_write(path: str, write):
+    """임시 파일에 쓴 뒤 교체 (중간에 실패해도 기존 파일 유지)"""
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class OverviewSimilarityIndex:
+    def __init__(self, db_path="../../database/netflix_analysis.db", index_dir=None, k: int = 10,
+                 refit_ratio: float = 0.5, max_features: int = 50_000, verbose: bool = True):
+        self.db_path = db_path
+        # 기본 위치는 DB 파일과 같은 폴더 (DB마다 별도 인덱스)
+        self.index_dir = index_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), INDEX_DIR_NAME)
+        self.k = k
+        self.refit_ratio = refit_ratio
+        self.max_features = max_features
+        self.verbose = verbose
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self.matrix: Optional[sparse.csr_matrix] = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.titles = np.empty(0, dtype=object)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.meta: Dict = {}
+        self._nn: Optional[NearestNeighbors] = None
+        self._positions: Dict[int, int] = {}
+
+    def load_titles(self, after_id: Optional[int] = None) -> pd.DataFrame:
+        """(content_id, title, text) — text는 overview와 tagline을 합친 문자열"""
+        query = "SELECT id AS content_id, title, overview, tagline FROM netflix_content"
+        params = ()
+        if after_id is not None:
+            query += " WHERE id > ?"
+            params = (after_id,)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            df = pd.read_sql_query(query + " ORDER BY id", conn, params=params)
+        finally:
+            conn.close()
+        df['text'] = (df['overview'].fillna('') + ' ' + df['tagline'].fillna('')).str.strip()
+        return df[['content_id', 'title', 'text']]
+
+    def _set_rows(self, df: pd.DataFrame, matrix: sparse.csr_matrix, hashes: np.ndarray):
+        self.ids = df['content_id'].to_numpy(dtype=np.int64)
+        self.titles = df['title'].to_numpy(dtype=object)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.matrix = matrix.tocsr()
+        self._nn = None
+        self._positions = {}
+
+    def fit(self, df: Optional[pd.DataFrame] = None) -> int:
+        """전체 코퍼스로 TF-IDF 학습 후 저장, 색인한 타이틀 수 반환"""
+        start = time.perf_counter()
+        df = self.load_titles() if df is None else df
+        self.vectorizer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2), min_df=1,
+                                          max_features=self.max_features, sublinear_tf=True)
+        matrix = self.vectorizer.fit_transform(df['text'])
+        self._set_rows(df, matrix, row_hashes(df))
+        self.meta = {'db_path': os.path.abspath(self.db_path), 'fit_size': len(df), 'added_since_fit': 0,
+                     'max_id': int(self.ids.max()) if len(self.ids) else None,
+                     'vocabulary': len(self.vectorizer.vocabulary_)}
+        self.save()
+        if self.verbose:
+            print(f"TF-IDF 학습: 타이틀 {len(df):,}개, 어휘 {self.meta['vocabulary']:,}개 "
+                  f"({time.perf_counter() - start:.2f}s)")
+        return len(df)
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        def write_model(path):
+            with open(path, 'wb') as f:
+                pickle.dump({'vectorizer': self.vectorizer, 'ids': self.ids, 'titles': self.titles,
+                             'hashes': self.hashes}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+        def write_meta(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+        def write_matrix(path):
+            # 파일 객체로 넘겨야 save_npz가 확장자(.npz)를 덧붙이지 않음
+            with open(path, 'wb') as f:
+                sparse.save_npz(f, self.matrix)
+
+        # 행렬을 먼저 쓰고 메타를 마지막에 (메타가 가리키는 max_id까지 반영된 상태만 보이도록)
+        _atomic_write(os.path.join(self.index_dir, MATRIX_FILE), write_matrix)
+        _atomic_write(os.path.join(self.index_dir, MODEL_FILE), write_model)
+        _atomic_write(os.path.join(self.index_dir, META_FILE), write_meta)
+
+    def load(self) -> bool:
+        """저장된 인덱스 로드 (없거나 다른 DB로 만든 인덱스면 False)"""
+        paths = [os.path.join(self.index_dir, f) for f in (MODEL_FILE, MATRIX_FILE, META_FILE)]
+        if not all(os.path.exists(p) for p in paths):
+            return False
+        with open(paths[2], encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('db_path') != os.path.abspath(self.db_path):
+            return False
+        with open(paths[0], 'rb') as f:
+            model = pickle.load(f)
+        if 'hashes' not in model:
+            return False
+        self.meta = meta
+        self.vectorizer = model['vectorizer']
+        self._set_rows(pd.DataFrame({'content_id': model['ids'], 'title': model['titles']}),
+                       sparse.load_npz(paths[1]), model['hashes'])
+        return True
+
+    def stale_rows(self, current: pd.DataFrame) -> int:
+        """색인된 타이틀 중 DB에서 삭제되었거나 제목/줄거리가 바뀐 수"""
+        current = current.drop_duplicates('content_id')
+        positions = pd.Index(current['content_id'].to_numpy(dtype=np.int64)).get_indexer(self.ids)
+        removed = positions < 0
+        changed = row_hashes(current)[positions[~removed]] != self.hashes[~removed]
+        return int(removed.sum() + changed.sum())
+
+    def add_new(self, new: pd.DataFrame) -> int:
+        """색인에 없는 타이틀을 학습된 어휘로 변환해 추가, 추가한 수 반환"""
+        if new.empty:
+            return 0
+        rows = self.vectorizer.transform(new['text'])
+        combined = pd.DataFrame({'content_id': np.concatenate([self.ids, new['content_id'].to_numpy(dtype=np.int64)]),
+                                 'title': np.concatenate([self.titles, new['title'].to_numpy(dtype=object)])})
+        self._set_rows(combined, sparse.vstack([self.matrix, rows]),
+                       np.concatenate([self.hashes, row_hashes(new)]))
+        self.meta['added_since_fit'] += len(new)
+        self.meta['max_id'] = int(self.ids.max())
+        self.save()
+        return len(new)
+
+    def update(self) -> Dict[str, int]:
+        """저장된 인덱스를 불러와 새 타이틀만 추가
+
+        인덱스가 없거나, 색인된 타이틀이 삭제/변경되었거나, 추가분이 많으면 전체 학습.
+        """
+        if not self.load():
+            return {'fitted': self.fit(), 'added': 0}
+        current = self.load_titles()
+        stale = self.stale_rows(current)
+        if stale:
+            if self.verbose:
+                print(f"삭제되었거나 내용이 바뀐 타이틀 {stale:,}개 → 전체 재학습")
+            return {'fitted': self.fit(current), 'added': 0}
+        added = self.add_new(current[~current['content_id'].isin(self.ids)])
+        if self.meta['added_since_fit'] > self.refit_ratio * max(self.meta['fit_size'], 1):
+            if self.verbose:
+                print(f"학습 이후 추가된 타이틀 {self.meta['added_since_fit']:,}개 → 전체 재학습")
+            return {'fitted': self.fit(current), 'added': added}
+        if self.verbose:
+            print(f"TF-IDF 인덱스 로드: 타이틀 {len(self.ids):,}개 (새로 추가 {added:,}개, 재학습 없음)")
+        return {'fitted': 0, 'added': added}
+
+    def _neighbors(self) -> NearestNeighbors:
+        if self._nn is None:
+            self._nn = NearestNeighbors(metric='cosine', algorithm='brute').fit(self.matrix)
+            self._positions = {int(c): i for i, c in enumerate(self.ids)}
+        return self._nn
+
+    def _results(self, distances: np.ndarray, positions: np.ndarray, k: int,
+                 exclude: Optional[int] = None) -> pd.DataFrame:
+        out = pd.DataFrame({'content_id': self.ids[positions], 'title': self.titles[positions],
+                            'similarity': 1.0 - distances})
+        if exclude is not None:
+            out = out[out['content_id'] != exclude]
+        # 공통 단어가 없는 타이틀(유사도 0)은 제외
+        return out[out['similarity'] > 0].head(k).reset_index(drop=True)
+
+    def similar(self, content_id: int, k: Optional[int] = None) -> pd.DataFrame:
+        """content_id와 줄거리가 비슷한 타이틀 (content_id, title, similarity)"""
+        nn = self._neighbors()
+        position = self._positions.get(int(content_id))
+        if position is None:
+            raise ValueError(f"content_id {content_id} is not in the overview index for {self.db_path} "
+                             f"({len(self.ids):,} titles indexed); run update() after collecting new titles")
+        k = k or self.k
+        distances, positions = nn.kneighbors(self.matrix[position], n_neighbors=min(k + 1, len(self.ids)))
+        return self._results(distances[0], positions[0], k, exclude=int(content_id))
+
+    def search(self, text: str, k: Optional[int] = None) -> pd.DataFrame:
+        """자유 텍스트와 비슷한 타이틀"""
+        nn = self._neighbors()
+        k = k or self.k
+        distances, positions = nn.kneighbors(self.vectorizer.transform([text]), n_neighbors=min(k, len(self.ids)))
+        return self._results(distances[0], positions[0], k)
+
+    def run(self) -> Dict:
+        if self.verbose:
+            print("줄거리 유사도 인덱스를 갱신합니다...")
+        stats = self.update()
+        if self.verbose and len(self.ids):
+            sample = int(self.ids[0])
+            title = self.titles[0]
+            start = time.perf_counter()
+            result = self.similar(sample)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"'{title}'와 비슷한 타이틀 ({elapsed_ms:.1f}ms):")
+            for row in result.head(5).itertuples(index=False):
+                print(f"  • {row.title} ({row.similarity:.3f})")
+        return stats
+
+
+if __name__ == "__main__":
+    OverviewSimilarityIndex().run()
@@ -0,0 +1,137 @@
+"""
+사용자 세그먼트 분석
+- processed_preferences → 사용자 × 장르 희소 선호 행렬 (청크 누적)
+- 행 정규화(L1)로 사용자별 장르 비중 프로필을 만든 뒤 MiniBatchKMeans로 군집
+  학습은 사용자 블록 단위 partial_fit, 할당도 블록 단위 predict → 원본 행/밀집 행렬을 한 번에 올리지 않음
+- 결과 저장: user_segments(user_id, segment, distance), segment_centroids(segment, genre, weight)
+- 단계별 소요 시간 보고
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis.genre_matrix import content_genre_matrix, user_genre_matrix
+from data_processing.bulk_writer import bulk_write_tables
+
+SEGMENTS_TABLE = 'user_segments'
+CENTROIDS_TABLE = 'segment_centroids'
+SEGMENT_INDEXES = {SEGMENTS_TABLE: [['user_id'], ['segment']], CENTROIDS_TABLE: [['segment']]}
+
+
+class UserSegmenter:
+    def __init__(self, db_path="../../database/netflix_analysis.db", n_segments: int = 6,
+                 batch_size: int = 10_000, epochs: int = 3, chunksize: int = 200_000,
+                 random_state: int = 42, verbose: bool = True):
+        self.db_path = db_path
+        self.n_segments = n_segments
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.chunksize = chunksize
+        self.random_state = random_state
+        self.verbose = verbose
+        self.timings: Dict[str, float] = {}
+
+    def _timed(self, stage: str, start: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def _blocks(self, n: int):
+        for start in range(0, n, self.batch_size):
+            yield slice(start, min(start + self.batch_size, n))
+
+    def build_matrix(self, conn: sqlite3.Connection):
+        """(선호가 있는 user_id 배열, L1 정규화된 사용자 × 장르 CSR, 장르 목록)"""
+        start = time.perf_counter()
+        content_index, genres, content_genres = content_genre_matrix(conn)
+        matrix = user_genre_matrix(conn, content_index, content_genres, chunksize=self.chunksize)
+        user_ids = np.flatnonzero(matrix.getnnz(axis=1))
+        matrix = normalize(matrix[user_ids], norm='l1')
+        self._timed('matrix', start)
+        return user_ids, matrix, genres
+
+    def fit(self, matrix) -> MiniBatchKMeans:
+        """사용자 블록을 섞어 epochs번 partial_fit"""
+        start = time.perf_counter()
+        n_clusters = min(self.n_segments, matrix.shape[0])
+        model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size,
+                                random_state=self.random_state, n_init=3)
+        rng = np.random.default_rng(self.random_state)
+        for _ in range(self.epochs):
+            order = rng.permutation(matrix.shape[0])
+            for block in self._blocks(len(order)):
+                rows = order[block]
+                # 첫 블록은 초기 중심을 뽑을 만큼 커야 함
+                if not hasattr(model, 'cluster_centers_') and len(rows) < n_clusters:
+                    continue
+                model.partial_fit(matrix[rows])
+        self._timed('fit', start)
+        return model
+
+    def assign(self, model: MiniBatchKMeans, user_ids: np.ndarray, matrix) -> pd.DataFrame:
+        """블록 단위로 세그먼트와 중심까지의 거리 계산"""
+        start = time.perf_counter()
+        segments = np.empty(len(user_ids), dtype=np.int32)
+        distances = np.empty(len(user_ids), dtype=np.float32)
+        for block in self._blocks(len(user_ids)):
+            dist = model.transform(matrix[block])
+            segments[block] = dist.argmin(axis=1)
+            distances[block] = dist.min(axis=1)
+        self._timed('assign', start)
+        return pd.DataFrame({'user_id': user_ids, 'segment': segments, 'distance': distances})
+
+    def centroids(self, model: MiniBatchKMeans, genres, assignments: pd.DataFrame) -> pd.DataFrame:
+        """세그먼트 중심 (장르 비중, long 형식) + 세그먼트 사용자 수"""
+        centers = pd.DataFrame(model.cluster_centers_, columns=genres)
+        centers.index.name = 'segment'
+        long = centers.reset_index().melt(id_vars='segment', var_name='genre', value_name='weight')
+        sizes = assignments['segment'].value_counts().rename('n_users')
+        long = long.merge(sizes, left_on='segment', right_index=True, how='left')
+        long['n_users'] = long['n_users'].fillna(0).astype('int64')
+        return long.sort_values(['segment', 'weight'], ascending=[True, False]).reset_index(drop=True)
+
+    def save(self, assignments: pd.DataFrame, centroids: pd.DataFrame):
+        start = time.perf_counter()
+        bulk_write_tables(self.db_path, {SEGMENTS_TABLE: assignments, CENTROIDS_TABLE: centroids},
+                          SEGMENT_INDEXES, verbose=self.verbose)
+        self._timed('save', start)
+
+    def run(self) -> Optional[Dict]:
+        """행렬 구성 → 학습 → 할당 → 저장"""
+        if self.verbose:
+            print("사용자 세그먼트 분석을 시작합니다...")
+        self.timings = {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            user_ids, matrix, genres = self.build_matrix(conn)
+        finally:
+            conn.close()
+        if matrix.shape[0] == 0:
+            print("세그먼트를 만들 선호도 데이터가 없습니다.")
+            return None
+
+        model = self.fit(matrix)
+        assignments = self.assign(model, user_ids, matrix)
+        centroids = self.centroids(model, genres, assignments)
+        self.save(assignments, centroids)
+
+        if self.verbose:
+            print(f"사용자 {len(user_ids):,}명 × 장르 {len(genres)}개 (nnz {matrix.nnz:,}) → "
+                  f"세그먼트 {model.n_clusters}개")
+            top = centroids.groupby('segment').head(3).groupby('segment')
+            for segment, rows in top:
+                print(f"  세그먼트 {segment} ({rows['n_users'].iloc[0]:,}명): {', '.join(rows['genre'])}")
+            labels = {'matrix': '행렬 구성', 'fit': '학습', 'assign': '할당', 'save': '저장'}
+            print("단계별 시간: " + ', '.join(f"{labels[k]} {v:.2f}s" for k, v in self.timings.items()))
+        return {'assignments': assignments, 'centroids': centroids, 'timings': dict(self.timings)}
+
+
+if __name__ == "__main__":
+    UserSegmenter().run()
@@ -17,8 +17,8 @@ import zipfile
 from typing import List, Dict, Optional
 
 class APIDataCollector:
-    def __init__(self):
-        self.db_path = "database/netflix_analysis.db"
+    def __init__(self, db_path="database/netflix_analysis.db"):
+        self.db_path = db_path
         self.data_dir = "data/raw"
         self.api_keys = self.load_api_keys()
         self.setup_database()
@@ -9,9 +9,14 @@ import requests
 import pandas as pd
 import sqlite3
 import time
+import os
+import sys
 import random
 from typing import List, Dict, Optional
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_collection.raw_payload_store import RawPayloadStore
+
 class EnhancedTMDBCollector:
     def __init__(self, api_key: str):
         self.api_key = api_key
@@ -20,6 +25,8 @@ class EnhancedTMDBCollector:
         self.headers = {
             'Content-Type': 'application/json'
         }
+        # 상세 응답 원본 보관 (bronze)
+        self.raw_store = RawPayloadStore(self.db_path)
         
     def get_netflix_content_by_sort(self, content_type: str, sort_by: str, max_pages: int = 10) -> List[Dict]:
         """다양한 정렬 기준으로 넷플릭스 콘텐츠 수집"""
@@ -307,6 +314,7 @@ class EnhancedTMDBCollector:
                 
                 if response.status_code == 200:
                     details = response.json()
+                    self.raw_store.add('movie' if content['type'] == 'Movie' else 'tv', content['tmdb_id'], details)
                     
                     # 장르 정보 추가
                     genre_ids = details.get('genres', [])
@@ -431,6 +439,7 @@ class EnhancedTMDBCollector:
         
         conn.commit()
         conn.close()
+        self.raw_store.flush()
         print(f"✓ {len(content_data)}개 콘텐츠가 데이터베이스에 저장되었습니다.")
     
     def collect_comprehensive_data(self):
@@ -0,0 +1,129 @@
+"""
+TMDB 원본 응답(bronze) 저장소
+- 응답 JSON 전체를 zlib 압축해 (endpoint, id, fetched_at) 키로 보관
+- 자주 조회하는 필드는 JSON1 생성 컬럼 + 인덱스로 노출
+- 재수집 없이 staging을 다시 만들 수 있도록 payload → staging 행 변환 제공
+"""
+
+import json
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BRONZE_TABLE = 'bronze_tmdb_raw'
+
+# 압축하지 않고 hot 컬럼에 남겨 두는 필드 (생성 컬럼의 원천)
+HOT_FIELDS = ('title', 'release_date', 'original_language', 'popularity', 'vote_count', 'vote_average')
+
+
+def _hot_fields(payload: Dict) -> Dict:
+    """영화/TV 응답의 필드명 차이를 맞춘 hot 필드 추출"""
+    return {
+        'title': payload.get('title', payload.get('name')),
+        'release_date': payload.get('release_date', payload.get('first_air_date')),
+        'original_language': payload.get('original_language'),
+        'popularity': payload.get('popularity'),
+        'vote_count': payload.get('vote_count'),
+        'vote_average': payload.get('vote_average'),
+    }
+
+
+def payload_to_stage_row(endpoint: str, tmdb_id: int, payload: Dict, fetched_at: str) -> Dict:
+    """상세 응답 하나를 stg_tmdb_all 행으로 변환 (수집기와 동일한 규칙)"""
+    release = payload.get('release_date', payload.get('first_air_date', '')) or ''
+    return {
+        'tmdb_id': tmdb_id,
+        'title': payload.get('title', payload.get('name', '')),
+        'type': 'Movie' if endpoint == 'movie' else 'TV Show',
+        'release_year': int(release[:4]) if release[:4].isdigit() else None,
+        'tmdb_score': payload.get('vote_average', 0),
+        'popularity': payload.get('popularity', 0),
+        'vote_count': payload.get('vote_count', 0),
+        'original_language': payload.get('original_language', ''),
+        'adult': int(bool(payload.get('adult', False))),
+        'genre': ', '.join(g['name'] for g in payload.get('genres', []) if g.get('name')),
+        'runtime': payload.get('runtime', 0) or 0,
+        'budget': payload.get('budget', 0) or 0,
+        'revenue': payload.get('revenue', 0) or 0,
+        'production_countries': ', '.join(c['name'] for c in payload.get('production_countries', [])),
+        'collected_at': fetched_at,
+        'production_companies': ', '.join(p['name'] for p in payload.get('production_companies', [])),
+        'spoken_languages': ', '.join(l['name'] for l in payload.get('spoken_languages', [])),
+    }
+
+
+class RawPayloadStore:
+    def __init__(self, db_path: str, batch_size: int = 500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._buffer: List[Tuple] = []
+
+    def setup_table(self, conn: sqlite3.Connection):
+        """bronze 테이블과 생성 컬럼 인덱스 생성"""
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {BRONZE_TABLE} (
+            endpoint TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            fetched_at TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            hot TEXT,
+            title TEXT GENERATED ALWAYS AS (json_extract(hot, '$.title')) VIRTUAL,
+            release_date TEXT GENERATED ALWAYS AS (json_extract(hot, '$.release_date')) VIRTUAL,
+            original_language TEXT GENERATED ALWAYS AS (json_extract(hot, '$.original_language')) VIRTUAL,
+            popularity REAL GENERATED ALWAYS AS (json_extract(hot, '$.popularity')) VIRTUAL,
+            vote_count INTEGER GENERATED ALWAYS AS (json_extract(hot, '$.vote_count')) VIRTUAL,
+            vote_average REAL GENERATED ALWAYS AS (json_extract(hot, '$.vote_average')) VIRTUAL,
+            PRIMARY KEY (endpoint, id, fetched_at)
+        )
+        ''')
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_bronze_title ON {BRONZE_TABLE} (title)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_bronze_language ON {BRONZE_TABLE} (original_language)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_bronze_popularity ON {BRONZE_TABLE} (popularity)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_bronze_release_date ON {BRONZE_TABLE} (release_date)")
+
+    def add(self, endpoint: str, tmdb_id: int, payload: Dict, fetched_at: Optional[str] = None):
+        """응답 하나를 버퍼에 추가 (batch_size마다 자동 저장)"""
+        if not payload or not tmdb_id:
+            return
+        fetched_at = fetched_at or datetime.utcnow().isoformat()
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        hot = json.dumps(_hot_fields(payload), ensure_ascii=False)
+        self._buffer.append((endpoint, int(tmdb_id), fetched_at, blob, hot))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """버퍼의 응답을 한 트랜잭션으로 저장"""
+        if not self._buffer:
+            return 0
+        rows, self._buffer = self._buffer, []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                self.setup_table(conn)
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {BRONZE_TABLE} (endpoint, id, fetched_at, payload, hot) "
+                    f"VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            conn.close()
+        return len(rows)
+
+    def iter_latest(self, conn: sqlite3.Connection,
+                    endpoints: Tuple[str, ...] = ('movie', 'tv')) -> Iterator[Tuple[str, int, str, Dict]]:
+        """(endpoint, id)별 최신 응답을 (endpoint, id, fetched_at, payload)로 반환"""
+        marks = ','.join('?' for _ in endpoints)
+        cur = conn.execute(f'''
+            SELECT b.endpoint, b.id, b.fetched_at, b.payload
+            FROM {BRONZE_TABLE} b
+            JOIN (
+                SELECT endpoint, id, MAX(fetched_at) AS fetched_at
+                FROM {BRONZE_TABLE}
+                WHERE endpoint IN ({marks})
+                GROUP BY endpoint, id
+            ) l ON l.endpoint = b.endpoint AND l.id = b.id AND l.fetched_at = b.fetched_at
+        ''', endpoints)
+        for endpoint, tmdb_id, fetched_at, blob in cur:
+            yield endpoint, tmdb_id, fetched_at, json.loads(zlib.decompress(blob))
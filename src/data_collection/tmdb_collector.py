@@ -7,8 +7,13 @@ import requests
 import pandas as pd
 import sqlite3
 import time
+import os
+import sys
 from typing import List, Dict, Optional
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_collection.raw_payload_store import RawPayloadStore
+
 class TMDBCollector:
     def __init__(self, api_key: str):
         self.api_key = api_key
@@ -17,6 +22,8 @@ class TMDBCollector:
         self.headers = {
             'Content-Type': 'application/json'
         }
+        # 상세 응답 원본 보관 (bronze)
+        self.raw_store = RawPayloadStore(self.db_path)
         self.api_key = api_key
         
     def get_netflix_movies(self, page: int = 1) -> List[Dict]:
@@ -125,7 +132,9 @@ class TMDBCollector:
             )
             
             if response.status_code == 200:
-                return response.json()
+                details = response.json()
+                self.raw_store.add('movie', movie_id, details)
+                return details
             else:
                 return {}
         except Exception as e:
@@ -142,7 +151,9 @@ class TMDBCollector:
             )
             
             if response.status_code == 200:
-                return response.json()
+                details = response.json()
+                self.raw_store.add('tv', tv_id, details)
+                return details
             else:
                 return {}
         except Exception as e:
@@ -281,6 +292,7 @@ class TMDBCollector:
         
         conn.commit()
         conn.close()
+        self.raw_store.flush()
         print(f"✓ {len(content_data)}개 콘텐츠가 데이터베이스에 저장되었습니다.")
     
     def collect_netflix_data(self, max_pages: int = 25):
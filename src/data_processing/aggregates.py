@@ -0,0 +1,147 @@
+"""
+그룹핑 셋 집계 엔진
+- 원본 선호도 데이터는 가장 세밀한 셀(content_id × 모든 인구통계 컬럼)로 한 번만 집계
+- 설정한 그룹핑 셋(또는 전체 cube)은 셀 통계에서 Chan 병합으로 롤업
+- 결과는 하나의 long 형식 테이블 (grouping_set, grouping_id, 키 컬럼, 통계)
+  롤업된 컬럼은 NULL이며 grouping_id 비트(SQL GROUPING_ID와 같은 규칙)로 구분
+"""
+
+from itertools import combinations
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_processing.moments import METRICS, frame_moments, combine_moments, finalize_moments
+
+DIMENSIONS = ['region', 'age_group', 'ethnicity', 'gender']
+GROUP_KEYS = ['content_id'] + DIMENSIONS
+
+DEFAULT_GROUPING_SETS = [
+    ('content_id',),
+    ('content_id', 'region'),
+    ('content_id', 'age_group'),
+    ('content_id', 'ethnicity'),
+    ('content_id', 'gender'),
+    ('content_id', 'region', 'age_group'),
+    ('region',),
+    ('age_group',),
+    ('ethnicity',),
+    ('gender',),
+    ('region', 'age_group'),
+    (),
+]
+
+AGGREGATES_TABLE = 'preference_aggregates'
+
+# 기존 *_preferences 테이블과 같은 컬럼명으로 제공하는 호환 뷰: (뷰 이름, 컬럼, 접두사)
+LEGACY_VIEWS = [
+    ('region_preferences', 'region', 'region'),
+    ('age_preferences', 'age_group', 'age'),
+    ('ethnicity_preferences', 'ethnicity', 'ethnicity'),
+]
+
+
+def cube(columns: Sequence[str]) -> List[Tuple[str, ...]]:
+    """columns의 모든 부분집합 (GROUP BY CUBE와 동일)"""
+    return [combo for r in range(len(columns), -1, -1) for combo in combinations(columns, r)]
+
+
+def parse_grouping_set(name: str) -> Tuple[str, ...]:
+    """'content_id,region' → ('content_id', 'region') (전체 합계는 빈 문자열)"""
+    return tuple(c for c in name.split(',') if c)
+
+
+def grouping_id(keys: Sequence[str], columns: Sequence[str] = GROUP_KEYS) -> int:
+    """롤업된(키에 없는) 컬럼의 비트가 1인 정수 (첫 컬럼이 최상위 비트)"""
+    return sum(1 << (len(columns) - 1 - i) for i, c in enumerate(columns) if c not in keys)
+
+
+def available_keys(df: pd.DataFrame, columns: Sequence[str] = GROUP_KEYS) -> List[str]:
+    """데이터에 실제로 있는 그룹 컬럼 (예: gender가 없는 구버전 스키마)"""
+    return [c for c in columns if c in df.columns]
+
+
+def cell_moments(df: pd.DataFrame, columns: Sequence[str] = GROUP_KEYS) -> pd.DataFrame:
+    """가장 세밀한 셀 통계 (원본 데이터를 읽는 유일한 단계)"""
+    return frame_moments(df, available_keys(df, columns))
+
+
+def _rollup(parent: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    if keys:
+        return combine_moments(parent, keys)
+    # 전체 합계: 상수 키로 묶은 뒤 제거
+    return combine_moments(parent.assign(_all=0), ['_all']).drop(columns='_all')
+
+
+def aggregate_grouping_sets(cells: pd.DataFrame,
+                            grouping_sets: Iterable[Sequence[str]] = DEFAULT_GROUPING_SETS,
+                            columns: Sequence[str] = GROUP_KEYS, finalize: bool = True) -> pd.DataFrame:
+    """셀 통계를 그룹핑 셋별로 롤업해 long 형식으로 반환
+
+    각 그룹핑 셋은 이미 계산된 상위 집합 중 행 수가 가장 적은 결과에서 롤업한다.
+    content_id는 롤업 행에서 결측이므로 nullable 정수(Int64)로 반환한다.
+    데이터에 없는 컬럼을 쓰는 그룹핑 셋은 건너뛴다.
+    finalize=False이면 표준편차 대신 병합 가능한 M2({m}_m2)를 그대로 반환한다.
+    """
+    present = [c for c in columns if c in cells.columns]
+    sets = []
+    for gs in grouping_sets:
+        keys = [c for c in present if c in gs]
+        if len(keys) == len(set(gs)) and tuple(keys) not in sets:
+            sets.append(tuple(keys))
+
+    computed = {tuple(present): cells}
+    frames = []
+    for keys in sorted(sets, key=len, reverse=True):
+        if keys not in computed:
+            parent = min((f for k, f in computed.items() if set(keys) <= set(k)), key=len)
+            computed[keys] = _rollup(parent, list(keys))
+        out = finalize_moments(computed[keys]) if finalize else computed[keys].copy()
+        out.insert(0, 'grouping_id', grouping_id(keys, present))
+        out.insert(0, 'grouping_set', ','.join(keys))
+        frames.append(out)
+
+    stats = ['n'] + [f'{m}_{s}' for m in METRICS for s in ('mean', 'std' if finalize else 'm2')]
+    result = pd.concat(frames, ignore_index=True)
+    for c in present:
+        if c not in result.columns:
+            result[c] = np.nan
+    # 롤업 행의 결측 때문에 float가 된 content_id를 nullable 정수로 (저장 시 INTEGER 컬럼)
+    if 'content_id' in present:
+        result['content_id'] = result['content_id'].astype('Int64')
+    return result[['grouping_set', 'grouping_id'] + present + stats]
+
+
+def legacy_segment_frame(aggregates: pd.DataFrame, column: str, prefix: str) -> pd.DataFrame:
+    """long 테이블에서 기존 (content_id, column) 선호도 프레임 형태로 추출"""
+    seg = aggregates[(aggregates['grouping_set'] == f'content_id,{column}') & aggregates[column].notna()]
+    seg = seg.rename(columns={
+        'rating_mean': f'{prefix}_avg_rating',
+        'completion_rate_mean': f'{prefix}_completion_rate',
+        'n': f'{prefix}_user_count',
+    })[['content_id', column, f'{prefix}_avg_rating', f'{prefix}_completion_rate', f'{prefix}_user_count']]
+    return seg.sort_values(['content_id', column]).round(2).reset_index(drop=True)
+
+
+def finish_aggregates_table(conn, key_cols: List[str], table: str = AGGREGATES_TABLE):
+    """집계 테이블 인덱스와 호환 뷰 생성 (pandas/SQL 경로 공통)"""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_set ON {table} (grouping_set, {', '.join(key_cols)})")
+
+    for view, column, prefix in LEGACY_VIEWS:
+        if column not in key_cols:
+            continue
+        # 이전 버전에서 만든 같은 이름의 테이블/뷰 제거
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (view,)).fetchone()
+        if row:
+            conn.execute(f"DROP {row[0].upper()} {view}")
+        conn.execute(f"""
+            CREATE VIEW {view} AS
+            SELECT content_id, {column},
+                   ROUND(rating_mean, 2) AS {prefix}_avg_rating,
+                   ROUND(completion_rate_mean, 2) AS {prefix}_completion_rate,
+                   n AS {prefix}_user_count
+            FROM {table}
+            WHERE grouping_set = 'content_id,{column}' AND {column} IS NOT NULL
+        """)
+    conn.commit()
@@ -0,0 +1,145 @@
+"""
+대량 저장 경로
+- 테이블마다 shadow 테이블(<table>__new)에 한 트랜잭션 executemany로 적재
+- 모든 shadow 테이블을 한 트랜잭션에서 원래 이름으로 교체 (읽는 쪽은 이전/새 상태 중 하나만 봄)
+- 교체 트랜잭션 안에서 content_id/세그먼트 컬럼 인덱스 생성 (적재가 끝난 뒤)
+- 테이블별 쓰기 처리량 보고
+"""
+
+import json
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+SHADOW_SUFFIX = '__new'
+
+
+def sqlite_type(s: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(s):
+        return 'REAL'
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return 'TIMESTAMP'
+    first = s.dropna().iloc[0] if s.notna().any() else None
+    if isinstance(first, (bytes, bytearray, memoryview)):
+        return 'BLOB'
+    return 'TEXT'
+
+
+def _is_list_like(value) -> bool:
+    return isinstance(value, (list, tuple, set, dict, np.ndarray))
+
+
+def column_values(s: pd.Series) -> list:
+    """executemany용 컬럼 값 목록 (NaN → None, 리스트형 값 → JSON 문자열)"""
+    if pd.api.types.is_bool_dtype(s) and not s.isna().any():
+        return s.astype(int).tolist()
+    if (pd.api.types.is_integer_dtype(s) or pd.api.types.is_float_dtype(s)) \
+            and not isinstance(s.dtype, pd.CategoricalDtype):
+        values = s.tolist()
+        # nullable 정수(Int64)의 결측은 pd.NA이므로 v != v로 판별할 수 없음
+        return [None if m else v for v, m in zip(values, s.isna().tolist())] if s.isna().any() else values
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.strftime('%Y-%m-%d %H:%M:%S')
+    values = s.astype(object).where(s.notna(), None).tolist()
+    first = next((v for v in values if v is not None), None)
+    if _is_list_like(first):
+        # 예: clean_content_data의 genres (장르 리스트)
+        values = [json.dumps(list(v) if isinstance(v, (set, np.ndarray)) else v, ensure_ascii=False)
+                  if _is_list_like(v) else v for v in values]
+    return values
+
+
+def ensure_indexes(conn: sqlite3.Connection, table: str, indexes: Sequence[Sequence[str]]):
+    """인덱스 생성 (이름: ix_<table>_<col>_<col>), 테이블에 없는 컬럼은 건너뜀"""
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    for cols in indexes:
+        if all(c in existing for c in cols):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{'_'.join(cols)} ON {table} ({', '.join(cols)})")
+
+
+def load_shadow(conn: sqlite3.Connection, table: str, df: pd.DataFrame) -> str:
+    """shadow 테이블을 새로 만들고 한 트랜잭션으로 적재"""
+    shadow = f"{table}{SHADOW_SUFFIX}"
+    columns = [str(c) for c in df.columns]
+    col_defs = ', '.join(f'"{c}" {sqlite_type(df[c])}' for c in columns)
+    quoted = ', '.join(f'"{c}"' for c in columns)
+    rows = zip(*(column_values(df[c]) for c in df.columns))
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+        conn.execute(f"CREATE TABLE {shadow} ({col_defs})")
+        conn.executemany(
+            f"INSERT INTO {shadow} ({quoted}) VALUES ({', '.join('?' for _ in columns)})",
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return shadow
+
+
+def swap_in(conn: sqlite3.Connection, tables: Sequence[str],
+            indexes: Optional[Dict[str, List[Sequence[str]]]] = None) -> Dict[str, float]:
+    """shadow 테이블들을 한 트랜잭션에서 원래 이름으로 교체하고 인덱스 생성, 테이블별 인덱스 시간 반환
+
+    기존 테이블을 참조하는 뷰가 있으므로 legacy_alter_table을 켜서
+    RENAME 시 뷰 재검증/재작성을 하지 않게 한다 (교체 후 같은 이름으로 다시 유효해짐).
+    인덱스도 같은 트랜잭션에서 만들어 인덱스 없는 테이블이 보이는 순간이 없다.
+    """
+    indexes = indexes or {}
+    index_s = {}
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in tables:
+            row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+            if row:
+                conn.execute(f"DROP {row[0].upper()} {table}")
+            conn.execute(f"ALTER TABLE {table}{SHADOW_SUFFIX} RENAME TO {table}")
+            start = time.perf_counter()
+            ensure_indexes(conn, table, indexes.get(table, []))
+            index_s[table] = time.perf_counter() - start
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+    return index_s
+
+
+def bulk_write_tables(db_path: str, frames: Dict[str, pd.DataFrame],
+                      indexes: Optional[Dict[str, List[Sequence[str]]]] = None,
+                      verbose: bool = True, loaded: Sequence[str] = ()) -> Dict[str, Dict[str, float]]:
+    """여러 DataFrame을 shadow 적재 → 원자적 교체(+인덱스) 순으로 저장, 테이블별 통계 반환
+
+    loaded: shadow 테이블(<table>__new)을 호출자가 이미 적재한 테이블 (같은 트랜잭션에서 함께 교체)
+    """
+    stats = {}
+    # 트랜잭션을 직접 제어 (파이썬 sqlite3의 암묵적 BEGIN 비활성화)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for table, df in frames.items():
+            start = time.perf_counter()
+            load_shadow(conn, table, df)
+            stats[table] = {'rows': len(df), 'load_s': time.perf_counter() - start}
+        for table in loaded:
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}{SHADOW_SUFFIX}").fetchone()[0]
+            stats[table] = {'rows': rows, 'load_s': 0.0}
+        for table, seconds in swap_in(conn, list(frames) + list(loaded), indexes).items():
+            stats[table]['index_s'] = seconds
+    finally:
+        conn.close()
+
+    if verbose:
+        for table, s in stats.items():
+            rate = s['rows'] / s['load_s'] if s['load_s'] else float('inf')
+            load = "호출자가 적재" if table in loaded else f"적재 {s['load_s']:.2f}s ({rate:,.0f}행/s)"
+            print(f"  {table}: {s['rows']:,}행 {load}, 인덱스 {s['index_s']:.2f}s")
+    return stats
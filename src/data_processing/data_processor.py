@@ -1,15 +1,53 @@
 """
 넷플릭스 데이터 전처리 및 정제 모듈
 - 데이터 클렌징
-- 특성 엔지니어링
-- 데이터 변환
+- 특성 엔지니어링 (그룹핑 셋 집계: content_id × 인구통계 컬럼을 한 번에)
+- 데이터 변환 (선호도 데이터는 category/다운캐스트 dtype으로 로드, 저장되는 실수 컬럼은 float64 유지)
+- processed_preferences.user_id는 dim_user 정수 키 (원래 문자열 ID는 dim_user.user_id로 조인)
+  새 user_id 등록은 각 모드가 선호도 행을 읽기 전에 register_user_ids로 수행
+- 근사 집계 스케치 (고유 사용자 HLL, 분위수 DDSketch)
+- 스트리밍 모드: 선호도 데이터를 청크 단위로 읽어 그룹 통계를 누적 (메모리 ∝ 그룹 수)
+  정제된 청크는 processed_preferences shadow 테이블에 쌓고 저장 시 집계와 함께 원자적 교체
+- SQL 푸시다운 모드: 정제/집계를 GROUP BY + INSERT ... SELECT로 SQLite 안에서 수행
+- 증분 모드: 워터마크 이후 새 선호도 행만 읽어 영향받는 그룹 통계만 병합
+- 세그먼트별 상위 콘텐츠 순위 (베이지안 가중 평점, 집계 갱신 후 segment_top_content에 저장)
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import sqlite3
 from datetime import datetime
 import re
+from collections import namedtuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_processing.sketches import (build_cell_sketches, cell_sketch_parts, combine_sketch_parts,
+                                      serialize_sketch_parts, SKETCH_KEYS)
+from data_processing.moments import combine_moments
+from data_processing.aggregates import (AGGREGATES_TABLE, DEFAULT_GROUPING_SETS, LEGACY_VIEWS,
+                                        aggregate_grouping_sets, GROUP_KEYS, available_keys, cell_moments,
+                                        finish_aggregates_table, legacy_segment_frame, parse_grouping_set)
+from data_processing.typed_loader import TypedPreferenceLoader, register_user_ids
+from data_processing.parallel_moments import parallel_cell_moments
+from data_processing.sql_pushdown import pushdown_aggregates, pushdown_processed_preferences
+from data_processing.bulk_writer import SHADOW_SUFFIX, bulk_write_tables
+from data_processing.incremental import (WATERMARK_COLUMNS, append_rows, get_watermark, merge_aggregates,
+                                         merge_sketches, new_rows_filter, set_watermark, update_content_stats)
+from data_processing.segment_ranking import materialize_segment_rankings
+
+# 저장 후 생성하는 인덱스 (content_id와 세그먼트 컬럼)
+PROCESSED_INDEXES = {
+    'processed_content': [['content_id']],
+    'processed_preferences': [['id'], ['content_id'], ['region'], ['age_group'], ['gender'], ['ethnicity']],
+    AGGREGATES_TABLE: [['content_id']],
+}
+
+# process_data 반환값: 기존 5-튜플과 같은 순서 (모든 모드 공통)
+# preferences는 메모리에 정제된 선호도 행이 있을 때만 (스트리밍/푸시다운 모드는 None, 증분 모드는 새 행만)
+ProcessingResult = namedtuple('ProcessingResult',
+                              ['content', 'preferences', 'region_prefs', 'age_prefs', 'ethnicity_prefs'])
 
 class NetflixDataProcessor:
     def __init__(self, db_path="../../database/netflix_analysis.db"):
@@ -24,10 +62,12 @@ class NetflixDataProcessor:
             SELECT * FROM netflix_content
         """, conn)
         
-        # 사용자 선호도 데이터 로드
-        preferences_df = pd.read_sql_query("""
-            SELECT * FROM user_preferences
-        """, conn)
+        # 사용자 선호도 데이터 로드 (category/정수 user_id/정수 다운캐스트, 저장할 실수는 float64 유지)
+        register_user_ids(conn)
+        conn.commit()
+        preferences_df = TypedPreferenceLoader(self.db_path, float32_columns=[]).read(
+            "SELECT * FROM user_preferences", conn, table='user_preferences'
+        )
         
         conn.close()
         
@@ -58,9 +98,10 @@ class NetflixDataProcessor:
         print(f"클렌징 완료: {len(df)}개 콘텐츠")
         return df
     
-    def clean_preferences_data(self, df):
+    def clean_preferences_data(self, df, verbose=True):
         """사용자 선호도 데이터 클렌징"""
-        print("사용자 선호도 데이터 클렌징 중...")
+        if verbose:
+            print("사용자 선호도 데이터 클렌징 중...")
         
         # 이상치 제거 (시청 시간이 0보다 작거나 300분 이상인 경우)
         df = df[(df['watch_time'] > 0) & (df['watch_time'] <= 300)]
@@ -71,77 +112,269 @@ class NetflixDataProcessor:
         # 평점 정규화
         df = df[(df['rating'] >= 1.0) & (df['rating'] <= 5.0)]
         
-        print(f"클렌징 완료: {len(df)}개 선호도 기록")
+        if verbose:
+            print(f"클렌징 완료: {len(df)}개 선호도 기록")
         return df
     
-    def create_analytical_features(self, content_df, preferences_df):
-        """분석용 특성 생성"""
+    def create_analytical_features(self, content_df, preferences_df, grouping_sets=DEFAULT_GROUPING_SETS,
+                                   workers=None):
+        """분석용 특성 생성 (선호도 데이터는 셀 단위로 한 번만 집계)
+        
+        workers가 2 이상이면 content_id 해시 파티션을 여러 프로세스에서 집계
+        """
         print("분석용 특성 생성 중...")
+        if workers and workers > 1:
+            cells = parallel_cell_moments(preferences_df, available_keys(preferences_df), workers=workers)
+        else:
+            cells = cell_moments(preferences_df)
+        return self.features_from_cells(content_df, cells, grouping_sets)
+    
+    def features_from_cells(self, content_df, cells, grouping_sets=DEFAULT_GROUPING_SETS):
+        """셀 통계를 그룹핑 셋별로 롤업해 (콘텐츠 특성, long 형식 집계) 생성"""
+        aggregates = aggregate_grouping_sets(cells, grouping_sets)
         
         # 콘텐츠별 통계
-        content_stats = preferences_df.groupby('content_id').agg({
-            'rating': ['mean', 'std', 'count'],
-            'watch_time': ['mean', 'std'],
-            'completion_rate': ['mean', 'std']
-        }).round(2)
-        
-        content_stats.columns = ['avg_rating', 'rating_std', 'rating_count', 
-                               'avg_watch_time', 'watch_time_std', 
-                               'avg_completion_rate', 'completion_rate_std']
-        
-        content_stats = content_stats.reset_index()
+        content_stats = aggregates[aggregates['grouping_set'] == 'content_id'].rename(columns={
+            'rating_mean': 'avg_rating', 'rating_std': 'rating_std', 'n': 'rating_count',
+            'watch_time_mean': 'avg_watch_time', 'watch_time_std': 'watch_time_std',
+            'completion_rate_mean': 'avg_completion_rate', 'completion_rate_std': 'completion_rate_std'
+        })[['content_id', 'avg_rating', 'rating_std', 'rating_count',
+            'avg_watch_time', 'watch_time_std', 'avg_completion_rate', 'completion_rate_std']].round(2)
         
         # 콘텐츠 데이터와 통계 병합
         content_enhanced = content_df.merge(content_stats, on='content_id', how='left')
         
-        # 지역별 선호도 분석
-        region_preferences = preferences_df.groupby(['content_id', 'region']).agg({
-            'rating': 'mean',
-            'completion_rate': 'mean',
-            'user_id': 'count'
-        }).round(2)
-        
-        region_preferences.columns = ['region_avg_rating', 'region_completion_rate', 'region_user_count']
-        region_preferences = region_preferences.reset_index()
-        
-        # 나이대별 선호도 분석
-        age_preferences = preferences_df.groupby(['content_id', 'age_group']).agg({
-            'rating': 'mean',
-            'completion_rate': 'mean',
-            'user_id': 'count'
-        }).round(2)
-        
-        age_preferences.columns = ['age_avg_rating', 'age_completion_rate', 'age_user_count']
-        age_preferences = age_preferences.reset_index()
-        
-        # 인종별 선호도 분석
-        ethnicity_preferences = preferences_df.groupby(['content_id', 'ethnicity']).agg({
-            'rating': 'mean',
-            'completion_rate': 'mean',
-            'user_id': 'count'
-        }).round(2)
-        
-        ethnicity_preferences.columns = ['ethnicity_avg_rating', 'ethnicity_completion_rate', 'ethnicity_user_count']
-        ethnicity_preferences = ethnicity_preferences.reset_index()
-        
-        return content_enhanced, region_preferences, age_preferences, ethnicity_preferences
+        print(f"그룹핑 셋 집계 완료: {aggregates['grouping_set'].nunique()}개 그룹핑 셋, {len(aggregates):,}행")
+        return content_enhanced, aggregates
+    
+    def process_data_streaming(self, chunksize=100_000, grouping_sets=DEFAULT_GROUPING_SETS):
+        """청크 단위 스트리밍 처리: 원본 행 수와 무관하게 메모리는 그룹 수에 비례"""
+        print(f"스트리밍 모드로 데이터 전처리를 시작합니다... (청크 크기: {chunksize:,})")
+        
+        conn = sqlite3.connect(self.db_path)
+        content_df = pd.read_sql_query("SELECT * FROM netflix_content", conn)
+        content_clean = self.clean_content_data(content_df)
+        popularity = content_clean[['content_id', 'popularity']] if 'popularity' in content_clean.columns else None
+        
+        # 정제된 행은 shadow 테이블에 쌓고 저장 단계에서 집계와 함께 교체 (실행 중에도 기존 테이블은 그대로)
+        # 읽기 커서가 열려 있는 동안에는 DROP을 할 수 없으므로 이전 실행이 남긴 shadow는 미리 제거
+        shadow = f"processed_preferences{SHADOW_SUFFIX}"
+        conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+        
+        register_user_ids(conn)
+        conn.commit()
+        loader = TypedPreferenceLoader(self.db_path, float32_columns=[])
+        chunks = loader.read("SELECT * FROM user_preferences", conn, table='user_preferences', chunksize=chunksize)
+        
+        cells = None
+        sketches = None
+        total = kept = 0
+        for i, chunk in enumerate(chunks):
+            total += len(chunk)
+            chunk = self.clean_preferences_data(chunk, verbose=False)
+            kept += len(chunk)
+            
+            # 청크 통계를 누적 통계에 병합 (count, mean, M2)
+            cells = combine_moments([cells, cell_moments(chunk)], available_keys(chunk))
+            
+            chunk_sketch_input = (chunk.merge(popularity, on='content_id', how='left')
+                                  if popularity is not None else chunk.assign(popularity=np.nan))
+            sketches = combine_sketch_parts(sketches, cell_sketch_parts(chunk_sketch_input))
+            
+            # 정제된 행은 바로 기록하고 메모리에 남기지 않음
+            chunk.to_sql(shadow, conn, if_exists='append', index=False)
+            print(f"  청크 {i + 1}: 누적 {total:,}행 처리, 셀 {len(cells):,}개")
+        conn.commit()
+        conn.close()
+        print(f"클렌징 완료: {kept:,}/{total:,}개 선호도 기록")
+        
+        content_enhanced, aggregates = self.features_from_cells(content_clean, cells, grouping_sets)
+        
+        self.save_processed_data(content_enhanced, None, aggregates)
+        if sketches is not None:
+            self.save_preference_sketches(serialize_sketch_parts(sketches))
+        
+        print("데이터 전처리가 완료되었습니다!")
+        return self.build_result(content_enhanced, None, aggregates)
+    
+    def process_data_pushdown(self, grouping_sets=DEFAULT_GROUPING_SETS):
+        """SQL 푸시다운 처리: 선호도 집계를 SQLite 안에서 수행 (원본 선호도 행을 읽지 않음)"""
+        print("SQL 푸시다운 모드로 데이터 전처리를 시작합니다...")
+        
+        conn = sqlite3.connect(self.db_path)
+        content_df = pd.read_sql_query("SELECT * FROM netflix_content", conn)
+        content_clean = self.clean_content_data(content_df)
+        
+        kept = pushdown_processed_preferences(conn, indexes=PROCESSED_INDEXES['processed_preferences'])
+        print(f"클렌징 완료: {kept:,}개 선호도 기록")
+        n_rows = pushdown_aggregates(conn, grouping_sets, indexes=PROCESSED_INDEXES[AGGREGATES_TABLE])
+        print(f"그룹핑 셋 집계 완료: {n_rows:,}행")
+        
+        # 콘텐츠별 통계는 집계된 행만 읽어 병합
+        content_stats = pd.read_sql_query("""
+            SELECT content_id,
+                   ROUND(rating_mean, 2) AS avg_rating, ROUND(rating_std, 2) AS rating_std, n AS rating_count,
+                   ROUND(watch_time_mean, 2) AS avg_watch_time, ROUND(watch_time_std, 2) AS watch_time_std,
+                   ROUND(completion_rate_mean, 2) AS avg_completion_rate,
+                   ROUND(completion_rate_std, 2) AS completion_rate_std
+            FROM preference_aggregates
+            WHERE grouping_set = 'content_id'
+        """, conn)
+        content_enhanced = content_clean.merge(content_stats, on='content_id', how='left')
+        conn.close()
+        bulk_write_tables(self.db_path, {'processed_content': content_enhanced},
+                          {'processed_content': PROCESSED_INDEXES['processed_content']})
+        self.save_segment_rankings()
+        
+        # 스케치는 행 단위 해시가 필요하므로 이 모드에서는 갱신하지 않음
+        print("데이터 전처리가 완료되었습니다! (preference_sketches는 갱신하지 않음)")
+        return self.build_result(content_enhanced, None)
     
-    def save_processed_data(self, content_df, preferences_df, region_prefs, age_prefs, ethnicity_prefs):
-        """전처리된 데이터 저장"""
+    def process_data_incremental(self, watermark_column='id', grouping_sets=DEFAULT_GROUPING_SETS):
+        """워터마크 이후 새 선호도 행만 처리해 영향받는 그룹의 통계만 갱신
+        
+        워터마크나 집계 테이블이 없으면 전체 처리 후 워터마크를 기록한다.
+        """
+        if watermark_column not in WATERMARK_COLUMNS:
+            raise ValueError(f"watermark_column must be one of {WATERMARK_COLUMNS}")
+        
         conn = sqlite3.connect(self.db_path)
+        watermark = get_watermark(conn, 'user_preferences', watermark_column)
+        has_aggregates = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (AGGREGATES_TABLE,)
+        ).fetchone()
+        
+        if watermark is None or not has_aggregates:
+            conn.close()
+            print("워터마크가 없어 전체 처리를 수행합니다.")
+            result = self.process_data(grouping_sets=grouping_sets)
+            # 처리한 행의 최대값: 그 이후에 들어온 행은 모두 이 값보다 큼
+            conn = sqlite3.connect(self.db_path)
+            value = conn.execute(f"SELECT MAX({watermark_column}) FROM processed_preferences").fetchone()[0]
+            set_watermark(conn, 'user_preferences', watermark_column, value)
+            conn.commit()
+            conn.close()
+            return result
+        
+        where, params = new_rows_filter(watermark_column, watermark)
+        print(f"증분 처리: {watermark_column} {'>' if watermark_column == 'id' else '>='} {watermark}")
+        register_user_ids(conn, where=where, params=params)
+        conn.commit()
+        loader = TypedPreferenceLoader(self.db_path, float32_columns=[], verbose=False)
+        # table을 넘기지 않음: 카테고리 목록을 위한 전체 DISTINCT 스캔을 피함
+        new_rows = loader.read(f"SELECT * FROM user_preferences WHERE {where} "
+                               f"ORDER BY {watermark_column}", conn, params=params)
+        # created_at은 category로 로드될 수 있으므로 파이썬 값으로 비교
+        new_watermark = new_rows[watermark_column].astype(object).max() if len(new_rows) else watermark
+        new_clean = self.clean_preferences_data(new_rows, verbose=False)
+        if new_clean.empty:
+            # 정제에서 모두 걸러진 행도 처리한 것으로 보고 워터마크만 옮김
+            with conn:
+                set_watermark(conn, 'user_preferences', watermark_column, new_watermark)
+            conn.close()
+            print("새 선호도 데이터가 없습니다.")
+            return self.build_result(None, new_clean)
+        
+        # 기존 집계에 있는 그룹핑 셋만 갱신 (전체 처리 때의 설정을 따름)
+        existing_sets = [parse_grouping_set(r[0]) for r in
+                         conn.execute(f"SELECT DISTINCT grouping_set FROM {AGGREGATES_TABLE}")]
+        delta = aggregate_grouping_sets(cell_moments(new_clean), existing_sets, finalize=False)
+        
+        content_df = pd.read_sql_query("SELECT content_id, popularity FROM processed_content", conn) \
+            if 'popularity' in [r[1] for r in conn.execute("PRAGMA table_info(processed_content)")] else None
+        sketch_input = (new_clean.merge(content_df, on='content_id', how='left')
+                        if content_df is not None else new_clean.assign(popularity=np.nan))
+        
+        with conn:
+            append_rows(conn, new_clean, 'processed_preferences')
+            merged = merge_aggregates(conn, delta)
+            n_content = update_content_stats(conn, merged)
+            n_cells = merge_sketches(conn, cell_sketch_parts(sketch_input))
+            set_watermark(conn, 'user_preferences', watermark_column, new_watermark)
+        conn.close()
+        self.save_segment_rankings()
         
-        # 전처리된 데이터를 새로운 테이블에 저장
-        content_df.to_sql('processed_content', conn, if_exists='replace', index=False)
-        preferences_df.to_sql('processed_preferences', conn, if_exists='replace', index=False)
-        region_prefs.to_sql('region_preferences', conn, if_exists='replace', index=False)
-        age_prefs.to_sql('age_preferences', conn, if_exists='replace', index=False)
-        ethnicity_prefs.to_sql('ethnicity_preferences', conn, if_exists='replace', index=False)
+        print(f"증분 처리 완료: 새 기록 {len(new_rows):,}개 (정제 후 {len(new_clean):,}개), "
+              f"집계 {len(merged):,}행 / 콘텐츠 {n_content:,}개 / 스케치 셀 {n_cells:,}개 갱신")
+        return self.build_result(None, new_clean)
+    
+    def create_preference_sketches(self, content_df, preferences_df):
+        """셀(content_id, region, age_group, ethnicity)별 병합 가능한 스케치 생성"""
+        print("선호도 스케치 생성 중...")
+        
+        # 인기도는 콘텐츠 속성이므로 시청 기록마다 붙여서 분포를 만든다
+        if 'popularity' in content_df.columns:
+            df = preferences_df.merge(content_df[['content_id', 'popularity']], on='content_id', how='left')
+        else:
+            df = preferences_df.assign(popularity=np.nan)
+        
+        sketches = build_cell_sketches(df)
+        print(f"스케치 생성 완료: {len(sketches)}개 셀")
+        return sketches
+    
+    def save_preference_sketches(self, sketches):
+        """스케치 테이블 저장 (셀 키 인덱스 포함)"""
+        bulk_write_tables(self.db_path, {'preference_sketches': sketches},
+                          {'preference_sketches': [SKETCH_KEYS, ['region', 'age_group', 'ethnicity']]})
+    
+    def save_processed_data(self, content_df, preferences_df, aggregates):
+        """전처리된 데이터 저장 (shadow 테이블 적재 후 원자적 교체, 인덱스는 적재 후 생성)
+        
+        preferences_df가 None이면 processed_preferences shadow 테이블이 이미 적재된 것으로 보고 함께 교체 (스트리밍)
+        """
+        print("전처리된 데이터 저장 중...")
+        frames = {'processed_content': content_df}
+        if preferences_df is not None:
+            frames['processed_preferences'] = preferences_df
+        frames[AGGREGATES_TABLE] = aggregates
+        bulk_write_tables(self.db_path, frames, PROCESSED_INDEXES,
+                          loaded=['processed_preferences'] if preferences_df is None else ())
         
+        conn = sqlite3.connect(self.db_path)
+        # 그룹핑 셋 인덱스 + region/age/ethnicity_preferences 호환 뷰
+        finish_aggregates_table(conn, [c for c in GROUP_KEYS if c in aggregates.columns])
+        conn.commit()
         conn.close()
+        self.save_segment_rankings()
         print("전처리된 데이터가 저장되었습니다.")
     
-    def process_data(self):
-        """메인 데이터 처리 함수"""
+    def build_result(self, content_df, preferences_df, aggregates=None):
+        """ProcessingResult 생성 (세그먼트별 선호도는 메모리의 집계에서, 없으면 저장된 호환 뷰에서 읽음)"""
+        if aggregates is not None:
+            segments = [legacy_segment_frame(aggregates, column, prefix) if column in aggregates.columns else None
+                        for _, column, prefix in LEGACY_VIEWS]
+            return ProcessingResult(content_df, preferences_df, *segments)
+        
+        conn = sqlite3.connect(self.db_path)
+        if content_df is None:
+            content_df = pd.read_sql_query("SELECT * FROM processed_content", conn)
+        views = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+        segments = [pd.read_sql_query(f"SELECT * FROM {view} ORDER BY content_id, {column}", conn)
+                    if view in views else None for view, column, _ in LEGACY_VIEWS]
+        conn.close()
+        return ProcessingResult(content_df, preferences_df, *segments)
+    
+    def save_segment_rankings(self, k=10, min_count=5, prior_weight=None):
+        """세그먼트 값별 상위 k개 콘텐츠를 segment_top_content에 저장 (집계 테이블에서 SQL로 계산)"""
+        rows = materialize_segment_rankings(self.db_path, k=k, min_count=min_count, prior_weight=prior_weight)
+        print(f"세그먼트별 상위 콘텐츠 순위 저장: {rows:,}행")
+    
+    def process_data(self, streaming=False, chunksize=100_000, grouping_sets=DEFAULT_GROUPING_SETS,
+                     workers=None, pushdown=False, incremental=False, watermark_column='id'):
+        """메인 데이터 처리 함수
+        
+        streaming=True이면 청크 단위, workers > 1이면 멀티코어 집계, pushdown=True이면 SQLite 안에서 집계,
+        incremental=True이면 워터마크 이후 새 행만 반영
+        
+        모든 모드가 ProcessingResult(content, preferences, region_prefs, age_prefs, ethnicity_prefs)를 반환
+        """
+        if incremental:
+            return self.process_data_incremental(watermark_column, grouping_sets)
+        if pushdown:
+            return self.process_data_pushdown(grouping_sets)
+        if streaming:
+            return self.process_data_streaming(chunksize, grouping_sets)
+        
         print("데이터 전처리를 시작합니다...")
         
         # 데이터 로드
@@ -152,17 +385,19 @@ class NetflixDataProcessor:
         preferences_clean = self.clean_preferences_data(preferences_df)
         
         # 분석용 특성 생성
-        content_enhanced, region_prefs, age_prefs, ethnicity_prefs = self.create_analytical_features(
-            content_clean, preferences_clean
+        content_enhanced, aggregates = self.create_analytical_features(
+            content_clean, preferences_clean, grouping_sets, workers
         )
         
         # 전처리된 데이터 저장
-        self.save_processed_data(content_enhanced, preferences_clean, 
-                               region_prefs, age_prefs, ethnicity_prefs)
+        self.save_processed_data(content_enhanced, preferences_clean, aggregates)
+        
+        # 근사 집계 스케치 갱신
+        self.save_preference_sketches(self.create_preference_sketches(content_clean, preferences_clean))
         
         print("데이터 전처리가 완료되었습니다!")
         
-        return content_enhanced, preferences_clean, region_prefs, age_prefs, ethnicity_prefs
+        return self.build_result(content_enhanced, preferences_clean, aggregates)
 
 if __name__ == "__main__":
     processor = NetflixDataProcessor()
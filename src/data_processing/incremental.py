@@ -0,0 +1,155 @@
+"""
+워터마크 기반 증분 집계
+- 처리한 user_preferences의 마지막 id(또는 created_at)를 processing_watermarks에 기록
+- created_at은 초 단위라 같은 초에 늦게 들어온 행이 있을 수 있으므로 >=로 읽고 이미 처리한 id는 제외
+- 새 행만 읽어 그룹핑 셋별 (n, mean, M2)를 만들고, 기존 집계 중 영향받는 그룹만 읽어 Chan 병합
+- 셀 스케치도 영향받는 셀만 디코딩해 병합
+- 모든 쓰기와 워터마크 갱신은 한 트랜잭션 (중간 실패 시 다음 실행이 같은 구간을 다시 처리)
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import List
+
+import pandas as pd
+
+from data_processing.aggregates import AGGREGATES_TABLE, GROUP_KEYS
+from data_processing.moments import combine_moments, finalize_moments, unfinalize_moments
+from data_processing.sketches import (SKETCH_KEYS, combine_sketch_parts, serialize_sketch_parts,
+                                      sketch_rows_to_parts)
+
+WATERMARK_TABLE = 'processing_watermarks'
+WATERMARK_COLUMNS = ('id', 'created_at')
+
+
+def ensure_watermark_table(conn: sqlite3.Connection):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            source TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            value,
+            updated_at TEXT,
+            PRIMARY KEY (source, column_name)
+        )
+    """)
+
+
+def get_watermark(conn: sqlite3.Connection, source: str, column: str):
+    """마지막으로 처리한 값 (없으면 None)"""
+    ensure_watermark_table(conn)
+    row = conn.execute(f"SELECT value FROM {WATERMARK_TABLE} WHERE source = ? AND column_name = ?",
+                       (source, column)).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(conn: sqlite3.Connection, source: str, column: str, value):
+    ensure_watermark_table(conn)
+    conn.execute(f"INSERT OR REPLACE INTO {WATERMARK_TABLE} (source, column_name, value, updated_at) "
+                 f"VALUES (?, ?, ?, ?)", (source, column, value, datetime.now().isoformat()))
+
+
+def new_rows_filter(column: str, watermark, source: str = 'user_preferences',
+                    processed: str = 'processed_preferences'):
+    """워터마크 이후 새 행의 WHERE 조건과 파라미터
+
+    id는 단조 증가하므로 > 로 충분하다. created_at은 워터마크와 같은 시각의 행을 다시 읽되
+    processed에 이미 있는 id는 제외한다 (정제에서 걸러진 경계 행은 다시 읽혀도 다시 걸러짐).
+    """
+    if column == 'id':
+        return "id > ?", (watermark,)
+    where = (f"({column} > ? OR ({column} = ? AND NOT EXISTS "
+             f"(SELECT 1 FROM {processed} p WHERE p.id = {source}.id)))")
+    return where, (watermark, watermark)
+
+
+def records(df: pd.DataFrame):
+    """executemany용 튜플 (numpy 스칼라/NaN → 파이썬 값/None)"""
+    obj = df.astype(object)
+    return list(obj.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def _stage_keys(conn: sqlite3.Connection, keys: pd.DataFrame, name: str):
+    """영향받는 그룹 키를 임시 테이블로 (기존 행과 IS 조인)"""
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP TABLE {name} ({', '.join(keys.columns)})")
+    conn.executemany(f"INSERT INTO temp.{name} VALUES ({', '.join('?' for _ in keys.columns)})", records(keys))
+
+
+def _matching_rowids(table: str, staged: str, key_cols: List[str]) -> str:
+    on = ' AND '.join(f"t.{c} IS k.{c}" for c in key_cols)
+    return f"SELECT t.rowid FROM {table} t JOIN temp.{staged} k ON {on}"
+
+
+def merge_aggregates(conn: sqlite3.Connection, delta: pd.DataFrame,
+                     table: str = AGGREGATES_TABLE) -> pd.DataFrame:
+    """그룹핑 셋 델타(n, mean, M2)를 기존 집계에 병합해 영향받는 행만 교체, 병합된 행 반환"""
+    key_cols = ['grouping_set'] + [c for c in GROUP_KEYS if c in delta.columns]
+    delta = delta.astype({c: object for c in key_cols})
+    _stage_keys(conn, delta[key_cols], '_delta_groups')
+
+    rowids = _matching_rowids(table, '_delta_groups', key_cols)
+    existing = pd.read_sql_query(f"SELECT * FROM {table} WHERE rowid IN ({rowids})", conn)
+    existing = unfinalize_moments(existing).astype({c: object for c in key_cols})
+
+    # grouping_id는 grouping_set에 종속이므로 키처럼 함께 묶는다
+    merged = finalize_moments(combine_moments([existing, delta], key_cols + ['grouping_id']))
+    columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+    merged = merged[columns]
+
+    conn.execute(f"DELETE FROM {table} WHERE rowid IN ({rowids})")
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                     records(merged))
+    conn.execute("DROP TABLE temp._delta_groups")
+    return merged
+
+
+def merge_sketches(conn: sqlite3.Connection, delta_parts, table: str = 'preference_sketches',
+                   keys: List[str] = SKETCH_KEYS) -> int:
+    """셀 스케치 델타를 기존 스케치와 병합 (영향받는 셀만 교체), 교체한 셀 수 반환"""
+    cells = delta_parts['n'][keys].astype(object)
+    _stage_keys(conn, cells, '_delta_cells')
+    rowids = _matching_rowids(table, '_delta_cells', keys)
+    existing = pd.read_sql_query(f"SELECT * FROM {table} WHERE rowid IN ({rowids})", conn)
+
+    def as_object(parts):
+        return {name: frame.astype({k: object for k in keys}) for name, frame in parts.items()}
+
+    merged_parts = combine_sketch_parts(as_object(sketch_rows_to_parts(existing, keys)), as_object(delta_parts), keys)
+    merged = serialize_sketch_parts(merged_parts, keys)
+    columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+    conn.execute(f"DELETE FROM {table} WHERE rowid IN ({rowids})")
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                     records(merged[columns]))
+    conn.execute("DROP TABLE temp._delta_cells")
+    return len(merged)
+
+
+def update_content_stats(conn: sqlite3.Connection, merged: pd.DataFrame, table: str = 'processed_content') -> int:
+    """processed_content에서 영향받은 콘텐츠의 통계 컬럼만 갱신"""
+    content = merged[merged['grouping_set'] == 'content_id']
+    rows = pd.DataFrame({
+        'avg_rating': content['rating_mean'], 'rating_std': content['rating_std'],
+        'rating_count': content['n'],
+        'avg_watch_time': content['watch_time_mean'], 'watch_time_std': content['watch_time_std'],
+        'avg_completion_rate': content['completion_rate_mean'],
+        'completion_rate_std': content['completion_rate_std'],
+    }).astype(float).round(2)
+    rows['content_id'] = content['content_id']
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_content_id ON {table} (content_id)")
+    conn.executemany(f"""
+        UPDATE {table}
+        SET avg_rating = ?, rating_std = ?, rating_count = ?, avg_watch_time = ?, watch_time_std = ?,
+            avg_completion_rate = ?, completion_rate_std = ?
+        WHERE content_id = ?
+    """, records(rows))
+    return len(rows)
+
+
+def append_rows(conn: sqlite3.Connection, df: pd.DataFrame, table: str) -> int:
+    """트랜잭션을 끊지 않고 행 추가 (to_sql은 내부에서 커밋하므로 사용하지 않음)"""
+    columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+    cols = [c for c in columns if c in df.columns]
+    conn.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+                     records(df[cols]))
+    return len(df)
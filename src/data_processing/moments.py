@@ -0,0 +1,72 @@
+"""
+병합 가능한 그룹 통계 (count, mean, M2)
+- 청크/파티션별로 계산한 통계를 정확하게 합칠 수 있음 (Welford/Chan 병합)
+- 세밀한 셀 통계에서 상위 그룹 통계를 롤업
+- 표준편차는 pandas 기본값과 같은 표본 표준편차(ddof=1)
+- 결측 키도 하나의 그룹으로 유지 (dropna=False): 셀에서 롤업해도 행이 사라지지 않음
+"""
+
+import numpy as np
+import pandas as pd
+from typing import List
+
+METRICS = ['rating', 'watch_time', 'completion_rate']
+
+
+def frame_moments(df: pd.DataFrame, keys: List[str], metrics: List[str] = METRICS) -> pd.DataFrame:
+    """DataFrame 한 덩어리의 그룹별 n, mean, M2 계산"""
+    g = df.groupby(keys, observed=True, sort=False, dropna=False)
+    out = g.size().rename('n').to_frame()
+    values = df[metrics].astype('float64')
+    vg = values.groupby([df[k] for k in keys], observed=True, sort=False, dropna=False)
+    mean = vg.mean()
+    m2 = vg.var(ddof=0).mul(out['n'], axis=0)
+    for m in metrics:
+        out[f'{m}_mean'] = mean[m]
+        out[f'{m}_m2'] = m2[m]
+    return out.reset_index()
+
+
+def combine_moments(parts, keys: List[str], metrics: List[str] = METRICS) -> pd.DataFrame:
+    """여러 통계 행을 keys 기준으로 병합
+
+    M2 = Σ M2_i + Σ n_i (mean_i - mean)^2 (Chan 병렬 분산 공식)
+    청크 누적과 셀 → 상위 그룹 롤업 모두에 사용한다.
+    """
+    if isinstance(parts, pd.DataFrame):
+        df = parts
+    else:
+        parts = [p for p in parts if p is not None and len(p)]
+        if not parts:
+            return pd.DataFrame(columns=keys + ['n'] + [f'{m}_{s}' for m in metrics for s in ('mean', 'm2')])
+        df = pd.concat(parts, ignore_index=True)
+    by = [df[k] for k in keys]
+    n = df['n'].astype('float64')
+    g_n = n.groupby(by, observed=True, sort=False, dropna=False)
+    total_n = g_n.transform('sum')
+
+    cols = {'n': g_n.sum().astype('int64')}
+    for m in metrics:
+        weighted = n * df[f'{m}_mean']
+        mean = weighted.groupby(by, observed=True, sort=False, dropna=False).transform('sum') / total_n
+        dev = n * (df[f'{m}_mean'] - mean) ** 2
+        cols[f'{m}_mean'] = mean.groupby(by, observed=True, sort=False, dropna=False).first()
+        cols[f'{m}_m2'] = (df[f'{m}_m2'] + dev).groupby(by, observed=True, sort=False, dropna=False).sum()
+    return pd.DataFrame(cols).reset_index()
+
+
+def finalize_moments(df: pd.DataFrame, metrics: List[str] = METRICS) -> pd.DataFrame:
+    """M2 → 표본 표준편차 변환 (n < 2이면 NaN)"""
+    out = df.drop(columns=[f'{m}_m2' for m in metrics])
+    denom = (df['n'] - 1).where(df['n'] > 1)
+    for m in metrics:
+        out[f'{m}_std'] = np.sqrt(df[f'{m}_m2'] / denom)
+    return out
+
+
+def unfinalize_moments(df: pd.DataFrame, metrics: List[str] = METRICS) -> pd.DataFrame:
+    """표본 표준편차 → M2 복원 (저장된 집계를 다시 병합할 때 사용, n < 2이면 0)"""
+    out = df.drop(columns=[f'{m}_std' for m in metrics])
+    for m in metrics:
+        out[f'{m}_m2'] = (df[f'{m}_std'] ** 2 * (df['n'] - 1)).fillna(0.0)
+    return out
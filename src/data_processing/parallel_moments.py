@@ -0,0 +1,114 @@
+"""
+멀티코어 파티션 집계
+- 선호도 행을 content_id 해시로 파티션 → 파티션끼리 셀이 겹치지 않아 결과는 단순 연결로 정확히 병합
+- 키 코드/지표 배열은 shared_memory에 한 번만 올리고 워커는 이름으로 붙어서 자기 구간만 읽음
+  (행 데이터는 pickle로 전달하지 않고, 반환되는 것은 셀 통계뿐)
+- 워커는 bincount로 셀별 n, 합(→ 평균), 편차 제곱합(M2)을 계산 (moments.py와 같은 형식)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_processing.moments import METRICS, frame_moments
+
+
+def _attach(name: str, shape: Tuple[int, ...], dtype) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _partition_moments(keys_name: str, values_name: str, n_rows: int, n_keys: int, n_metrics: int,
+                       sizes: Sequence[int], start: int, stop: int) -> Dict[str, np.ndarray]:
+    """워커: [start, stop) 구간 행의 셀별 n, mean, M2"""
+    keys_shm, keys = _attach(keys_name, (n_rows, n_keys), np.int32)
+    values_shm, values = _attach(values_name, (n_rows, n_metrics), np.float64)
+    try:
+        part_keys = keys[start:stop]
+        part_values = values[start:stop]
+        # 키 코드 조합을 하나의 정수 셀 ID로 (코드 0은 결측)
+        flat = np.ravel_multi_index(part_keys.T.astype(np.int64), sizes)
+        cell_ids, inverse = np.unique(flat, return_inverse=True)
+        n = np.bincount(inverse, minlength=len(cell_ids))
+
+        out = {'cell': cell_ids, 'n': n}
+        for j in range(n_metrics):
+            x = part_values[:, j]
+            mean = np.bincount(inverse, weights=x, minlength=len(cell_ids)) / n
+            out[f'mean_{j}'] = mean
+            out[f'm2_{j}'] = np.bincount(inverse, weights=(x - mean[inverse]) ** 2, minlength=len(cell_ids))
+        return out
+    finally:
+        del part_keys, part_values, keys, values
+        keys_shm.close()
+        values_shm.close()
+
+
+def parallel_cell_moments(df: pd.DataFrame, keys: List[str], metrics: List[str] = METRICS,
+                          workers: Optional[int] = None, partitions: Optional[int] = None) -> pd.DataFrame:
+    """content_id 해시 파티션별 셀 통계를 ProcessPoolExecutor로 계산
+
+    frame_moments(df, keys)와 같은 컬럼(keys, n, {m}_mean, {m}_m2)을 반환한다.
+    """
+    n_rows = len(df)
+    if n_rows == 0:
+        return frame_moments(df, keys, metrics)
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers
+
+    # 키는 factorize 코드(+1, 0 = 결측)로, 디코딩용 값 목록은 부모 프로세스에 보관
+    codes, uniques = [], []
+    for k in keys:
+        if isinstance(df[k].dtype, pd.CategoricalDtype):
+            c, u = df[k].cat.codes.to_numpy(), df[k].cat.categories
+        else:
+            c, u = pd.factorize(df[k], use_na_sentinel=True)
+        codes.append(c.astype(np.int32) + 1)
+        uniques.append(u)
+    sizes = tuple(len(u) + 1 for u in uniques)
+    if np.prod(sizes, dtype=np.float64) >= 2 ** 62:
+        raise ValueError(f"Too many key combinations for parallel aggregation: {sizes}")
+
+    # content_id 해시 파티션 순서로 정렬해 각 파티션이 연속 구간이 되도록 함
+    part = pd.util.hash_array(df['content_id'].to_numpy()) % np.uint64(partitions)
+    order = np.argsort(part, kind='stable')
+    bounds = np.searchsorted(part[order], np.arange(partitions + 1, dtype=np.uint64))
+
+    keys_shm = shared_memory.SharedMemory(create=True, size=max(n_rows * len(keys) * 4, 1))
+    values_shm = shared_memory.SharedMemory(create=True, size=max(n_rows * len(metrics) * 8, 1))
+    try:
+        key_arr = np.ndarray((n_rows, len(keys)), dtype=np.int32, buffer=keys_shm.buf)
+        value_arr = np.ndarray((n_rows, len(metrics)), dtype=np.float64, buffer=values_shm.buf)
+        key_arr[:] = np.column_stack(codes)[order]
+        value_arr[:] = df[metrics].to_numpy(dtype=np.float64)[order]
+
+        tasks = [(keys_shm.name, values_shm.name, n_rows, len(keys), len(metrics), sizes,
+                  int(bounds[i]), int(bounds[i + 1]))
+                 for i in range(partitions) if bounds[i + 1] > bounds[i]]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_partition_moments, *zip(*tasks)))
+        del key_arr, value_arr
+    finally:
+        keys_shm.close()
+        keys_shm.unlink()
+        values_shm.close()
+        values_shm.unlink()
+
+    # 파티션끼리 셀이 겹치지 않으므로 연결만으로 정확한 전체 셀 통계
+    merged = {name: np.concatenate([r[name] for r in results]) for name in results[0]}
+    out = {}
+    for k, key_codes, u in zip(keys, np.unravel_index(merged['cell'], sizes), uniques):
+        if isinstance(df[k].dtype, pd.CategoricalDtype):
+            out[k] = pd.Categorical.from_codes(key_codes - 1, dtype=df[k].dtype)
+        else:
+            # 코드 0(결측)은 라벨 -1이 되어 reindex에서 NaN
+            out[k] = pd.Series(u).reindex(key_codes - 1).to_numpy()
+    out['n'] = merged['n'].astype('int64')
+    for j, m in enumerate(metrics):
+        out[f'{m}_mean'] = merged[f'mean_{j}']
+        out[f'{m}_m2'] = merged[f'm2_{j}']
+    return pd.DataFrame(out)
@@ -0,0 +1,193 @@
+"""
+SQL 조회 결과 디스크 캐시
+- 키 = (정규화한 SQL, 파라미터, DB 파일 경로, DB 변경 토큰)의 해시
+- 변경 토큰은 DB 파일과 -wal 파일의 (크기, 수정 시각 ns, 헤더 변경 카운터) — SQLite에 연결하지 않고 stat과 헤더 몇 바이트만 확인
+  (PRAGMA data_version은 연결 하나 안에서만 의미가 있어 프로세스 사이 캐시 키로는 쓸 수 없음)
+- 결과는 pickle(DataFrame dtype 그대로) + gzip 파일로 저장, 적중 시 SQLite를 열지 않고 바로 반환
+- 전체 크기가 max_bytes를 넘으면 가장 오래 사용하지 않은 항목부터 삭제 (LRU, 파일 수정 시각 기준)
+- 여러 스레드가 한 인스턴스를 공유할 수 있음: 적중/미스 카운터와 LRU 갱신/삭제는 락으로 보호 (조회 자체는 락 밖에서)
+  max_bytes보다 큰 결과는 저장하지 않음 (쓰자마자 삭제될 항목에 I/O를 쓰지 않도록)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import pandas as pd
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         'database', 'query_cache')
+CACHE_SUFFIX = '.pkl.gz'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql: str) -> str:
+    """공백/줄바꿈 차이와 끝의 세미콜론을 무시 (문자열 리터럴 대소문자는 보존)"""
+    return _WHITESPACE.sub(' ', sql).strip().rstrip(';').strip()
+
+
+def _read_bytes(path: str, offset: int, length: int) -> str:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length).hex()
+
+
+def change_token(db_path: str) -> Tuple:
+    """DB 파일(+ WAL)의 크기, 수정 시각, 헤더 카운터 — 커밋된 쓰기가 있으면 바뀜
+
+    수정 시각 해상도가 거친 파일 시스템도 있어 SQLite 헤더의 file change counter(24~27바이트, 롤백 저널
+    모드에서 커밋마다 증가)와 WAL 헤더(체크포인트 순번, salt — WAL을 처음부터 다시 쓸 때 바뀜)도 함께 본다.
+    """
+    token = []
+    for path, offset, length in ((db_path, 24, 4), (f"{db_path}-wal", 12, 12)):
+        try:
+            st = os.stat(path)
+            token.append((st.st_size, st.st_mtime_ns, _read_bytes(path, offset, length)))
+        except FileNotFoundError:
+            token.append(None)
+    return tuple(token)
+
+
+def value_bytes(value: Any) -> int:
+    """DataFrame(또는 그 tuple/list/dict)의 메모리 크기, 그 밖의 값은 0 (크기를 미리 알 수 없음)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sum(value_bytes(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(value_bytes(v) for v in value)
+    return 0
+
+
+class QueryCache:
+    def __init__(self, db_path: str, cache_dir: str = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 compresslevel: int = 1):
+        self.db_path = os.path.abspath(db_path)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, sql: str, params: Optional[Sequence] = None, token: Optional[Tuple] = None) -> str:
+        token = change_token(self.db_path) if token is None else token
+        payload = json.dumps([normalize_sql(sql), list(params) if params is not None else None,
+                              self.db_path, token], default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{CACHE_SUFFIX}")
+
+    def _load(self, path: str) -> Any:
+        with gzip.open(path, 'rb') as f:
+            value = pickle.load(f)
+        # 사용 시각 갱신 (LRU 순서), 읽은 뒤 다른 스레드가 삭제했으면 값만 반환
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return value
+
+    def _store(self, path: str, value: Any) -> bool:
+        """값을 저장 (max_bytes보다 크면 저장하지 않고 False)"""
+        # 압축 전 크기로 먼저 거르고, 크기를 모르는 값은 압축 후 크기로 확인
+        if value_bytes(value) > self.max_bytes:
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, 'wb', compresslevel=self.compresslevel) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if os.path.getsize(tmp) > self.max_bytes:
+            os.remove(tmp)
+            return False
+        with self._lock:
+            os.replace(tmp, path)
+            self._evict()
+        return True
+
+    def cached(self, sql: str, compute: Callable[[], Any], params: Optional[Sequence] = None) -> Any:
+        """sql/params 키로 캐시된 값을 반환, 없으면 compute() 결과를 저장 후 반환
+
+        compute는 sql을 실행(또는 같은 조회 결과를 가공)하는 함수. 실행 중 DB가 바뀌면 저장하지 않는다.
+        """
+        token = change_token(self.db_path)
+        path = self._path(self.key(sql, params, token))
+        if os.path.exists(path):
+            try:
+                value = self._load(path)
+                with self._lock:
+                    self.hits += 1
+                return value
+            except (OSError, EOFError, pickle.UnpicklingError):
+                # 손상되었거나 그 사이 삭제된 항목은 다시 계산
+                with self._lock:
+                    if os.path.exists(path):
+                        os.remove(path)
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        if change_token(self.db_path) == token:
+            self._store(path, value)
+        return value
+
+    def read_sql(self, sql: str, params: Optional[Sequence] = None,
+                 conn: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+        """pd.read_sql_query와 같지만 DB가 바뀌지 않았으면 캐시에서 반환 (conn이 없으면 미스 때만 연결)"""
+        def compute():
+            if conn is not None:
+                return pd.read_sql_query(sql, conn, params=params)
+            own = sqlite3.connect(self.db_path)
+            try:
+                return pd.read_sql_query(sql, own, params=params)
+            finally:
+                own.close()
+        return self.cached(sql, compute, params)
+
+    def evict(self) -> int:
+        """전체 크기가 max_bytes 이하가 될 때까지 오래된 항목 삭제, 삭제한 수 반환"""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith(CACHE_SUFFIX)]
+        except FileNotFoundError:
+            return 0
+        stats = sorted(((e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in entries))
+        total = sum(size for _, size, _ in stats)
+        removed = 0
+        for _, size, path in stats:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        with self._lock:
+            max_bytes, self.max_bytes = self.max_bytes, -1
+            try:
+                return self._evict()
+            finally:
+                self.max_bytes = max_bytes
+
+    def report(self) -> str:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        rate = hits / total if total else 0.0
+        return f"쿼리 캐시: 적중 {hits}회 / 미스 {misses}회 (적중률 {rate:.0%})"
@@ -0,0 +1,82 @@
+"""
+세그먼트별 상위 콘텐츠 순위
+- preference_aggregates의 (content_id, 세그먼트) 셀에서 세그먼트 값마다 상위 k개 콘텐츠 선택
+- 최소 평가 수(min_count) 필터 + 베이지안 가중 평점:
+  WR = (n × R + m × C) / (n + m)   (R: 셀 평균, n: 셀 평가 수, C: 세그먼트 전체 평균, m: prior_weight)
+- ROW_NUMBER() 윈도 함수로 SQLite 안에서 순위를 매겨 segment_top_content에 저장 (shadow 테이블 → 교체)
+- content_id는 INTEGER로 CAST (이전 버전에서 만든 REAL 컬럼 집계 테이블에서 읽어도 정수로 저장)
+"""
+
+import sqlite3
+from typing import List, Optional, Sequence
+
+from data_processing.aggregates import AGGREGATES_TABLE
+from data_processing.bulk_writer import SHADOW_SUFFIX, swap_in
+
+RANKING_TABLE = 'segment_top_content'
+RANKING_DIMENSIONS = ['region', 'age_group', 'ethnicity', 'gender']
+RANKING_INDEXES = {RANKING_TABLE: [['dimension', 'segment', 'rank'], ['content_id']]}
+# 순위를 매길 세그먼트가 없을 때 만드는 빈 테이블의 스키마
+RANKING_COLUMNS = ('dimension TEXT, segment TEXT, rank INTEGER, content_id INTEGER, title TEXT, n INTEGER, '
+                   'avg_rating REAL, weighted_rating REAL, segment_avg_rating REAL')
+
+
+def ranking_sql(dimension: str, k: int, min_count: int, prior_weight: float,
+                table: str = AGGREGATES_TABLE) -> str:
+    """한 세그먼트 컬럼의 세그먼트 값별 상위 k개 SELECT"""
+    return f"""
+    SELECT dimension, segment, rank, content_id, title, n, avg_rating, weighted_rating, segment_avg_rating
+    FROM (
+        SELECT '{dimension}' AS dimension, c.{dimension} AS segment,
+               CAST(c.content_id AS INTEGER) AS content_id, t.title, c.n,
+               ROUND(c.rating_mean, 4) AS avg_rating,
+               ROUND((c.n * c.rating_mean + {prior_weight} * s.rating_mean) / (c.n + {prior_weight}), 4)
+                   AS weighted_rating,
+               ROUND(s.rating_mean, 4) AS segment_avg_rating,
+               ROW_NUMBER() OVER (
+                   PARTITION BY c.{dimension}
+                   ORDER BY (c.n * c.rating_mean + {prior_weight} * s.rating_mean) / (c.n + {prior_weight}) DESC,
+                            c.n DESC, c.content_id
+               ) AS rank
+        FROM {table} c
+        JOIN {table} s ON s.grouping_set = '{dimension}' AND s.{dimension} = c.{dimension}
+        LEFT JOIN (SELECT content_id, MIN(title) AS title FROM processed_content GROUP BY content_id) t
+               ON t.content_id = c.content_id
+        WHERE c.grouping_set = 'content_id,{dimension}' AND c.{dimension} IS NOT NULL AND c.n >= {int(min_count)}
+    )
+    WHERE rank <= {int(k)}
+    """
+
+
+def available_dimensions(conn: sqlite3.Connection, dimensions: Sequence[str],
+                         table: str = AGGREGATES_TABLE) -> List[str]:
+    """(content_id, 컬럼)과 (컬럼) 그룹핑 셋이 모두 있는 세그먼트 컬럼"""
+    sets = {r[0] for r in conn.execute(f"SELECT DISTINCT grouping_set FROM {table}")}
+    return [d for d in dimensions if f'content_id,{d}' in sets and d in sets]
+
+
+def materialize_segment_rankings(db_path: str, k: int = 10, min_count: int = 5,
+                                 prior_weight: Optional[float] = None,
+                                 dimensions: Sequence[str] = RANKING_DIMENSIONS,
+                                 table: str = AGGREGATES_TABLE) -> int:
+    """세그먼트별 상위 k개를 segment_top_content에 저장, 저장한 행 수 반환
+
+    prior_weight를 주지 않으면 min_count를 사용한다 (평가 수가 min_count인 셀은 평균과 반반 섞임).
+    순위를 매길 세그먼트가 없으면 빈 테이블로 교체한다 (이전 실행의 순위를 남기지 않음).
+    """
+    prior_weight = float(min_count if prior_weight is None else prior_weight)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        dims = available_dimensions(conn, dimensions, table)
+        shadow = f"{RANKING_TABLE}{SHADOW_SUFFIX}"
+        conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+        if dims:
+            union = "\n    UNION ALL\n".join(ranking_sql(d, k, min_count, prior_weight, table) for d in dims)
+            conn.execute(f"CREATE TABLE {shadow} AS {union}")
+        else:
+            conn.execute(f"CREATE TABLE {shadow} ({RANKING_COLUMNS})")
+        rows = conn.execute(f"SELECT COUNT(*) FROM {shadow}").fetchone()[0]
+        swap_in(conn, [RANKING_TABLE], RANKING_INDEXES)
+    finally:
+        conn.close()
+    return rows
@@ -0,0 +1,313 @@
+"""
+선호도 테이블용 근사 집계 스케치
+- HyperLogLog: 고유 사용자 수 (p=12, 표준오차 1.04/sqrt(2^12) ≈ 1.6%)
+- DDSketch: 평점/시청시간/인기도 분위수 (양수 값에 대해 상대오차 ≤ alpha, 기본 1%)
+- 두 스케치 모두 병합 가능: 셀 단위로 저장하고 조회 시점에 필요한 셀만 합침
+- 직렬화는 희소 형식 (값이 있는 레지스터/버킷만 저장)
+"""
+
+import struct
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List
+
+HLL_PRECISION = 12
+QUANTILE_ALPHA = 0.01
+SKETCH_KEYS = ['content_id', 'region', 'age_group', 'ethnicity']
+SKETCH_METRICS = ['rating', 'watch_time', 'popularity']
+
+
+def hash_values(values) -> np.ndarray:
+    """값 배열을 64비트 해시로 변환 (벡터화)"""
+    return pd.util.hash_array(np.asarray(values, dtype=object)).astype(np.uint64)
+
+
+def _clz64(x: np.ndarray) -> np.ndarray:
+    """uint64 배열의 leading zero 개수 (x=0이면 64)"""
+    x = x.astype(np.uint64)
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift, limit in ((32, 0x00000000FFFFFFFF), (16, 0x0000FFFFFFFFFFFF), (8, 0x00FFFFFFFFFFFFFF),
+                         (4, 0x0FFFFFFFFFFFFFFF), (2, 0x3FFFFFFFFFFFFFFF), (1, 0x7FFFFFFFFFFFFFFF)):
+        small = x <= np.uint64(limit)
+        n[small] += shift
+        x = np.where(small, x << np.uint64(shift), x)
+    n[x == 0] = 64
+    return n
+
+
+def hll_registers(hashes: np.ndarray, p: int = HLL_PRECISION):
+    """해시 → (레지스터 인덱스, rank) 배열"""
+    idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes << np.uint64(p)
+    rank = np.minimum(_clz64(rest), 64 - p) + 1
+    return idx, rank.astype(np.uint8)
+
+
+class HyperLogLog:
+    def __init__(self, p: int = HLL_PRECISION, registers: np.ndarray = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        idx, rank = hll_registers(hashes, self.p)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.p != self.p:
+            raise ValueError("HyperLogLog precision mismatch")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting (소규모 보정)
+        return float(raw)
+
+    @staticmethod
+    def serialize_sparse(p: int, idx: np.ndarray, rank: np.ndarray) -> bytes:
+        if len(idx) * 3 < (1 << p):
+            return b'S' + struct.pack('<BI', p, len(idx)) + idx.astype('<u2').tobytes() + rank.astype(np.uint8).tobytes()
+        registers = np.zeros(1 << p, dtype=np.uint8)
+        registers[idx] = rank
+        return b'D' + struct.pack('<BI', p, 0) + registers.tobytes()
+
+    def to_bytes(self) -> bytes:
+        idx = np.flatnonzero(self.registers)
+        return self.serialize_sparse(self.p, idx, self.registers[idx])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        kind = data[:1]
+        p, nnz = struct.unpack('<BI', data[1:6])
+        body = data[6:]
+        if kind == b'D':
+            return cls(p, np.frombuffer(body, dtype=np.uint8).copy())
+        registers = np.zeros(1 << p, dtype=np.uint8)
+        idx = np.frombuffer(body[:2 * nnz], dtype='<u2')
+        registers[idx] = np.frombuffer(body[2 * nnz:], dtype=np.uint8)
+        return cls(p, registers)
+
+
+class QuantileSketch:
+    """DDSketch: 로그 간격 버킷 카운트, 분위수 값의 상대오차 ≤ alpha"""
+
+    def __init__(self, alpha: float = QUANTILE_ALPHA, counts: Dict[int, int] = None, zero_count: int = 0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.counts = counts or {}
+        self.zero_count = zero_count
+
+    @staticmethod
+    def bucket_keys(values: np.ndarray, alpha: float = QUANTILE_ALPHA) -> np.ndarray:
+        """양수 값 → 버킷 키 (0 이하 값은 호출 측에서 zero_count로 분리)"""
+        gamma = (1 + alpha) / (1 - alpha)
+        return np.ceil(np.log(values) / np.log(gamma)).astype(np.int64)
+
+    def add(self, values: Iterable[float]):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        positive = values > 0
+        self.zero_count += int((~positive).sum())
+        keys, cnt = np.unique(self.bucket_keys(values[positive], self.alpha), return_counts=True)
+        for k, c in zip(keys.tolist(), cnt.tolist()):
+            self.counts[k] = self.counts.get(k, 0) + c
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.alpha != self.alpha:
+            raise ValueError("QuantileSketch alpha mismatch")
+        for k, c in other.counts.items():
+            self.counts[k] = self.counts.get(k, 0) + c
+        self.zero_count += other.zero_count
+        return self
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.counts.values())
+
+    def quantile(self, q: float) -> float:
+        n = self.count
+        if n == 0:
+            return float('nan')
+        rank = q * (n - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+            if seen > rank:
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.counts) / (self.gamma + 1)
+
+    @staticmethod
+    def serialize(alpha: float, keys: np.ndarray, counts: np.ndarray, zero_count: int = 0) -> bytes:
+        return (b'Q' + struct.pack('<fII', alpha, zero_count, len(keys))
+                + keys.astype('<i2').tobytes() + counts.astype('<u4').tobytes())
+
+    def to_bytes(self) -> bytes:
+        keys = np.array(sorted(self.counts), dtype=np.int64)
+        counts = np.array([self.counts[k] for k in keys.tolist()], dtype=np.int64)
+        return self.serialize(self.alpha, keys, counts, self.zero_count)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'QuantileSketch':
+        alpha, zero_count, n = struct.unpack('<fII', data[1:13])
+        body = data[13:]
+        keys = np.frombuffer(body[:2 * n], dtype='<i2').tolist()
+        counts = np.frombuffer(body[2 * n:], dtype='<u4').tolist()
+        # float32로 저장된 alpha를 원래 설정값으로 복원
+        alpha = round(float(alpha), 6)
+        return cls(alpha, dict(zip(keys, counts)), zero_count)
+
+
+# 분위수 버킷 중 0 이하 값(zero_count)을 나타내는 키
+ZERO_KEY = -32768
+
+
+def cell_sketch_parts(df: pd.DataFrame, keys: List[str] = SKETCH_KEYS,
+                      metrics: List[str] = SKETCH_METRICS,
+                      p: int = HLL_PRECISION, alpha: float = QUANTILE_ALPHA) -> Dict[str, pd.DataFrame]:
+    """셀별 스케치 상태를 long 형식으로 계산: (셀, 레지스터) 최대 rank, (셀, 버킷) 개수
+
+    이 형식은 concat + groupby만으로 병합되므로 청크 누적에 그대로 쓸 수 있다.
+    """
+    key_cols = {k: df[k].to_numpy() for k in keys}
+    parts = {'n': df.groupby(keys, observed=True, sort=False).size().rename('n').reset_index()}
+
+    idx, rank = hll_registers(hash_values(df['user_id'].astype(str)), p)
+    parts['users_hll'] = (pd.DataFrame({**key_cols, 'idx': idx, 'rank': rank})
+                          .groupby(keys + ['idx'], observed=True, sort=False)['rank'].max().reset_index())
+
+    for metric in metrics:
+        values = df[metric].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        positive = valid & (values > 0)
+        bucket = np.full(len(values), ZERO_KEY, dtype=np.int64)
+        bucket[positive] = QuantileSketch.bucket_keys(values[positive], alpha)
+        frame = pd.DataFrame({**key_cols, 'key': bucket})[valid]
+        parts[f'{metric}_q'] = (frame.groupby(keys + ['key'], observed=True, sort=False)
+                                .size().rename('count').reset_index())
+    return parts
+
+
+def combine_sketch_parts(a: Dict[str, pd.DataFrame], b: Dict[str, pd.DataFrame],
+                         keys: List[str] = SKETCH_KEYS) -> Dict[str, pd.DataFrame]:
+    """long 형식 스케치 상태 병합 (HLL은 레지스터 최대값, 분위수는 버킷 합)"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    out = {}
+    for name in a:
+        frame = pd.concat([a[name], b[name]], ignore_index=True)
+        if name == 'n':
+            out[name] = frame.groupby(keys, observed=True, sort=False)['n'].sum().reset_index()
+        elif name == 'users_hll':
+            out[name] = frame.groupby(keys + ['idx'], observed=True, sort=False)['rank'].max().reset_index()
+        else:
+            out[name] = frame.groupby(keys + ['key'], observed=True, sort=False)['count'].sum().reset_index()
+    return out
+
+
+def serialize_sketch_parts(parts: Dict[str, pd.DataFrame], keys: List[str] = SKETCH_KEYS,
+                           p: int = HLL_PRECISION, alpha: float = QUANTILE_ALPHA) -> pd.DataFrame:
+    """long 형식 상태 → 셀당 한 행의 직렬화된 스케치 테이블"""
+    result = parts['n'].sort_values(keys).reset_index(drop=True)
+    n_cells = len(result)
+    cell_index = result[keys].assign(cell=np.arange(n_cells))
+
+    def split_by_cell(frame: pd.DataFrame, order: str, value_cols: List[str]) -> List[List[np.ndarray]]:
+        frame = frame.merge(cell_index, on=keys).sort_values(['cell', order])
+        bounds = np.searchsorted(frame['cell'].to_numpy(), np.arange(n_cells + 1))
+        arrays = [frame[c].to_numpy() for c in value_cols]
+        return [[a[bounds[i]:bounds[i + 1]] for a in arrays] for i in range(n_cells)]
+
+    result['users_hll'] = [HyperLogLog.serialize_sparse(p, i, r)
+                           for i, r in split_by_cell(parts['users_hll'], 'idx', ['idx', 'rank'])]
+    for name, frame in parts.items():
+        if name in ('n', 'users_hll'):
+            continue
+        blobs = []
+        for k, c in split_by_cell(frame, 'key', ['key', 'count']):
+            zero = k == ZERO_KEY
+            blobs.append(QuantileSketch.serialize(alpha, k[~zero], c[~zero], int(c[zero].sum())))
+        result[name] = blobs
+    return result
+
+
+def sketch_rows_to_parts(rows: pd.DataFrame, keys: List[str] = SKETCH_KEYS,
+                         metrics: List[str] = SKETCH_METRICS) -> Dict[str, pd.DataFrame]:
+    """저장된 셀 스케치 행 → long 형식 상태 (증분 병합용, 영향받는 셀만 디코딩)"""
+    parts = {'n': rows[keys + ['n']].reset_index(drop=True)}
+    key_values = [rows[k].to_numpy() for k in keys]
+
+    def expand(lengths, columns):
+        frame = {k: np.repeat(v, lengths) for k, v in zip(keys, key_values)}
+        frame.update(columns)
+        return pd.DataFrame(frame)
+
+    hll_idx, hll_rank, lengths = [], [], []
+    for blob in rows['users_hll']:
+        registers = HyperLogLog.from_bytes(blob).registers
+        idx = np.flatnonzero(registers)
+        hll_idx.append(idx)
+        hll_rank.append(registers[idx])
+        lengths.append(len(idx))
+    parts['users_hll'] = expand(lengths, {
+        'idx': np.concatenate(hll_idx) if hll_idx else np.array([], dtype=np.int64),
+        'rank': np.concatenate(hll_rank) if hll_rank else np.array([], dtype=np.uint8),
+    })
+
+    for metric in metrics:
+        bucket_keys, counts, lengths = [], [], []
+        for blob in rows[f'{metric}_q']:
+            sketch = QuantileSketch.from_bytes(blob)
+            k = list(sketch.counts) + ([ZERO_KEY] if sketch.zero_count else [])
+            c = list(sketch.counts.values()) + ([sketch.zero_count] if sketch.zero_count else [])
+            bucket_keys.extend(k)
+            counts.extend(c)
+            lengths.append(len(k))
+        parts[f'{metric}_q'] = expand(lengths, {
+            'key': np.array(bucket_keys, dtype=np.int64),
+            'count': np.array(counts, dtype=np.int64),
+        })
+    return parts
+
+
+def build_cell_sketches(df: pd.DataFrame, keys: List[str] = SKETCH_KEYS,
+                        metrics: List[str] = SKETCH_METRICS,
+                        p: int = HLL_PRECISION, alpha: float = QUANTILE_ALPHA) -> pd.DataFrame:
+    """셀(keys)별 스케치 생성: 행 단위 파이썬 루프 없이 (셀, 버킷) groupby로 계산"""
+    return serialize_sketch_parts(cell_sketch_parts(df, keys, metrics, p, alpha), keys, p, alpha)
+
+
+def merge_sketch_rows(rows: pd.DataFrame, metrics: List[str] = SKETCH_METRICS,
+                      quantiles=(0.5, 0.9)) -> Dict:
+    """스케치 행들을 병합해 요약 반환"""
+    summary = {'n': int(rows['n'].sum()) if len(rows) else 0}
+    hll = HyperLogLog()
+    for blob in rows['users_hll']:
+        hll.merge(HyperLogLog.from_bytes(blob))
+    summary['distinct_users'] = int(round(hll.estimate()))
+    for metric in metrics:
+        sketch = QuantileSketch()
+        for blob in rows[f'{metric}_q']:
+            sketch.merge(QuantileSketch.from_bytes(blob))
+        for q in quantiles:
+            summary[f'{metric}_p{int(q * 100)}'] = sketch.quantile(q)
+    return summary
+
+
+def query_sketches(conn, table: str = 'preference_sketches', **filters) -> Dict:
+    """조건(content_id/region/age_group/ethnicity)에 맞는 셀 스케치를 병합해 조회"""
+    unknown = set(filters) - set(SKETCH_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown sketch filters: {sorted(unknown)}")
+    where = " AND ".join(f"{k} = ?" for k in filters) or "1"
+    rows = pd.read_sql_query(f"SELECT * FROM {table} WHERE {where}", conn, params=list(filters.values()))
+    return merge_sketch_rows(rows)
+
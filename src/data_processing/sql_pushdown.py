@@ -0,0 +1,145 @@
+"""
+SQL 푸시다운 집계
+- create_analytical_features와 같은 통계(개수, 평균, 표준편차)를 SQLite 안에서 계산
+- 정제 조건은 WHERE로, 셀 집계는 GROUP BY로, 그룹핑 셋은 셀 위의 UNION ALL로 생성
+- 표준편차는 합/제곱합으로 계산: sqrt((Σx² - (Σx)²/n) / (n - 1))
+- 결과는 INSERT ... SELECT로 바로 테이블에 기록 (원본 행은 파이썬으로 넘어오지 않음)
+  정제 행과 집계 모두 shadow 테이블(<table>__new)에 적재한 뒤 bulk_writer.swap_in으로 원자적 교체
+"""
+
+import math
+import sqlite3
+from typing import Iterable, List, Optional, Sequence
+
+from data_processing.aggregates import (AGGREGATES_TABLE, DEFAULT_GROUPING_SETS, GROUP_KEYS,
+                                        finish_aggregates_table, grouping_id)
+from data_processing.bulk_writer import SHADOW_SUFFIX, swap_in
+from data_processing.moments import METRICS
+from data_processing.typed_loader import USER_MAP_TABLE, register_user_ids
+
+# NetflixDataProcessor.clean_preferences_data와 같은 조건
+CLEAN_PREFERENCES_WHERE = """
+    watch_time > 0 AND watch_time <= 300
+    AND completion_rate >= 0 AND completion_rate <= 1
+    AND rating >= 1.0 AND rating <= 5.0
+"""
+
+CELLS_TABLE = 'temp._preference_cells'
+
+
+def _ensure_math(conn: sqlite3.Connection):
+    """수학 함수가 없는 SQLite 빌드에서는 sqrt를 등록 (집계된 행에만 호출됨)"""
+    try:
+        conn.execute("SELECT sqrt(4)")
+    except sqlite3.OperationalError:
+        conn.create_function('sqrt', 1, lambda x: math.sqrt(x) if x is not None else None,
+                             deterministic=True)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _swap_in(conn: sqlite3.Connection, table: str, indexes: Optional[List[Sequence[str]]] = None):
+    """진행 중인 트랜잭션을 커밋하고 shadow 테이블을 table로 교체 (교체 트랜잭션에서 indexes 생성)"""
+    conn.commit()
+    # swap_in은 트랜잭션을 직접 제어하므로 파이썬 sqlite3의 암묵적 BEGIN을 잠시 끔
+    isolation_level, conn.isolation_level = conn.isolation_level, None
+    try:
+        swap_in(conn, [table], {table: indexes or []})
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def cells_sql(keys: Sequence[str], source: str = 'user_preferences',
+              metrics: Sequence[str] = METRICS) -> str:
+    """가장 세밀한 셀의 n, Σx, Σx² 집계 SQL"""
+    sums = ',\n           '.join(f"SUM({m}) AS {m}_sum, SUM({m} * {m}) AS {m}_sumsq" for m in metrics)
+    key_list = ', '.join(keys)
+    return f"""
+    SELECT {key_list}, COUNT(*) AS n,
+           {sums}
+    FROM {source}
+    WHERE {CLEAN_PREFERENCES_WHERE}
+    GROUP BY {key_list}
+    """
+
+
+def grouping_set_sql(keys: Sequence[str], present: Sequence[str], cells: str = CELLS_TABLE,
+                     metrics: Sequence[str] = METRICS) -> str:
+    """셀 합계에서 그룹핑 셋 하나를 롤업하는 SELECT (롤업된 컬럼은 NULL)"""
+    cols = [c if c in keys else f"NULL AS {c}" for c in present]
+    stats = []
+    for m in metrics:
+        stats.append(f"SUM({m}_sum) * 1.0 / SUM(n) AS {m}_mean")
+        stats.append(
+            f"CASE WHEN SUM(n) > 1 THEN sqrt(MAX(SUM({m}_sumsq) - SUM({m}_sum) * SUM({m}_sum) * 1.0 / SUM(n), 0)"
+            f" / (SUM(n) - 1)) END AS {m}_std"
+        )
+    group_by = f"GROUP BY {', '.join(keys)}" if keys else ""
+    return f"""
+    SELECT '{','.join(keys)}' AS grouping_set, {grouping_id(keys, present)} AS grouping_id,
+           {', '.join(cols)}, SUM(n) AS n,
+           {', '.join(stats)}
+    FROM {cells}
+    {group_by}
+    """
+
+
+def pushdown_aggregates(conn: sqlite3.Connection,
+                        grouping_sets: Iterable[Sequence[str]] = DEFAULT_GROUPING_SETS,
+                        source: str = 'user_preferences', table: str = AGGREGATES_TABLE,
+                        indexes: Optional[List[Sequence[str]]] = None) -> int:
+    """그룹핑 셋 집계를 SQLite 안에서 계산해 table에 기록, 기록한 행 수 반환
+
+    shadow 테이블에 적재 후 커밋하고 table과 교체한다 (교체 트랜잭션에서 indexes 생성).
+    진행 중인 트랜잭션은 적재와 함께 커밋된다.
+    """
+    _ensure_math(conn)
+    present = [c for c in GROUP_KEYS if c in table_columns(conn, source)]
+    sets = []
+    for gs in grouping_sets:
+        keys = [c for c in present if c in gs]
+        if len(keys) == len(set(gs)) and keys not in sets:
+            sets.append(keys)
+
+    conn.execute(f"DROP TABLE IF EXISTS {CELLS_TABLE}")
+    conn.execute(f"CREATE TABLE {CELLS_TABLE} AS {cells_sql(present, source)}")
+
+    stat_cols = ', '.join(f"{m}_mean REAL, {m}_std REAL" for m in METRICS)
+    key_defs = ', '.join(f"{c} {'INTEGER' if c == 'content_id' else 'TEXT'}" for c in present)
+    shadow = f"{table}{SHADOW_SUFFIX}"
+    conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+    conn.execute(f"""
+        CREATE TABLE {shadow} (
+            grouping_set TEXT, grouping_id INTEGER, {key_defs}, n INTEGER, {stat_cols}
+        )
+    """)
+    union = "\n    UNION ALL\n".join(grouping_set_sql(keys, present) for keys in sets)
+    cur = conn.execute(f"INSERT INTO {shadow} {union}")
+    conn.execute(f"DROP TABLE {CELLS_TABLE}")
+    _swap_in(conn, table, indexes)
+    finish_aggregates_table(conn, present, table)
+    return cur.rowcount
+
+
+def pushdown_processed_preferences(conn: sqlite3.Connection, source: str = 'user_preferences',
+                                   target: str = 'processed_preferences',
+                                   indexes: Optional[List[Sequence[str]]] = None) -> int:
+    """정제된 선호도 행을 INSERT ... SELECT로 복사 (user_id는 dim_user 정수 키로 변환), 복사한 행 수 반환
+
+    shadow 테이블에 적재 후 target과 교체한다 (교체 트랜잭션에서 indexes 생성).
+    """
+    register_user_ids(conn, source)
+    cols = ["u.user_key AS user_id" if c == 'user_id' else f"p.{c}" for c in table_columns(conn, source)]
+    shadow = f"{target}{SHADOW_SUFFIX}"
+    conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+    select = f"""
+        SELECT {', '.join(cols)}
+        FROM (SELECT * FROM {source} WHERE {CLEAN_PREFERENCES_WHERE}) p
+        LEFT JOIN {USER_MAP_TABLE} u ON u.user_id = p.user_id
+    """
+    conn.execute(f"CREATE TABLE {shadow} AS {select} LIMIT 0")
+    rows = conn.execute(f"INSERT INTO {shadow} {select}").rowcount
+    _swap_in(conn, target, indexes)
+    return rows
@@ -0,0 +1,169 @@
+"""
+타입 지정 선호도 데이터 로더
+- 카디널리티가 낮은 문자열 컬럼(region, age_group, gender, ethnicity 등) → category
+  카테고리 목록은 DB의 DISTINCT 값으로 고정해 청크/실행마다 코드가 같도록 유지
+- user_id('user_0001' 등 문자열) → 정수 (dim_user 매핑 테이블로 영구 고정)
+  로더는 dim_user를 조회만 한다. 새 ID 등록(register_user_ids)은 전처리 단계에서 로드 전에 수행
+  processed_preferences의 user_id도 이 정수 키이며, 원래 문자열 ID는 dim_user.user_id로 조인해서 얻는다
+- 숫자 컬럼 다운캐스트 (정수는 가능한 최소 폭, 실수는 float32)
+  float32는 메모리 절감용이다. 저장할 프레임은 float32_columns=[]로 로드해 원래 REAL 값을 유지
+- 절감된 메모리 보고
+"""
+
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLUMNS = ['region', 'age_group', 'gender', 'ethnicity']
+FLOAT32_COLUMNS = ['rating', 'completion_rate']
+USER_ID_COLUMN = 'user_id'
+USER_MAP_TABLE = 'dim_user'
+
+# 그 밖의 문자열 컬럼은 고유값 비율이 이 값 이하이면 category로 변환
+AUTO_CATEGORY_RATIO = 0.5
+
+
+def ensure_user_map(conn: sqlite3.Connection):
+    """user_id 문자열 → 정수 키 매핑 테이블"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {USER_MAP_TABLE} (
+            user_key INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL UNIQUE
+        )
+    """)
+
+
+def register_user_ids(conn: sqlite3.Connection, source: str = 'user_preferences', where: str = '',
+                      params=()) -> int:
+    """source의 user_id 중 dim_user에 없는 것을 등록 (SQL 안에서 처리), 등록한 수 반환"""
+    ensure_user_map(conn)
+    cur = conn.execute(f"INSERT OR IGNORE INTO {USER_MAP_TABLE} (user_id) "
+                       f"SELECT DISTINCT user_id FROM {source} WHERE user_id IS NOT NULL "
+                       f"{'AND ' + where if where else ''}", params)
+    return max(cur.rowcount, 0)
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """DataFrame의 실제 메모리 사용량(bytes)"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+class TypedPreferenceLoader:
+    def __init__(self, db_path: str, category_columns: List[str] = CATEGORY_COLUMNS,
+                 float32_columns: List[str] = FLOAT32_COLUMNS, verbose: bool = True):
+        self.db_path = db_path
+        self.category_columns = category_columns
+        self.float32_columns = float32_columns
+        self.verbose = verbose
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self._categories: Dict[str, pd.CategoricalDtype] = {}
+        self._user_map: Dict[str, int] = {}
+
+    def category_dtypes(self, conn: sqlite3.Connection, table: str) -> Dict[str, pd.CategoricalDtype]:
+        """테이블의 DISTINCT 값으로 고정 카테고리 dtype 생성 (청크 간 일관성)"""
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for column in self.category_columns:
+            if column in cols and column not in self._categories:
+                values = [r[0] for r in conn.execute(
+                    f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")]
+                self._categories[column] = pd.CategoricalDtype(sorted(values))
+        return self._categories
+
+    def _extend_categories(self, column: str, s: pd.Series) -> pd.CategoricalDtype:
+        """고정 카테고리에 없는 값이 들어오면 NaN이 되지 않도록 목록 확장"""
+        dtype = self._categories[column]
+        unseen = set(s.dropna().unique()) - set(dtype.categories)
+        if unseen:
+            dtype = pd.CategoricalDtype(sorted(set(dtype.categories) | unseen))
+            self._categories[column] = dtype
+        return dtype
+
+    def encode_user_ids(self, user_ids: pd.Series, conn: sqlite3.Connection) -> pd.Series:
+        """문자열 user_id → 정수 키 (dim_user 조회만, 등록은 register_user_ids로 미리)"""
+        codes, uniques = pd.factorize(user_ids.astype(str), sort=False)
+        # 캐시에 없는 ID만 조회 (UNIQUE 인덱스 사용, 전체 매핑을 읽지 않음)
+        unseen = [u for u in uniques if u not in self._user_map]
+        try:
+            for i in range(0, len(unseen), 900):
+                batch = unseen[i:i + 900]
+                marks = ','.join('?' for _ in batch)
+                self._user_map.update(conn.execute(
+                    f"SELECT user_id, user_key FROM {USER_MAP_TABLE} WHERE user_id IN ({marks})", batch))
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"{USER_MAP_TABLE} is missing; call register_user_ids() before loading") from e
+        missing = [u for u in unseen if u not in self._user_map]
+        if missing:
+            raise ValueError(f"{len(missing)} user_id values are not registered in {USER_MAP_TABLE} "
+                             f"(e.g. {missing[0]!r}); call register_user_ids() before loading")
+        keys = np.array([self._user_map[u] for u in uniques], dtype=np.int64)
+        encoded = keys[codes] if len(codes) else keys[:0]
+        return pd.Series(encoded, index=user_ids.index, name=user_ids.name)
+
+    def optimize(self, df: pd.DataFrame, conn: Optional[sqlite3.Connection] = None) -> pd.DataFrame:
+        """dtype 최적화 (원본 프레임은 변경하지 않음)"""
+        before = frame_memory(df)
+        df = df.copy()
+        for column in df.columns:
+            s = df[column]
+            if column == USER_ID_COLUMN and conn is not None and not pd.api.types.is_numeric_dtype(s):
+                s = self.encode_user_ids(s, conn)
+            if column in self._categories:
+                df[column] = s.astype(self._extend_categories(column, s))
+            elif column in self.category_columns and not isinstance(s.dtype, pd.CategoricalDtype):
+                df[column] = s.astype('category')
+            elif pd.api.types.is_integer_dtype(s):
+                df[column] = pd.to_numeric(s, downcast='integer')
+            elif pd.api.types.is_float_dtype(s):
+                df[column] = s.astype('float32') if column in self.float32_columns else s
+            elif (pd.api.types.is_string_dtype(s) or s.dtype == object) and len(s) \
+                    and s.nunique() <= AUTO_CATEGORY_RATIO * len(s):
+                df[column] = s.astype('category')
+            else:
+                df[column] = s
+        after = frame_memory(df)
+        self.bytes_before += before
+        self.bytes_after += after
+        return df
+
+    def read(self, query: str, conn: Optional[sqlite3.Connection] = None, table: Optional[str] = None,
+             chunksize: Optional[int] = None, params=None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """SQL 결과를 최적화된 dtype으로 로드 (chunksize를 주면 청크 이터레이터)"""
+        own = conn is None
+        conn = conn or sqlite3.connect(self.db_path)
+        if table:
+            self.category_dtypes(conn, table)
+        if chunksize:
+            return self._iter_chunks(query, conn, chunksize, own, params)
+        try:
+            df = self.optimize(pd.read_sql_query(query, conn, params=params), conn)
+        finally:
+            if own:
+                conn.close()
+        if self.verbose:
+            self.report()
+        return df
+
+    def _iter_chunks(self, query: str, conn: sqlite3.Connection, chunksize: int, own: bool, params=None):
+        try:
+            for chunk in pd.read_sql_query(query, conn, chunksize=chunksize, params=params):
+                yield self.optimize(chunk, conn)
+        finally:
+            if own:
+                conn.close()
+        if self.verbose:
+            self.report()
+
+    def report(self) -> Dict[str, float]:
+        """누적 메모리 절감량 출력 및 반환"""
+        ratio = self.bytes_before / self.bytes_after if self.bytes_after else 1.0
+        stats = {
+            'before_mb': self.bytes_before / 1e6,
+            'after_mb': self.bytes_after / 1e6,
+            'ratio': ratio,
+        }
+        if self.verbose:
+            print(f"메모리 최적화: {stats['before_mb']:.1f}MB → {stats['after_mb']:.1f}MB ({ratio:.1f}배 절감)")
+        return stats
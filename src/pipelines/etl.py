@@ -1,31 +1,192 @@
 """
 Layered ETL pipeline (Python + SQL)
-- Bronze/Staging: seed from existing netflix_content if present (or future API collection)
+- Bronze/Staging: seed from existing netflix_content if present, or rebuild offline
+  from the raw TMDB payloads in bronze_tmdb_raw
+- Data quality: declarative rules gate staging, failing rows go to stg_tmdb_all_quarantine
 - Silver: normalized dims, facts, bridges
+- History: append-only metric snapshots (fact_title_metrics_history)
+- Rank tables: precomputed overall/per-type/per-year score ranks and ROI ranks with
+  covering indexes, so top-N reads are index range scans instead of full sorts
 - Gold: reporting views
-- Export: CSVs for Power BI
+- Export: CSV, gzip CSV or Parquet for Power BI, optionally split per release_year
+- Run log: per-step timings, row counts and gold view query plans (etl_run_log)
+
+Usage:
+    python src/pipelines/etl.py [run] [--format csv|csv.gz|parquet] [--partition-by-year]
+                                      [--source netflix_content|bronze]
+    python src/pipelines/etl.py compare [--run RUN_ID] [--baseline 5] [--threshold 1.5]
 """
 
+import io
 import os
+import sys
+import glob
+import json
+import time
 import sqlite3
+import argparse
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipelines.quality import run_quality_gate, DEFAULT_FAILURE_BUDGET
+from data_collection.raw_payload_store import RawPayloadStore, payload_to_stage_row
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'database', 'netflix_analysis.db')
 REPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'reports')
 PBI_DIR = os.path.join(REPORTS_DIR, 'powerbi')
 
+EXPORT_FORMATS = ('csv', 'csv.gz', 'parquet')
+STAGING_SOURCES = ('netflix_content', 'bronze')
+
+GOLD_VIEWS = ['vw_kpi_overview','vw_yearly_stats','vw_genre_stats','vw_language_stats','vw_top_titles','vw_movie_finance',
+              'vw_country_stats','vw_company_stats','vw_spoken_language_stats','vw_segment_top_content']
+# (staging column, dim table, bridge table, key column) for comma-joined attributes
+SILVER_BRIDGES = [
+    ('genre', 'dim_genre', 'bridge_title_genre', 'genre'),
+    ('production_countries', 'dim_country', 'bridge_title_country', 'country'),
+    ('production_companies', 'dim_company', 'bridge_title_company', 'company'),
+    ('spoken_languages', 'dim_language', 'bridge_title_language', 'language'),
+]
+
+# Row-per-title views that grow with the catalog and are split per release_year on request
+PARTITION_VIEWS = ['vw_top_titles']
+
+# Precomputed rank tables behind vw_top_titles / vw_movie_finance
+RANK_TABLES = ['gold_title_rank', 'gold_movie_roi']
+TITLE_RANK_COLUMNS = 'title, type, tmdb_score, popularity, vote_count, release_year'
+
+# step -> (tables read, tables written); used for the run log row counts
+STEP_TABLES = {
+    'stage_from_existing': (['netflix_content'], ['stg_tmdb_all', 'stg_tmdb_all_quarantine', 'dq_results']),
+    'build_silver': (['stg_tmdb_all'], ['dim_title','fact_title_metrics'] + [t for b in SILVER_BRIDGES for t in b[1:3]]),
+    'snapshot_metrics': (['fact_title_metrics'], ['fact_title_metrics_history']),
+    'build_rank_tables': (['dim_title', 'fact_title_metrics'], RANK_TABLES),
+    'build_gold_views': ([], []),
+    'export_gold_to_csv': (GOLD_VIEWS, []),
+}
+
+
+def _encode_frame(df: pd.DataFrame, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == 'parquet':
+        df.to_parquet(buf, index=False)
+    elif fmt == 'csv.gz':
+        # mtime=0 keeps the gzip header stable so unchanged data gives identical bytes
+        df.to_csv(buf, index=False, compression={'method': 'gzip', 'mtime': 0})
+    else:
+        df.to_csv(buf, index=False)
+    return buf.getvalue()
+
+
+def _write_if_changed(path: str, payload: bytes) -> bool:
+    """Write payload unless the file already holds the same bytes (keeps mtime for incremental refresh)."""
+    if os.path.exists(path) and os.path.getsize(path) == len(payload):
+        with open(path, 'rb') as f:
+            if f.read() == payload:
+                return False
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+    return True
+
 
 class ETLPipeline:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, export_format: str = 'csv',
+                 partition_by_year: bool = False, quality_rules: list = None,
+                 failure_budget: float = DEFAULT_FAILURE_BUDGET,
+                 staging_source: str = 'netflix_content'):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"export_format must be one of {EXPORT_FORMATS}, got {export_format!r}")
+        if staging_source not in STAGING_SOURCES:
+            raise ValueError(f"staging_source must be one of {STAGING_SOURCES}, got {staging_source!r}")
+        self.staging_source = staging_source
         self.db_path = db_path
+        self.export_format = export_format
+        self.partition_by_year = partition_by_year
+        self.quality_rules = quality_rules
+        self.failure_budget = failure_budget
+        self.quality_results = []
+        self.run_id = None
+        # Rows inserted or updated by the running step (DELETEs that clear a table before reload
+        # are not counted); each step adds to it and _run_step logs it as rows_written
+        self._rows_written = 0
         os.makedirs(PBI_DIR, exist_ok=True)
 
     def _connect(self):
         return sqlite3.connect(self.db_path)
 
+    def _db_size(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.db_path, self.db_path + '-wal') if os.path.exists(p))
+
+    def _count_rows(self, tables) -> int:
+        total = 0
+        with sqlite3.connect(self.db_path) as conn:
+            for t in tables:
+                try:
+                    total += conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                except sqlite3.OperationalError:
+                    pass
+        return total
+
+    def _gold_query_plans(self) -> dict:
+        plans = {}
+        with sqlite3.connect(self.db_path) as conn:
+            for v in GOLD_VIEWS:
+                try:
+                    rows = conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {v}").fetchall()
+                except sqlite3.OperationalError:
+                    continue
+                plans[v] = [detail for _, _, _, detail in rows]
+        return plans
+
+    def _run_step(self, name: str):
+        """Run one pipeline step and append its measurements to etl_run_log."""
+        tables_read, tables_written = STEP_TABLES.get(name, ([], []))
+        if name == 'stage_from_existing' and self.staging_source == 'bronze':
+            tables_read = ['bronze_tmdb_raw']
+        rows_read = self._count_rows(tables_read)
+        size_before = self._db_size()
+        self._rows_written = 0
+        started_at = datetime.utcnow().isoformat()
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            getattr(self, name)()
+        finally:
+            wall_ms = (time.perf_counter() - wall0) * 1000
+            cpu_ms = (time.process_time() - cpu0) * 1000
+            rows_written = self._rows_written
+        size_delta = self._db_size() - size_before
+        plan = json.dumps(self._gold_query_plans()) if name == 'build_gold_views' else None
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS etl_run_log (
+                run_id TEXT NOT NULL,
+                step TEXT NOT NULL,
+                started_at TEXT,
+                wall_ms REAL,
+                cpu_ms REAL,
+                rows_read INTEGER,
+                rows_written INTEGER,
+                db_size_delta INTEGER,
+                query_plan TEXT,
+                PRIMARY KEY (run_id, step)
+            )
+            """)
+            conn.execute(
+                "INSERT OR REPLACE INTO etl_run_log VALUES (?,?,?,?,?,?,?,?,?)",
+                (self.run_id, name, started_at, round(wall_ms, 3), round(cpu_ms, 3),
+                 rows_read, rows_written, size_delta, plan),
+            )
+
     def stage_from_existing(self):
-        """Create staging tables from existing netflix_content if available."""
+        """Create staging tables from netflix_content, or from bronze_tmdb_raw when
+        staging_source='bronze' (no API calls needed).
+
+        Rows are checked by the data-quality gate first; only passing rows are staged.
+        """
         with self._connect() as conn:
             cur = conn.cursor()
             # Create staging tables
@@ -45,25 +206,55 @@ class ETLPipeline:
                 budget INTEGER,
                 revenue INTEGER,
                 production_countries TEXT,
-                collected_at TEXT
+                collected_at TEXT,
+                production_companies TEXT,
+                spoken_languages TEXT
             )
             """)
-
-            # Seed from netflix_content if it exists
-            try:
-                df = pd.read_sql_query("SELECT * FROM netflix_content", conn)
-            except Exception:
-                df = pd.DataFrame()
-
-            if not df.empty:
-                df_stage = df[[
-                    'tmdb_id','title','type','release_year','tmdb_score','popularity','vote_count',
-                    'original_language','adult','genre','runtime','budget','revenue','production_countries'
-                ]].copy()
-                df_stage['collected_at'] = datetime.utcnow().isoformat()
+            # Older databases were staged before these columns existed
+            staged = {r[1] for r in cur.execute("PRAGMA table_info(stg_tmdb_all)")}
+            for col in ('production_companies', 'spoken_languages'):
+                if col not in staged:
+                    cur.execute(f"ALTER TABLE stg_tmdb_all ADD COLUMN {col} TEXT")
+
+            if self.staging_source == 'bronze':
+                # Rebuild offline from the raw payloads kept by the collectors
+                df_stage = self._read_bronze(conn)
+            else:
+                # Seed from netflix_content if it exists
+                try:
+                    df = pd.read_sql_query("SELECT * FROM netflix_content", conn)
+                except Exception:
+                    df = pd.DataFrame()
+                df_stage = pd.DataFrame()
+                if not df.empty:
+                    df_stage = df.reindex(columns=[
+                        'tmdb_id','title','type','release_year','tmdb_score','popularity','vote_count',
+                        'original_language','adult','genre','runtime','budget','revenue','production_countries',
+                        'production_companies','spoken_languages'
+                    ])
+                    df_stage['collected_at'] = datetime.utcnow().isoformat()
+
+            if not df_stage.empty:
+                checked = len(df_stage)
+                df_stage, self.quality_results = run_quality_gate(
+                    df_stage, conn, 'stg_tmdb_all', self.quality_rules, self.failure_budget
+                )
                 # Clear staging to keep latest snapshot
                 cur.execute("DELETE FROM stg_tmdb_all")
                 df_stage.to_sql('stg_tmdb_all', conn, if_exists='append', index=False)
+                # Staged + quarantined rows (together every checked row) and one dq_results row per rule
+                self._rows_written += checked + len(self.quality_results)
+
+    def _read_bronze(self, conn) -> pd.DataFrame:
+        """Latest raw payload per (endpoint, id) mapped to staging rows."""
+        store = RawPayloadStore(self.db_path)
+        try:
+            rows = [payload_to_stage_row(endpoint, tmdb_id, payload, fetched_at)
+                    for endpoint, tmdb_id, fetched_at, payload in store.iter_latest(conn)]
+        except sqlite3.OperationalError:
+            rows = []
+        return pd.DataFrame(rows)
 
     def build_silver(self):
         """Create dim/fact/bridge tables and populate from staging."""
@@ -83,19 +274,21 @@ class ETLPipeline:
             )
             """)
 
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS dim_genre (
-                genre TEXT PRIMARY KEY
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS bridge_title_genre (
-                title_id INTEGER,
-                genre TEXT,
-                PRIMARY KEY (title_id, genre)
-            )
-            """)
+            # One dim + bridge per multi-valued attribute (comma-joined in staging)
+            for _, dim, bridge, key in SILVER_BRIDGES:
+                cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {dim} (
+                    {key} TEXT PRIMARY KEY
+                )
+                """)
+                cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {bridge} (
+                    title_id INTEGER,
+                    {key} TEXT,
+                    PRIMARY KEY (title_id, {key})
+                )
+                """)
+                cur.execute(f"CREATE INDEX IF NOT EXISTS ix_{bridge}_{key} ON {bridge} ({key}, title_id)")
 
             cur.execute("""
             CREATE TABLE IF NOT EXISTS fact_title_metrics (
@@ -112,44 +305,223 @@ class ETLPipeline:
 
             # Upsert into dim_title
             cur.execute("DELETE FROM dim_title")
-            cur.execute("""
+            self._rows_written += cur.execute("""
             INSERT INTO dim_title (tmdb_id, title, type, release_year, original_language, adult)
             SELECT DISTINCT tmdb_id, title, type, release_year, original_language, COALESCE(adult,0)
             FROM stg_tmdb_all
             WHERE tmdb_id IS NOT NULL
-            """)
+            """).rowcount
 
             # Build fact_title_metrics
             cur.execute("DELETE FROM fact_title_metrics")
-            cur.execute("""
+            self._rows_written += cur.execute("""
             INSERT INTO fact_title_metrics (title_id, tmdb_score, popularity, vote_count, runtime, budget, revenue, release_year)
             SELECT d.title_id, s.tmdb_score, s.popularity, s.vote_count, COALESCE(s.runtime,0), COALESCE(s.budget,0), COALESCE(s.revenue,0), s.release_year
             FROM stg_tmdb_all s
             JOIN dim_title d ON d.tmdb_id = s.tmdb_id
+            """).rowcount
+
+            # Populate dims and bridges via vectorized split
+            for source, dim, bridge, key in SILVER_BRIDGES:
+                self._populate_bridge(conn, source, dim, bridge, key)
+
+    def _populate_bridge(self, conn, source: str, dim: str, bridge: str, key: str):
+        conn.execute(f"DELETE FROM {dim}")
+        conn.execute(f"DELETE FROM {bridge}")
+        df = pd.read_sql_query(f"""
+            SELECT d.title_id, s.{source} AS value
+            FROM stg_tmdb_all s JOIN dim_title d ON d.tmdb_id=s.tmdb_id
+        """, conn)
+        if df.empty:
+            return
+        parts = df.assign(value=df['value'].fillna('').astype(str).str.split(',')).explode('value')
+        parts[key] = parts['value'].str.strip()
+        parts = parts.loc[parts[key] != '', ['title_id', key]].drop_duplicates()
+        if parts.empty:
+            return
+        values = pd.DataFrame({key: sorted(parts[key].unique())})
+        values.to_sql(dim, conn, if_exists='append', index=False)
+        parts.to_sql(bridge, conn, if_exists='append', index=False)
+        self._rows_written += len(values) + len(parts)
+
+    def snapshot_metrics(self, snapshot_date: date = None) -> int:
+        """Record one metric snapshot row per title and day for every title whose metrics changed.
+
+        Rows are keyed by (snapshot_day, tmdb_id) (title_id is regenerated on every silver build)
+        and clustered by snapshot_day, so each day is one contiguous range of the
+        table. Values are stored as scaled integers: snapshot_day as YYYYMMDD,
+        score x100 and popularity x1000.
+
+        Titles are compared with their latest snapshot before the day, and the day's row is
+        upserted, so re-running on the same day is idempotent. A row written earlier in the day
+        is removed when the title is back to its previous snapshot. Returns the number of rows
+        inserted or updated.
+        """
+        snapshot_date = snapshot_date or datetime.utcnow().date()
+        day = int(snapshot_date.strftime('%Y%m%d'))
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS fact_title_metrics_history (
+                snapshot_day INTEGER NOT NULL,
+                tmdb_id INTEGER NOT NULL,
+                score_x100 INTEGER,
+                popularity_x1000 INTEGER,
+                vote_count INTEGER,
+                PRIMARY KEY (snapshot_day, tmdb_id)
+            ) WITHOUT ROWID
+            """)
+            cur.execute("""
+            CREATE INDEX IF NOT EXISTS ix_metrics_history_title
+            ON fact_title_metrics_history (tmdb_id, snapshot_day)
             """)
 
-            # Populate genres and bridge via Python split
-            cur.execute("DELETE FROM dim_genre")
-            cur.execute("DELETE FROM bridge_title_genre")
-            df = pd.read_sql_query("""
-                SELECT d.title_id, s.genre
-                FROM stg_tmdb_all s JOIN dim_title d ON d.tmdb_id=s.tmdb_id
-            """, conn)
-            if not df.empty:
-                rows_bridge = []
-                genres_unique = set()
-                for _, row in df.iterrows():
-                    g = (row['genre'] or '').strip()
-                    if not g:
-                        continue
-                    parts = [p.strip() for p in g.split(',') if p and p.strip()]
-                    for part in parts:
-                        genres_unique.add(part)
-                        rows_bridge.append({'title_id': int(row['title_id']), 'genre': part})
-                if genres_unique:
-                    pd.DataFrame({'genre': sorted(genres_unique)}).to_sql('dim_genre', conn, if_exists='append', index=False)
-                if rows_bridge:
-                    pd.DataFrame(rows_bridge).to_sql('bridge_title_genre', conn, if_exists='append', index=False)
+            # Current metrics of titles that differ from their latest snapshot before this day
+            changed = """
+            SELECT c.tmdb_id, c.score_x100, c.popularity_x1000, c.vote_count
+            FROM (
+                SELECT d.tmdb_id,
+                       CAST(ROUND(f.tmdb_score*100) AS INTEGER) AS score_x100,
+                       CAST(ROUND(f.popularity*1000) AS INTEGER) AS popularity_x1000,
+                       f.vote_count
+                FROM fact_title_metrics f JOIN dim_title d ON d.title_id=f.title_id
+            ) c
+            LEFT JOIN (
+                SELECT tmdb_id, MAX(snapshot_day) AS snapshot_day
+                FROM fact_title_metrics_history
+                WHERE snapshot_day < :day
+                GROUP BY tmdb_id
+            ) l ON l.tmdb_id=c.tmdb_id
+            LEFT JOIN fact_title_metrics_history p
+                ON p.snapshot_day=l.snapshot_day AND p.tmdb_id=l.tmdb_id
+            WHERE p.tmdb_id IS NULL
+               OR p.score_x100 IS NOT c.score_x100
+               OR p.popularity_x1000 IS NOT c.popularity_x1000
+               OR p.vote_count IS NOT c.vote_count
+            """
+
+            # Rows written by an earlier run today whose title is now back to its previous snapshot
+            cur.execute(f"""
+            DELETE FROM fact_title_metrics_history
+            WHERE snapshot_day = :day AND tmdb_id NOT IN (SELECT tmdb_id FROM ({changed}))
+            """, {'day': day})
+            cur.execute(f"""
+            INSERT INTO fact_title_metrics_history
+                (snapshot_day, tmdb_id, score_x100, popularity_x1000, vote_count)
+            SELECT :day, tmdb_id, score_x100, popularity_x1000, vote_count
+            FROM ({changed})
+            WHERE true
+            ON CONFLICT (snapshot_day, tmdb_id) DO UPDATE SET
+                score_x100=excluded.score_x100,
+                popularity_x1000=excluded.popularity_x1000,
+                vote_count=excluded.vote_count
+            WHERE score_x100 IS NOT excluded.score_x100
+               OR popularity_x1000 IS NOT excluded.popularity_x1000
+               OR vote_count IS NOT excluded.vote_count
+            """, {'day': day})
+            self._rows_written += cur.rowcount
+            return cur.rowcount
+
+    def metrics_as_of(self, as_of: date) -> pd.DataFrame:
+        """Latest known metrics per title on or before the given date."""
+        day = int(as_of.strftime('%Y%m%d'))
+        with self._connect() as conn:
+            return pd.read_sql_query("""
+            SELECT h.tmdb_id, h.snapshot_day,
+                   h.score_x100/100.0 AS tmdb_score,
+                   h.popularity_x1000/1000.0 AS popularity,
+                   h.vote_count
+            FROM (
+                SELECT tmdb_id, MAX(snapshot_day) AS snapshot_day
+                FROM fact_title_metrics_history
+                WHERE snapshot_day <= ?
+                GROUP BY tmdb_id
+            ) l
+            JOIN fact_title_metrics_history h
+                ON h.snapshot_day=l.snapshot_day AND h.tmdb_id=l.tmdb_id
+            """, conn, params=(day,))
+
+    def metrics_history(self, tmdb_id: int) -> pd.DataFrame:
+        """Snapshot time series of a single title, oldest first."""
+        with self._connect() as conn:
+            return pd.read_sql_query("""
+            SELECT snapshot_day,
+                   score_x100/100.0 AS tmdb_score,
+                   popularity_x1000/1000.0 AS popularity,
+                   vote_count
+            FROM fact_title_metrics_history
+            WHERE tmdb_id = ?
+            ORDER BY snapshot_day
+            """, conn, params=(int(tmdb_id),))
+
+    def build_rank_tables(self):
+        """Materialize score and ROI ranks so top-N reads walk an index instead of sorting.
+
+        gold_title_rank ranks every title by (tmdb_score DESC, vote_count DESC) overall,
+        within its type and within its release_year; each rank has a covering index, so
+        e.g. `WHERE type='Movie' AND type_rank <= 10` is a range scan. gold_movie_roi does
+        the same for the movie ROI ranking.
+        """
+        order = "f.tmdb_score DESC, f.vote_count DESC, t.title_id"
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS gold_title_rank (
+                title_id INTEGER PRIMARY KEY,
+                title TEXT,
+                type TEXT,
+                tmdb_score REAL,
+                popularity REAL,
+                vote_count INTEGER,
+                release_year INTEGER,
+                score_rank INTEGER,
+                type_rank INTEGER,
+                year_rank INTEGER
+            )
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS gold_movie_roi (
+                title_id INTEGER PRIMARY KEY,
+                title TEXT,
+                budget INTEGER,
+                revenue INTEGER,
+                roi REAL,
+                roi_rank INTEGER
+            )
+            """)
+
+            cur.execute("DELETE FROM gold_title_rank")
+            self._rows_written += cur.execute(f"""
+            INSERT INTO gold_title_rank
+            SELECT t.title_id, t.title, t.type, f.tmdb_score, f.popularity, f.vote_count, f.release_year,
+                   ROW_NUMBER() OVER (ORDER BY {order}),
+                   ROW_NUMBER() OVER (PARTITION BY t.type ORDER BY {order}),
+                   ROW_NUMBER() OVER (PARTITION BY f.release_year ORDER BY {order})
+            FROM dim_title t JOIN fact_title_metrics f ON f.title_id=t.title_id
+            """).rowcount
+
+            cur.execute("DELETE FROM gold_movie_roi")
+            self._rows_written += cur.execute("""
+            INSERT INTO gold_movie_roi
+            SELECT title_id, title, budget, revenue, roi,
+                   ROW_NUMBER() OVER (ORDER BY roi DESC, title_id)
+            FROM (
+                SELECT t.title_id, t.title, f.budget, f.revenue, ROUND(1.0*f.revenue/f.budget,2) AS roi
+                FROM dim_title t JOIN fact_title_metrics f ON f.title_id=t.title_id
+                WHERE t.type='Movie' AND f.budget>0 AND f.revenue>0
+            )
+            """).rowcount
+
+            # Covering indexes: rank key first, then every column the views return
+            for name, key, rest in (('score', 'score_rank', 'type_rank, year_rank'),
+                                    ('type', 'type, type_rank', 'score_rank, year_rank'),
+                                    ('year', 'release_year, year_rank', 'score_rank, type_rank')):
+                cur.execute(f"""CREATE INDEX IF NOT EXISTS ix_gold_title_rank_{name}
+                ON gold_title_rank ({key}, {TITLE_RANK_COLUMNS}, {rest})""")
+            cur.execute("""CREATE INDEX IF NOT EXISTS ix_gold_title_rank_score_votes
+            ON gold_title_rank (tmdb_score DESC, vote_count DESC, title, type, popularity, release_year)""")
+            cur.execute("""CREATE INDEX IF NOT EXISTS ix_gold_movie_roi_rank
+            ON gold_movie_roi (roi_rank, title, budget, revenue, roi)""")
 
     def build_gold_views(self):
         with self._connect() as conn:
@@ -197,44 +569,178 @@ class ETLPipeline:
             GROUP BY t.original_language
             """)
 
-            # Top titles by score/popularity
+            # Top titles by score/popularity and movie finance summary (where non-zero).
+            # Both read the rank tables; ORDER BY the rank follows the covering index, so
+            # LIMIT N stops after N index entries. Recreated so older join+sort
+            # definitions are replaced.
+            cur.execute("DROP VIEW IF EXISTS vw_top_titles")
+            cur.execute(f"""
+            CREATE VIEW vw_top_titles AS
+            SELECT {TITLE_RANK_COLUMNS}, score_rank, type_rank, year_rank
+            FROM gold_title_rank
+            ORDER BY score_rank
+            """)
+
+            cur.execute("DROP VIEW IF EXISTS vw_movie_finance")
             cur.execute("""
-            CREATE VIEW IF NOT EXISTS vw_top_titles AS
-            SELECT t.title, t.type, f.tmdb_score, f.popularity, f.vote_count, f.release_year
-            FROM dim_title t JOIN fact_title_metrics f ON f.title_id=t.title_id
-            ORDER BY f.tmdb_score DESC, f.vote_count DESC
+            CREATE VIEW vw_movie_finance AS
+            SELECT title, budget, revenue, roi, roi_rank
+            FROM gold_movie_roi
+            ORDER BY roi_rank
             """)
 
-            # Movie finance summary (where non-zero)
+            # Per-segment top titles, materialized by the preference processing step
             cur.execute("""
-            CREATE VIEW IF NOT EXISTS vw_movie_finance AS
-            SELECT t.title, f.budget, f.revenue,
-                   CASE WHEN f.budget>0 THEN ROUND(1.0*f.revenue/f.budget,2) END AS roi
-            FROM dim_title t JOIN fact_title_metrics f ON f.title_id=t.title_id
-            WHERE t.type='Movie' AND f.budget>0 AND f.revenue>0
-            ORDER BY roi DESC
+            CREATE VIEW IF NOT EXISTS vw_segment_top_content AS
+            SELECT dimension, segment, rank, content_id, title, n, avg_rating, weighted_rating, segment_avg_rating
+            FROM segment_top_content
             """)
 
-    def export_gold_to_csv(self):
+            # Country / company / spoken language stats (indexed bridge joins)
+            for view, bridge, key in (('vw_country_stats', 'bridge_title_country', 'country'),
+                                      ('vw_company_stats', 'bridge_title_company', 'company'),
+                                      ('vw_spoken_language_stats', 'bridge_title_language', 'language')):
+                cur.execute(f"""
+                CREATE VIEW IF NOT EXISTS {view} AS
+                SELECT b.{key}, COUNT(*) AS n,
+                       ROUND(AVG(f.tmdb_score),2) AS avg_score,
+                       ROUND(AVG(f.popularity),2) AS avg_pop
+                FROM {bridge} b
+                JOIN fact_title_metrics f ON f.title_id=b.title_id
+                GROUP BY b.{key}
+                """)
+
+    def export_gold_to_csv(self, fmt: str = None, partition_by_year: bool = None):
+        """Export gold views as csv, csv.gz or parquet.
+
+        With partition_by_year, the row-per-title views in PARTITION_VIEWS are written
+        as <view>/release_year=<year>.<ext> files and only partitions whose bytes
+        changed are rewritten, so Power BI incremental refresh reloads just those.
+        """
+        fmt = fmt or self.export_format
+        partition_by_year = self.partition_by_year if partition_by_year is None else partition_by_year
         with self._connect() as conn:
-            views = ['vw_kpi_overview','vw_yearly_stats','vw_genre_stats','vw_language_stats','vw_top_titles','vw_movie_finance']
-            for v in views:
+            for v in GOLD_VIEWS:
                 try:
                     df = pd.read_sql_query(f"SELECT * FROM {v}", conn)
-                    out = os.path.join(PBI_DIR, f"{v}.csv")
-                    df.to_csv(out, index=False)
                 except Exception:
-                    pass
+                    continue
+                if partition_by_year and v in PARTITION_VIEWS:
+                    self._export_partitions(v, df, fmt)
+                else:
+                    _write_if_changed(os.path.join(PBI_DIR, f"{v}.{fmt}"), _encode_frame(df, fmt))
+                self._rows_written += len(df)
+
+    def _export_partitions(self, view: str, df: pd.DataFrame, fmt: str):
+        part_dir = os.path.join(PBI_DIR, view)
+        os.makedirs(part_dir, exist_ok=True)
+        years = df['release_year'].astype('Int64').astype(str).replace('<NA>', 'unknown')
+        written = set()
+        for year, part in df.groupby(years, sort=True):
+            path = os.path.join(part_dir, f"release_year={year}.{fmt}")
+            _write_if_changed(path, _encode_frame(part, fmt))
+            written.add(path)
+        # Drop partitions for years that no longer exist
+        for stale in glob.glob(os.path.join(part_dir, f"release_year=*.{fmt}")):
+            if stale not in written:
+                os.remove(stale)
 
     def run(self):
-        self.stage_from_existing()
-        self.build_silver()
-        self.build_gold_views()
-        self.export_gold_to_csv()
+        self.run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        for step in ('stage_from_existing', 'build_silver', 'snapshot_metrics',
+                     'build_rank_tables', 'build_gold_views', 'export_gold_to_csv'):
+            self._run_step(step)
+        return self.run_id
+
+    def compare_runs(self, run_id: str = None, baseline_runs: int = 5,
+                     threshold: float = 1.5, min_delta_ms: float = 10.0) -> pd.DataFrame:
+        """Compare a run (default: latest) against the median of the preceding runs.
+
+        A step is flagged when its wall time exceeds `threshold` x the baseline
+        median by more than `min_delta_ms`, or when a gold view query plan changed
+        since the most recent baseline run.
+        """
+        with self._connect() as conn:
+            log = pd.read_sql_query("SELECT * FROM etl_run_log ORDER BY run_id", conn)
+        if log.empty:
+            return pd.DataFrame()
+        run_ids = list(dict.fromkeys(log['run_id']))
+        run_id = run_id or run_ids[-1]
+        baseline_ids = [r for r in run_ids if r < run_id][-baseline_runs:]
+        current = log[log['run_id'] == run_id].set_index('step')
+        baseline = log[log['run_id'].isin(baseline_ids)]
+        base_stats = baseline.groupby('step')[['wall_ms', 'cpu_ms', 'rows_written']].median()
+
+        last_plans = {}
+        if baseline_ids:
+            last = baseline[baseline['run_id'] == baseline_ids[-1]].set_index('step')
+            last_plans = _parse_plans(last['query_plan'].get('build_gold_views'))
+
+        rows = []
+        for step, cur in current.iterrows():
+            base_wall = base_stats['wall_ms'].get(step)
+            ratio = cur['wall_ms'] / base_wall if base_wall else None
+            slower = (ratio is not None and ratio > threshold
+                      and cur['wall_ms'] - base_wall > min_delta_ms)
+            plans = _parse_plans(cur['query_plan'])
+            changed = [v for v in plans if v in last_plans and plans[v] != last_plans[v]]
+            rows.append({
+                'step': step,
+                'wall_ms': cur['wall_ms'],
+                'baseline_wall_ms': base_wall,
+                'wall_ratio': round(ratio, 2) if ratio is not None else None,
+                'cpu_ms': cur['cpu_ms'],
+                'baseline_cpu_ms': base_stats['cpu_ms'].get(step),
+                'rows_written': cur['rows_written'],
+                'baseline_rows_written': base_stats['rows_written'].get(step),
+                'db_size_delta': cur['db_size_delta'],
+                'plan_changed': ','.join(changed),
+                'regression': bool(slower or changed),
+            })
+        return pd.DataFrame(rows)
+
+
+def _parse_plans(value) -> dict:
+    return json.loads(value) if isinstance(value, str) else {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Layered ETL pipeline')
+    sub = parser.add_subparsers(dest='command')
+    parser.set_defaults(format='csv', partition_by_year=False, source='netflix_content')
+    run = sub.add_parser('run', help='run all ETL steps (default)')
+    run.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Power BI export format')
+    run.add_argument('--partition-by-year', action='store_true',
+                     help='split views with release_year into per-year files')
+    run.add_argument('--source', choices=STAGING_SOURCES, default='netflix_content',
+                     help='staging source; bronze rebuilds from stored raw payloads')
+    cmp = sub.add_parser('compare', help='compare a run against its historical baseline')
+    cmp.add_argument('--run', dest='run_id', help='run_id to check (default: latest)')
+    cmp.add_argument('--baseline', type=int, default=5, help='number of preceding runs to use as baseline')
+    cmp.add_argument('--threshold', type=float, default=1.5, help='wall time ratio that counts as a regression')
+    args = parser.parse_args(argv)
+
+    pipeline = ETLPipeline(export_format=args.format, partition_by_year=args.partition_by_year,
+                           staging_source=args.source)
+    if args.command == 'compare':
+        report = pipeline.compare_runs(args.run_id, args.baseline, args.threshold)
+        if report.empty:
+            print('No runs recorded in etl_run_log')
+            return 0
+        print(report.to_string(index=False))
+        flagged = report[report['regression']]
+        for _, row in flagged.iterrows():
+            reason = f"plan changed: {row['plan_changed']}" if row['plan_changed'] else f"{row['wall_ratio']}x slower"
+            print(f"REGRESSION {row['step']}: {reason}")
+        return 1 if not flagged.empty else 0
+
+    run_id = pipeline.run()
+    print(f"ETL run {run_id} finished")
+    return 0
 
 
 if __name__ == '__main__':
-    ETLPipeline().run()
+    sys.exit(main())
 
 
 
@@ -0,0 +1,138 @@
+"""
+Data-quality gate between staging (bronze) and silver.
+
+Rules are declarative dicts evaluated as vectorized column masks over the staging
+frame before it is written to stg_tmdb_all: one pass per rule, no per-row Python.
+Failing rows are appended to <table>_quarantine, rule outcomes to dq_results, and
+the gate raises DataQualityError when a rule exceeds its own max_ratio or the
+share of failing rows exceeds the failure budget.
+
+Rule kinds:
+- not_null:   {'column'}
+- range:      {'column', 'min'?, 'max'?}
+- unique:     {'column'}                      (first occurrence is kept)
+- references: {'column', 'ref_table', 'ref_column'}
+Optional keys: 'name', 'max_ratio' (default 1.0, i.e. quarantine only).
+"""
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+DEFAULT_RULES = [
+    {'name': 'tmdb_id_not_null', 'kind': 'not_null', 'column': 'tmdb_id', 'max_ratio': 0.0},
+    {'name': 'tmdb_id_unique', 'kind': 'unique', 'column': 'tmdb_id', 'max_ratio': 0.05},
+    {'name': 'release_year_not_null', 'kind': 'not_null', 'column': 'release_year', 'max_ratio': 0.05},
+    {'name': 'release_year_range', 'kind': 'range', 'column': 'release_year', 'min': 1870, 'max': 2100},
+    {'name': 'tmdb_score_range', 'kind': 'range', 'column': 'tmdb_score', 'min': 0, 'max': 10},
+    {'name': 'vote_count_positive', 'kind': 'range', 'column': 'vote_count', 'min': 1, 'max_ratio': 0.2},
+]
+
+DEFAULT_FAILURE_BUDGET = 0.1
+
+
+class DataQualityError(Exception):
+    """Raised when staging data exceeds a rule's max_ratio or the failure budget."""
+
+    def __init__(self, message: str, results: List[Dict]):
+        super().__init__(message)
+        self.results = results
+
+
+def _rule_name(rule: Dict) -> str:
+    return rule.get('name') or f"{rule['column']}_{rule['kind']}"
+
+
+def _violations(df: pd.DataFrame, rule: Dict, conn: sqlite3.Connection = None) -> np.ndarray:
+    """Boolean mask of rows violating the rule."""
+    s = df[rule['column']]
+    kind = rule['kind']
+    if kind == 'not_null':
+        mask = s.isna()
+    elif kind == 'range':
+        values = pd.to_numeric(s, errors='coerce')
+        mask = pd.Series(False, index=df.index)
+        if rule.get('min') is not None:
+            mask |= values < rule['min']
+        if rule.get('max') is not None:
+            mask |= values > rule['max']
+    elif kind == 'unique':
+        mask = s.notna() & s.duplicated(keep='first')
+    elif kind == 'references':
+        ref = pd.read_sql_query(
+            f"SELECT DISTINCT {rule['ref_column']} AS v FROM {rule['ref_table']}", conn
+        )['v']
+        mask = s.notna() & ~s.isin(ref)
+    else:
+        raise ValueError(f"Unknown rule kind: {kind}")
+    return mask.to_numpy(dtype=bool)
+
+
+def _append_quarantine(conn: sqlite3.Connection, quarantine: str, bad: pd.DataFrame):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (quarantine,)
+    ).fetchone()
+    if exists:
+        # Staging can gain columns over time; keep the side table compatible
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({quarantine})")}
+        for c in bad.columns:
+            if c not in cols:
+                conn.execute(f"ALTER TABLE {quarantine} ADD COLUMN {c}")
+    bad.to_sql(quarantine, conn, if_exists='append', index=False)
+
+
+def run_quality_gate(df: pd.DataFrame, conn: sqlite3.Connection = None,
+                     table: str = 'stg_tmdb_all', rules: List[Dict] = None,
+                     failure_budget: float = DEFAULT_FAILURE_BUDGET) -> Tuple[pd.DataFrame, List[Dict]]:
+    """Validate a staging frame and return (clean rows, per-rule results).
+
+    With a connection, failing rows go to <table>_quarantine and results to
+    dq_results. Nothing is quarantined when the gate fails.
+    """
+    rules = DEFAULT_RULES if rules is None else rules
+    if df.empty or not rules:
+        return df, []
+    total = len(df)
+    masks = np.column_stack([_violations(df, r, conn) for r in rules])
+    counts = masks.sum(axis=0)
+    failing = masks.any(axis=1)
+    failed = int(failing.sum())
+    run_at = datetime.utcnow().isoformat()
+
+    results = []
+    for rule, n in zip(rules, counts):
+        ratio = n / total
+        max_ratio = rule.get('max_ratio', 1.0)
+        results.append({
+            'rule': _rule_name(rule),
+            'violations': int(n),
+            'ratio': round(float(ratio), 6),
+            'max_ratio': max_ratio,
+            'passed': bool(ratio <= max_ratio),
+        })
+    broken = [r['rule'] for r in results if not r['passed']]
+    ok = not broken and failed / total <= failure_budget
+
+    if conn is not None:
+        log = pd.DataFrame(results)
+        log.insert(0, 'table_name', table)
+        log.insert(0, 'run_at', run_at)
+        log.to_sql('dq_results', conn, if_exists='append', index=False)
+        conn.commit()
+
+    if not ok:
+        raise DataQualityError(
+            f"Data-quality gate failed for {table}: rules over limit {broken}, "
+            f"{failed}/{total} rows failing (budget {failure_budget:.1%})",
+            results,
+        )
+
+    if failed and conn is not None:
+        names = np.array([_rule_name(r) for r in rules])
+        bad = df[failing].copy()
+        bad.insert(0, 'failed_rule', names[masks[failing].argmax(axis=1)])
+        bad.insert(0, 'quarantined_at', run_at)
+        _append_quarantine(conn, f"{table}_quarantine", bad)
+    return df[~failing], results